@@ -0,0 +1 @@
+"""Бенчмарки: mock-сервер GigaChat, нагрузочный прогон API и микробенчмарки ML"""
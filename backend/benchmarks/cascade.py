@@ -0,0 +1,557 @@
+"""
+Симулятор каскада и подбор порогов уверенности
+
+collect прогоняет размеченные заявки через все стадии каскада без порогов:
+сокращения, ML модель, zero-shot по названиям классов, глубокий анализ
+GigaChat и, с --questions, генерацию вопросов. Выходы стадий и их задержки дописываются в JSONL кеш,
+поэтому прерванный прогон продолжается с того же места.
+
+Выходы стадий не зависят от порогов. Поэтому tune проигрывает каскад по
+кешу для любых порогов, не вызывая GigaChat. Для каждой конфигурации он
+считает точность, число вызовов LLM на заявку и задержку ответа. Перебираются
+общие пороги и пороги по классам, и выводится Pareto-фронт. Выбранная точка
+записывается в файл порогов (CASCADE__THRESHOLDS_PATH), который агенты
+перечитывают на лету.
+
+Запуск (из каталога backend):
+    python -m benchmarks.cascade collect --labeled labeled.jsonl --cache cascade-cache.jsonl
+    python -m benchmarks.cascade tune --cache cascade-cache.jsonl --output data/thresholds.json \\
+        --report cascade-report.json [--min-accuracy 0.93 | --max-llm-calls 1.6]
+
+Заявка, ушедшая на вопросы, засчитывается по предварительному классу ответа
+/classify (top-1 ML модели). Это нижняя оценка. Если точность финальной
+стадии с ответами пользователя известна, ее задают через --question-accuracy.
+
+Zero-shot стадия проигрывается с параметрами ZERO_SHOT__* из настроек: их можно
+менять через переменные окружения, не пересобирая кеш. collect записывает
+ближайший класс, близость и отрыв даже при выключенной в настройках стадии. Ее доля и точность на
+размеченных заявках выводятся в отчете.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.core.config import ZeroShotConfig, settings
+from src.core.thresholds import CascadeThresholds, threshold_registry
+
+TEXT_COLUMNS = ("text", "текст", "описание", "заявка", "description")
+LABEL_COLUMNS = ("label", "class", "ticket_class", "класс", "категория")
+NO_CLASS = "нет классов"
+
+# Вызовы LLM по завершающей стадии: сокращения всегда; глубокий анализ;
+# вопросы и финальная классификация с ответами
+LLM_CALLS = {"ml": 1, "zero_shot": 1, "deep": 2, "questions": 4}
+GLOBAL_GRID = np.round(np.arange(0.50, 1.0001, 0.05), 2)
+CLASS_GRID = np.round(np.arange(0.30, 1.0001, 0.01), 2)
+# Цена одного вызова LLM в долях точности при подборе порогов по классам
+PENALTIES = np.geomspace(0.001, 0.5, 24)
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def load_labeled(path: Path) -> List[Tuple[str, str]]:
+    """
+    Загрузка размеченных заявок
+    
+    Args:
+        path: .jsonl (поля text и label), .csv или .xlsx (колонки текста и класса)
+    
+    Returns:
+        Список (текст, класс)
+    """
+    if path.suffix == ".jsonl":
+        lines = [line for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+        rows = [json.loads(line) for line in lines]
+        return [(row["text"], row["label"]) for row in rows if row.get("text") and row.get("label")]
+    
+    df = pd.read_excel(path) if path.suffix in (".xlsx", ".xls") else pd.read_csv(path)
+    columns = {str(column).lower(): column for column in df.columns}
+    text_column = next((columns[name] for name in TEXT_COLUMNS if name in columns), df.columns[0])
+    label_column = next((columns[name] for name in LABEL_COLUMNS if name in columns), None)
+    if label_column is None:
+        raise ValueError(f"В {path} нет колонки класса ({', '.join(LABEL_COLUMNS)})")
+    df = df.dropna(subset=[text_column, label_column])
+    return [
+        (str(text), str(label)) for text, label in zip(df[text_column], df[label_column])
+        if str(text).strip()
+    ]
+
+
+def load_cache(path: Path) -> List[Dict[str, Any]]:
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+async def collect_record(agents, text: str, label: str, questions: bool) -> Dict[str, Any]:
+    """Выходы всех стадий каскада для одной заявки"""
+    abbreviation_agent, ml_agent, zero_shot_agent, deep_agent, question_agent = agents
+    
+    started = time.perf_counter()
+    processed_text = await abbreviation_agent.process(text)
+    abbreviation_seconds = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    prediction = (await ml_agent.predict([processed_text]))[0]
+    ml_seconds = time.perf_counter() - started
+    zero_shot = await zero_shot_agent.analyze(prediction)
+    
+    # Глубокий анализ выполняется для каждой заявки: порог ML стадии подбирается потом
+    started = time.perf_counter()
+    _, deep_class, deep_confidence = await deep_agent.analyze(processed_text, candidates=prediction.top_classes)
+    deep_seconds = time.perf_counter() - started
+    
+    record = {
+        "key": text_key(text),
+        "text": text,
+        "label": label,
+        "processed_text": processed_text,
+        "abbreviation_seconds": abbreviation_seconds,
+        "ml": {
+            "ticket_class": prediction.ticket_class,
+            "confidence": prediction.confidence,
+            "top_classes": prediction.top_classes,
+            "seconds": ml_seconds
+        },
+        "zero_shot": zero_shot.to_dict(),
+        "deep": {"ticket_class": deep_class, "confidence": deep_confidence, "seconds": deep_seconds}
+    }
+    if questions:
+        started = time.perf_counter()
+        await question_agent.generate_questions(ticket_text=processed_text, ml_class=prediction.ticket_class)
+        record["questions_seconds"] = time.perf_counter() - started
+    return record
+
+
+def collect_zero_shot_agent(ml_agent):
+    """Zero-shot стадия для сбора кеша: включена независимо от ZERO_SHOT__ENABLED"""
+    from src.agents.zero_shot import ZeroShotAgent
+    
+    # Решение о приеме принимает tune по сырым выходам: с выключенной стадией
+    # в кеш попали бы только "unavailable", и tune не принял бы ни одной заявки
+    return ZeroShotAgent(ml_agent, settings.zero_shot.model_copy(update={"enabled": True}))
+
+
+async def run_collect(args: argparse.Namespace) -> int:
+    # Агенты (RuBERT, клиент GigaChat) нужны только для сбора кеша
+    from src.agents import (
+        AbbreviationConvertAgent,
+        DeepTicketAnalyzerAgent,
+        QuestionGeneratorAgent,
+        TicketAnalyzerAgent,
+    )
+    
+    cache_path = Path(args.cache)
+    done = {record["key"] for record in load_cache(cache_path)}
+    pending: Dict[str, Tuple[str, str]] = {}
+    for text, label in load_labeled(Path(args.labeled)):
+        key = text_key(text)
+        if key not in done:
+            pending.setdefault(key, (text, label))
+    if args.limit:
+        pending = dict(list(pending.items())[:args.limit])
+    print(f"В кеше {len(done)} заявок, осталось собрать {len(pending)}")
+    if not pending:
+        return 0
+    
+    ml_agent = TicketAnalyzerAgent()
+    agents = (
+        AbbreviationConvertAgent(),
+        ml_agent,
+        collect_zero_shot_agent(ml_agent),
+        DeepTicketAnalyzerAgent(),
+        QuestionGeneratorAgent()
+    )
+    semaphore = asyncio.Semaphore(args.concurrency)
+    collected, failed = 0, 0
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    with cache_path.open("a", encoding="utf-8") as output:
+        async def collect_one(text: str, label: str):
+            nonlocal collected, failed
+            async with semaphore:
+                record = await collect_record(agents, text, label, args.questions)
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            collected += 1
+            failed += record["deep"]["ticket_class"] is None
+            if collected % 50 == 0 or collected == len(pending):
+                print(f"  {collected}/{len(pending)}")
+        
+        await asyncio.gather(*(collect_one(text, label) for text, label in pending.values()))
+    
+    if failed:
+        # Сбой глубокого анализа в симуляции ведет заявку на вопросы, как и в сервисе
+        print(f"Глубокий анализ не вернул ответ для {failed} заявок; проверьте квоту и ошибки GigaChat")
+    return 0
+
+
+class CascadeCache:
+    """Выходы стадий по заявкам из кеша в виде массивов"""
+    
+    def __init__(
+        self,
+        records: List[Dict[str, Any]],
+        question_accuracy: Optional[float] = None,
+        zero_shot: Optional[ZeroShotConfig] = None
+    ):
+        self.size = len(records)
+        self.labels = np.array([record["label"] for record in records], dtype=object)
+        self.ml_classes = np.array([record["ml"]["ticket_class"] for record in records], dtype=object)
+        self.ml_confidence = np.array([record["ml"]["confidence"] or 0.0 for record in records])
+        self.deep_classes = np.array([record["deep"]["ticket_class"] for record in records], dtype=object)
+        self.deep_confidence = np.array([record["deep"]["confidence"] or 0.0 for record in records])
+        self.has_ml = np.array([bool(name) for name in self.ml_classes])
+        self.has_deep = np.array([bool(name) and name != NO_CLASS for name in self.deep_classes])
+        self.ml_correct = (self.ml_classes == self.labels).astype(float)
+        self.deep_correct = (self.deep_classes == self.labels).astype(float)
+        self.zero_shot = self._zero_shot(records, zero_shot or settings.zero_shot)
+        
+        if question_accuracy is not None:
+            self.question_correct = np.full(self.size, question_accuracy)
+        else:
+            # Предварительный класс ответа с вопросами - top-1 ML модели
+            self.question_correct = np.where(self.has_ml, self.ml_correct, self.deep_correct)
+        
+        self.base_seconds = np.array([record["abbreviation_seconds"] + record["ml"]["seconds"] for record in records])
+        self.deep_seconds = np.array([record["deep"]["seconds"] for record in records])
+        measured = [record["questions_seconds"] for record in records if "questions_seconds" in record]
+        # Без замеров генерация вопросов оценивается медианой глубокого анализа (тоже один вызов)
+        fallback = float(np.median(measured or self.deep_seconds)) if self.size else 0.0
+        self.questions_seconds = np.array([record.get("questions_seconds", fallback) for record in records])
+        
+        self.ml_groups = self._groups(self.ml_classes)
+        self.deep_groups = self._groups(self.deep_classes)
+    
+    def _zero_shot(self, records: List[Dict[str, Any]], config: ZeroShotConfig) -> np.ndarray:
+        """Примет ли zero-shot стадия заявку, если до нее дойдет (решение не зависит от порогов)"""
+        if not config.enabled:
+            return np.zeros(self.size, dtype=bool)
+        outputs = [record.get("zero_shot") or {} for record in records]
+        return np.array([
+            bool(ml_class) and output.get("ticket_class") == ml_class
+            and confidence >= config.min_probability
+            and (output.get("margin") or 0.0) >= config.min_margin
+            for output, ml_class, confidence in zip(outputs, self.ml_classes, self.ml_confidence)
+        ], dtype=bool)
+    
+    @staticmethod
+    def _groups(classes: np.ndarray) -> Dict[str, np.ndarray]:
+        groups = defaultdict(list)
+        for index, name in enumerate(classes):
+            if name:
+                groups[name].append(index)
+        return {name: np.array(indices) for name, indices in groups.items()}
+    
+    def limits(self, thresholds: CascadeThresholds) -> Tuple[np.ndarray, np.ndarray]:
+        """Пороги стадий ML и глубокого анализа для каждой заявки"""
+        ml_limits = np.full(self.size, thresholds.ml_default)
+        for name, value in thresholds.ml_classes.items():
+            if name in self.ml_groups:
+                ml_limits[self.ml_groups[name]] = value
+        deep_limits = np.full(self.size, thresholds.deep_default)
+        for name, value in thresholds.deep_classes.items():
+            if name in self.deep_groups:
+                deep_limits[self.deep_groups[name]] = value
+        return ml_limits, deep_limits
+
+
+def simulate(cache: CascadeCache, thresholds: CascadeThresholds) -> Dict[str, float]:
+    """
+    Проигрывание каскада по кешу
+    
+    Returns:
+        accuracy, llm_calls (на заявку), latency_mean/latency_p95 (секунд до
+        ответа /classify) и доли заявок по завершающим стадиям
+    """
+    ml_limits, deep_limits = cache.limits(thresholds)
+    stop_ml = cache.has_ml & (cache.ml_confidence >= ml_limits)
+    stop_zero = ~stop_ml & cache.zero_shot
+    reached_deep = ~stop_ml & ~stop_zero
+    stop_deep = reached_deep & cache.has_deep & (cache.deep_confidence >= deep_limits)
+    questions = reached_deep & ~stop_deep
+    
+    correct = np.where(
+        stop_ml | stop_zero, cache.ml_correct, np.where(stop_deep, cache.deep_correct, cache.question_correct)
+    )
+    calls = np.select(
+        [stop_ml, stop_zero, stop_deep],
+        [LLM_CALLS["ml"], LLM_CALLS["zero_shot"], LLM_CALLS["deep"]],
+        LLM_CALLS["questions"]
+    )
+    latency = cache.base_seconds + reached_deep * cache.deep_seconds + questions * cache.questions_seconds
+    return {
+        "accuracy": round(float(correct.mean()), 4),
+        "llm_calls": round(float(calls.mean()), 4),
+        "latency_mean": round(float(latency.mean()), 3),
+        "latency_p95": round(float(np.percentile(latency, 95)), 3),
+        "ml_share": round(float(stop_ml.mean()), 4),
+        "zero_shot_share": round(float(stop_zero.mean()), 4),
+        "zero_shot_precision": round(float(cache.ml_correct[stop_zero].mean()), 4) if stop_zero.any() else None,
+        "deep_share": round(float(stop_deep.mean()), 4),
+        "questions_share": round(float(questions.mean()), 4)
+    }
+
+
+def _best_threshold(confidence: np.ndarray, stop_value: np.ndarray, next_value: np.ndarray) -> float:
+    """Порог из CLASS_GRID с наибольшей суммарной ценностью заявок класса"""
+    scores = np.where(confidence[:, None] >= CLASS_GRID[None, :], stop_value[:, None], next_value[:, None]).sum(axis=0)
+    best = np.flatnonzero(scores >= scores.max() - 1e-9)
+    # Середина равноценных порогов устойчивее к новым заявкам, чем край
+    return float(CLASS_GRID[best[len(best) // 2]])
+
+
+def tune_classes(
+    cache: CascadeCache,
+    defaults: CascadeThresholds,
+    penalty: float,
+    min_support: int,
+    rounds: int = 2
+) -> CascadeThresholds:
+    """
+    Пороги по классам при цене вызова LLM penalty
+    
+    Заявка с классом c завершается на ML стадии или нет только по порогу
+    класса c, поэтому при фиксированных порогах глубокого анализа порог
+    каждого класса ML подбирается независимо, и наоборот. Несколько
+    раундов чередуют подбор порогов двух стадий. Классы, у которых меньше
+    min_support заявок, оставляют общий порог.
+    """
+    stop_ml_value = cache.ml_correct - penalty * LLM_CALLS["ml"]
+    stop_zero_value = cache.ml_correct - penalty * LLM_CALLS["zero_shot"]
+    stop_deep_value = cache.deep_correct - penalty * LLM_CALLS["deep"]
+    questions_value = cache.question_correct - penalty * LLM_CALLS["questions"]
+    thresholds = CascadeThresholds(defaults.ml_default, defaults.deep_default)
+    
+    for _ in range(rounds):
+        ml_limits, deep_limits = cache.limits(thresholds)
+        deep_value = np.where(
+            cache.has_deep & (cache.deep_confidence >= deep_limits), stop_deep_value, questions_value
+        )
+        # За ML стадией следует zero-shot: принятые ею заявки до GigaChat не доходят
+        deep_value = np.where(cache.zero_shot, stop_zero_value, deep_value)
+        for name, indices in cache.ml_groups.items():
+            if len(indices) >= min_support:
+                thresholds.ml_classes[name] = _best_threshold(
+                    cache.ml_confidence[indices], stop_ml_value[indices], deep_value[indices]
+                )
+        
+        ml_limits, _ = cache.limits(thresholds)
+        reached = ~(cache.has_ml & (cache.ml_confidence >= ml_limits)) & ~cache.zero_shot & cache.has_deep
+        for name, indices in cache.deep_groups.items():
+            indices = indices[reached[indices]]
+            if len(indices) >= min_support:
+                thresholds.deep_classes[name] = _best_threshold(
+                    cache.deep_confidence[indices], stop_deep_value[indices], questions_value[indices]
+                )
+    
+    thresholds.ml_classes = {
+        name: value for name, value in thresholds.ml_classes.items() if value != thresholds.ml_default
+    }
+    thresholds.deep_classes = {
+        name: value for name, value in thresholds.deep_classes.items() if value != thresholds.deep_default
+    }
+    return thresholds
+
+
+def candidates(cache: CascadeCache, min_support: int) -> List[Tuple[str, CascadeThresholds]]:
+    """Общие пороги по сетке и пороги по классам для разных цен вызова LLM"""
+    configs = [
+        (f"global ml={ml:.2f} deep={deep:.2f}", CascadeThresholds(float(ml), float(deep)))
+        for ml in GLOBAL_GRID for deep in GLOBAL_GRID
+    ]
+    for deep in GLOBAL_GRID:
+        for penalty in PENALTIES:
+            # Общий порог ML - лучший на сетке при той же цене вызова
+            best_ml = max(
+                GLOBAL_GRID,
+                key=lambda ml: _objective(simulate(cache, CascadeThresholds(float(ml), float(deep))), penalty)
+            )
+            defaults = CascadeThresholds(float(best_ml), float(deep))
+            configs.append((
+                f"per-class penalty={penalty:.3f} deep={deep:.2f}",
+                tune_classes(cache, defaults, penalty, min_support)
+            ))
+    return configs
+
+
+def _objective(metrics: Dict[str, float], penalty: float) -> float:
+    return metrics["accuracy"] - penalty * metrics["llm_calls"]
+
+
+def _dominates(a: Dict[str, float], b: Dict[str, float]) -> bool:
+    no_worse = (
+        a["accuracy"] >= b["accuracy"]
+        and a["llm_calls"] <= b["llm_calls"]
+        and a["latency_mean"] <= b["latency_mean"]
+    )
+    better = (
+        a["accuracy"] > b["accuracy"]
+        or a["llm_calls"] < b["llm_calls"]
+        or a["latency_mean"] < b["latency_mean"]
+    )
+    return no_worse and better
+
+
+def pareto_front(points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Недоминируемые конфигурации по точности, вызовам LLM и средней задержке"""
+    front, seen = [], set()
+    for point in points:
+        key = (point["train"]["accuracy"], point["train"]["llm_calls"], point["train"]["latency_mean"])
+        if key in seen or any(_dominates(other["train"], point["train"]) for other in points):
+            continue
+        seen.add(key)
+        front.append(point)
+    return sorted(front, key=lambda point: point["train"]["llm_calls"])
+
+
+def choose(
+    front: List[Dict[str, Any]],
+    min_accuracy: Optional[float],
+    max_llm_calls: Optional[float]
+) -> Dict[str, Any]:
+    """Точка фронта: меньше всего вызовов LLM при заданной точности или лучшая точность в бюджете вызовов"""
+    if max_llm_calls is not None:
+        fitting = [point for point in front if point["train"]["llm_calls"] <= max_llm_calls]
+        if fitting:
+            return max(fitting, key=lambda point: point["train"]["accuracy"])
+        return front[0]
+    fitting = [point for point in front if point["train"]["accuracy"] >= min_accuracy]
+    if fitting:
+        return min(fitting, key=lambda point: (point["train"]["llm_calls"], -point["train"]["accuracy"]))
+    return max(front, key=lambda point: point["train"]["accuracy"])
+
+
+def _point(name: str, thresholds: CascadeThresholds, train: CascadeCache, holdout: Optional[CascadeCache]) -> Dict:
+    return {
+        "name": name,
+        "thresholds": thresholds.to_dict(),
+        "train": simulate(train, thresholds),
+        "holdout": simulate(holdout, thresholds) if holdout else None
+    }
+
+
+def write_atomic(path: Path, data: Dict):
+    # Сервис перечитывает файл порогов на лету и не должен увидеть его недописанным
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def print_front(front: List[Dict[str, Any]], current: Dict[str, Any], chosen: Dict[str, Any]):
+    header = (
+        f"{'':2}{'LLM/заявку':>11}{'точность':>10}{'задержка':>10}{'p95':>8}"
+        f"{'ML':>7}{'0-shot':>7}{'deep':>7}{'вопр.':>7}  конфигурация"
+    )
+    print(header)
+    for point in [current] + [point for point in front if point is not current]:
+        metrics = point["train"]
+        mark = "*" if point is chosen else ("=" if point is current else "")
+        print(
+            f"{mark:2}{metrics['llm_calls']:>11.3f}{metrics['accuracy']:>10.2%}{metrics['latency_mean']:>9.2f}с"
+            f"{metrics['latency_p95']:>7.2f}с{metrics['ml_share']:>7.0%}{metrics['zero_shot_share']:>7.0%}"
+            f"{metrics['deep_share']:>7.0%}"
+            f"{metrics['questions_share']:>7.0%}  {point['name']}"
+        )
+    print("= текущие пороги, * выбранная конфигурация")
+    if current["train"]["zero_shot_precision"] is not None:
+        print(
+            f"Zero-shot при текущих порогах: {current['train']['zero_shot_share']:.1%} заявок, "
+            f"точность {current['train']['zero_shot_precision']:.2%}"
+        )
+
+
+def run_tune(args: argparse.Namespace) -> int:
+    records = load_cache(Path(args.cache))
+    if not records:
+        print(f"Кеш {args.cache} пуст: сначала выполните collect")
+        return 1
+    
+    # Каждая holdout_every-я заявка не участвует в подборе и проверяет выбранные пороги
+    if args.holdout_every > 1:
+        train_records = [record for i, record in enumerate(records) if i % args.holdout_every]
+        holdout_records = [record for i, record in enumerate(records) if not i % args.holdout_every]
+    else:
+        train_records, holdout_records = records, []
+    train = CascadeCache(train_records, args.question_accuracy)
+    holdout = CascadeCache(holdout_records, args.question_accuracy) if holdout_records else None
+    
+    current = _point("current", threshold_registry.get(), train, holdout)
+    points = [current] + [
+        _point(name, thresholds, train, holdout) for name, thresholds in candidates(train, args.min_class_support)
+    ]
+    front = pareto_front(points)
+    min_accuracy = args.min_accuracy if args.min_accuracy is not None else current["train"]["accuracy"]
+    chosen = choose(front, min_accuracy, args.max_llm_calls)
+    
+    print(f"Заявок: {len(train_records)} для подбора, {len(holdout_records)} отложено\n")
+    print_front(front, current, chosen)
+    if holdout:
+        print(
+            f"\nНа отложенных заявках: текущие пороги - точность {current['holdout']['accuracy']:.2%}, "
+            f"{current['holdout']['llm_calls']:.3f} LLM/заявку; выбранные - {chosen['holdout']['accuracy']:.2%}, "
+            f"{chosen['holdout']['llm_calls']:.3f} LLM/заявку"
+        )
+    
+    meta = {
+        "cache": str(args.cache),
+        "records": len(records),
+        "question_accuracy": args.question_accuracy,
+        "zero_shot": settings.zero_shot.model_dump(),
+        "min_class_support": args.min_class_support,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds")
+    }
+    if args.output:
+        thresholds = dict(chosen["thresholds"])
+        thresholds["tuned"] = {**meta, "name": chosen["name"], "train": chosen["train"], "holdout": chosen["holdout"]}
+        write_atomic(Path(args.output), thresholds)
+        print(f"\nПороги сохранены: {args.output}")
+    if args.report:
+        write_atomic(Path(args.report), {"meta": meta, "current": current, "chosen": chosen, "front": front})
+        print(f"Отчет сохранен: {args.report}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Симулятор каскада и подбор порогов уверенности")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    collect = commands.add_parser("collect", help="Собрать выходы стадий каскада по размеченным заявкам")
+    collect.add_argument("--labeled", required=True, help="Размеченные заявки (.jsonl, .csv, .xlsx)")
+    collect.add_argument("--cache", required=True, help="JSONL кеш выходов стадий (дописывается)")
+    collect.add_argument("--questions", action="store_true", help="Замерять и генерацию вопросов")
+    collect.add_argument("--concurrency", type=int, default=4, help="Заявок одновременно")
+    collect.add_argument("--limit", type=int, help="Собрать не больше заявок за прогон")
+    
+    tune = commands.add_parser("tune", help="Подобрать пороги по кешу")
+    tune.add_argument("--cache", required=True, help="JSONL кеш из collect")
+    tune.add_argument("--output", help="Файл порогов для CASCADE__THRESHOLDS_PATH")
+    tune.add_argument("--report", help="JSON отчет с Pareto-фронтом")
+    tune.add_argument("--min-accuracy", type=float, help="Минимальная точность (по умолчанию - точность текущих порогов)")
+    tune.add_argument("--max-llm-calls", type=float, help="Бюджет вызовов LLM на заявку вместо --min-accuracy")
+    tune.add_argument("--question-accuracy", type=float, help="Точность финальной стадии с ответами")
+    tune.add_argument("--min-class-support", type=int, default=20, help="Минимум заявок для порога класса")
+    tune.add_argument("--holdout-every", type=int, default=5, help="Каждая N-я заявка - отложенная")
+    args = parser.parse_args(argv)
+    
+    if args.command == "collect":
+        return asyncio.run(run_collect(args))
+    return run_tune(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
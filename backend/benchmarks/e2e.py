@@ -0,0 +1,314 @@
+"""
+Нагрузочный прогон /api/v1/classify
+
+Корпус заявок отправляется в работающий сервис при фиксированных уровнях
+конкурентности. По каждому уровню считаются пропускная способность,
+p50/p95/p99 общего времени и каждой стадии (из заголовка Server-Timing),
+число вызовов LLM на заявку (по статистике mock-сервера GigaChat) и память
+процесса (process_resident_memory_bytes из /metrics).
+
+Запуск (из каталога backend, сервис и mock уже подняты):
+    python -m benchmarks.e2e --concurrency 1,4,16 --requests 200 \\
+        --mock-url http://127.0.0.1:8090 --baseline benchmarks/baselines/e2e.json
+
+--save-baseline сохраняет результат как новый эталон; при --baseline
+регрессии выводятся списком, и процесс завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BENCHMARKS_DIR = Path(__file__).parent
+DEFAULT_CORPUS = BENCHMARKS_DIR / "data" / "tickets.txt"
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baselines" / "e2e.json"
+
+TOTAL_STAGE = "total"
+PERCENTILES = (50, 95, 99)
+SERVER_TIMING_RE = re.compile(r"\s*([^;,\s]+);dur=([0-9.]+)")
+RSS_RE = re.compile(r"^process_resident_memory_bytes ([0-9.e+]+)$", re.MULTILINE)
+
+
+def load_corpus(path: Path) -> List[str]:
+    """
+    Загрузка корпуса заявок
+    
+    Args:
+        path: .txt (заявка на строку) или .jsonl (поле text)
+    
+    Returns:
+        Список текстов заявок
+    """
+    lines = [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    if path.suffix == ".jsonl":
+        return [json.loads(line)["text"] for line in lines]
+    return lines
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    summary = {f"p{p}": round(percentile(values, p), 2) for p in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values), 2)
+    summary["count"] = len(values)
+    return summary
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    return {name: float(duration) for name, duration in SERVER_TIMING_RE.findall(header or "")}
+
+
+class LevelResult:
+    """Замеры одного уровня конкурентности"""
+    
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.stage_ms: Dict[str, List[float]] = defaultdict(list)
+        self.terminal_stages: Counter = Counter()
+        self.errors = 0
+        self.duration_s = 0.0
+        self.llm_calls: Dict[str, int] = {}
+        self.rss_start: Optional[float] = None
+        self.rss_peak: Optional[float] = None
+    
+    @property
+    def completed(self) -> int:
+        return len(self.stage_ms[TOTAL_STAGE])
+    
+    def to_dict(self) -> Dict[str, Any]:
+        total_llm_calls = sum(self.llm_calls.values())
+        return {
+            "concurrency": self.concurrency,
+            "completed": self.completed,
+            "errors": self.errors,
+            "duration_s": round(self.duration_s, 3),
+            "throughput_rps": round(self.completed / self.duration_s, 3) if self.duration_s else 0.0,
+            "latency_ms": {stage: summarize(values) for stage, values in sorted(self.stage_ms.items())},
+            "terminal_stages": dict(self.terminal_stages),
+            "llm_calls": self.llm_calls,
+            "llm_calls_per_ticket": round(total_llm_calls / self.completed, 3) if self.completed else None,
+            "rss_mb": {
+                "start": _mb(self.rss_start),
+                "peak": _mb(self.rss_peak),
+            },
+        }
+
+
+def _mb(value: Optional[float]) -> Optional[float]:
+    return round(value / 2 ** 20, 1) if value is not None else None
+
+
+async def read_rss(client: httpx.AsyncClient) -> Optional[float]:
+    """RSS процесса сервиса из метрик Prometheus (только Linux)"""
+    try:
+        response = await client.get("/metrics")
+        match = RSS_RE.search(response.text)
+        return float(match.group(1)) if match else None
+    except httpx.HTTPError:
+        return None
+
+
+async def mock_stats(mock_url: Optional[str], reset: bool = False) -> Dict[str, int]:
+    if not mock_url:
+        return {}
+    async with httpx.AsyncClient(base_url=mock_url) as client:
+        if reset:
+            await client.post("/stats/reset")
+            return {}
+        return (await client.get("/stats")).json()["calls"]
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    corpus: List[str],
+    concurrency: int,
+    requests: int,
+    mock_url: Optional[str]
+) -> LevelResult:
+    """Прогон requests заявок с concurrency одновременными запросами"""
+    result = LevelResult(concurrency)
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(corpus[i % len(corpus)])
+    
+    async def worker():
+        while True:
+            try:
+                text = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/v1/classify", json={"text": text})
+            except httpx.HTTPError:
+                result.errors += 1
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                result.errors += 1
+                continue
+            result.stage_ms[TOTAL_STAGE].append(elapsed_ms)
+            for stage, duration in parse_server_timing(response.headers.get("server-timing")).items():
+                result.stage_ms[stage].append(duration)
+            result.terminal_stages[response.json().get("stage")] += 1
+    
+    async def sample_rss(done: asyncio.Event):
+        while not done.is_set():
+            rss = await read_rss(client)
+            if rss is not None:
+                result.rss_peak = max(result.rss_peak or 0.0, rss)
+            try:
+                await asyncio.wait_for(done.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+    
+    await mock_stats(mock_url, reset=True)
+    result.rss_start = await read_rss(client)
+    done = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(done))
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.duration_s = time.perf_counter() - start
+    
+    done.set()
+    await sampler
+    result.llm_calls = await mock_stats(mock_url)
+    return result
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Сравнение с эталоном
+    
+    Args:
+        current: Результат прогона
+        baseline: Сохраненный эталон
+        tolerance: Допустимое относительное ухудшение (0.2 = 20%)
+    
+    Returns:
+        Список найденных регрессий
+    """
+    regressions = []
+    for level, base in baseline["levels"].items():
+        cur = current["levels"].get(level)
+        if cur is None:
+            continue
+        prefix = f"c={level}"
+        
+        if cur["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{prefix} throughput {base['throughput_rps']} -> {cur['throughput_rps']} rps")
+        
+        for stage, base_latency in base["latency_ms"].items():
+            cur_latency = cur["latency_ms"].get(stage)
+            if cur_latency is None:
+                continue
+            # Абсолютный допуск 1 мс, чтобы не ловить шум на субмиллисекундных стадиях
+            if cur_latency["p95"] > base_latency["p95"] * (1 + tolerance) + 1.0:
+                regressions.append(f"{prefix} {stage} p95 {base_latency['p95']} -> {cur_latency['p95']} мс")
+        
+        base_calls, cur_calls = base.get("llm_calls_per_ticket"), cur.get("llm_calls_per_ticket")
+        if base_calls is not None and cur_calls is not None and cur_calls > base_calls + 0.05:
+            regressions.append(f"{prefix} LLM вызовов на заявку {base_calls} -> {cur_calls}")
+        
+        base_rss, cur_rss = base["rss_mb"]["peak"], cur["rss_mb"]["peak"]
+        if base_rss and cur_rss and cur_rss > base_rss * (1 + tolerance):
+            regressions.append(f"{prefix} пиковая память {base_rss} -> {cur_rss} МБ")
+    
+    return regressions
+
+
+def print_report(report: Dict[str, Any]):
+    for level in report["levels"].values():
+        print(
+            f"\nconcurrency={level['concurrency']}: {level['completed']} ok, {level['errors']} ошибок, "
+            f"{level['throughput_rps']} rps, LLM вызовов на заявку: {level['llm_calls_per_ticket']}, "
+            f"RSS {level['rss_mb']['start']} -> {level['rss_mb']['peak']} МБ"
+        )
+        print(f"  {'стадия':<18}{'p50':>10}{'p95':>10}{'p99':>10}{'n':>7}")
+        for stage, stats in level["latency_ms"].items():
+            print(f"  {stage:<18}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['count']:>7}")
+        print(f"  завершение каскада: {level['terminal_stages']}")
+
+
+async def run(args) -> Dict[str, Any]:
+    corpus = load_corpus(Path(args.corpus))
+    levels = [int(level) for level in args.concurrency.split(",")]
+    report: Dict[str, Any] = {
+        "meta": {
+            "url": args.url,
+            "corpus": str(args.corpus),
+            "corpus_size": len(corpus),
+            "requests_per_level": args.requests,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "levels": {},
+    }
+    
+    limits = httpx.Limits(max_connections=max(levels) + 1)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        # Прогрев: загрузка моделей, токен GigaChat, первые аллокации
+        for text in corpus[:args.warmup]:
+            await client.post("/api/v1/classify", json={"text": text})
+        
+        for concurrency in levels:
+            result = await run_level(client, corpus, concurrency, args.requests, args.mock_url)
+            report["levels"][str(concurrency)] = result.to_dict()
+    
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон /api/v1/classify")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Адрес сервиса")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="Корпус заявок (.txt или .jsonl)")
+    parser.add_argument("--concurrency", default="1,4,16", help="Уровни конкурентности через запятую")
+    parser.add_argument("--requests", type=int, default=100, help="Запросов на уровень")
+    parser.add_argument("--warmup", type=int, default=5, help="Прогревочных запросов")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Таймаут запроса, секунд")
+    parser.add_argument("--mock-url", help="Адрес mock-сервера GigaChat (для подсчета вызовов LLM)")
+    parser.add_argument("--output", help="Файл для JSON отчета")
+    parser.add_argument("--baseline", help="Эталон для поиска регрессий")
+    parser.add_argument("--save-baseline", nargs="?", const=str(DEFAULT_BASELINE), help="Сохранить как эталон")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение (доля)")
+    args = parser.parse_args(argv)
+    
+    report = asyncio.run(run(args))
+    print_report(report)
+    
+    for path in filter(None, [args.output, args.save_baseline]):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nОтчет сохранен: {path}")
+    
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\nРегрессии относительно {args.baseline}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print(f"\nРегрессий относительно {args.baseline} нет")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+"""
+Микробенчмарки локального горячего пути
+
+Группы:
+    tokenization   - пакетная токенизация (_tokenize), включая длинные заявки
+    forward        - прямой проход RuBERT (_encode) по сетке batch size x длина
+    head           - логистическая регрессия и top-k (_predictions)
+    parsing        - разбор структурированных ответов GigaChat (parse_output)
+    orchestration  - накладные расходы каскада SystemControlAgent при мгновенных
+                     заглушках ML модели и GigaChat
+    type_ahead     - подсказки /classify/fast на префиксах заявок при наборе;
+                     время и p99 по отдельным запросам, цель - --type-ahead-target-ms
+
+Результат пишется в JSON (формат близок к pytest-benchmark: machine_info +
+список benchmarks со stats). Поле --backend подписывает прогон, чтобы сравнивать
+torch / квантованную модель / ONNX; --compare ищет регрессии по медиане.
+
+Запуск (из каталога backend):
+    python -m benchmarks.micro --output micro.json [--models-dir data/models] \\
+        [--groups forward,head] [--batch-sizes 1,8,32,128] [--seq-lens 32,128,256]
+    python -m benchmarks.micro --groups type_ahead --type-ahead-target-ms 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+import torch
+
+from src.agents import TicketAnalyzerAgent
+from src.agents.system_control import SystemControlAgent
+from src.agents.ticket_analyzer import MLPrediction
+from src.agents.type_ahead import TypeAheadAgent
+from src.core.config import TypeAheadConfig
+from src.core.prompts import prompt_registry
+from src.core.structured_output import ClassificationOutput, QuestionsOutput, parse_output
+from src.core.thresholds import threshold_registry
+
+from .e2e import DEFAULT_CORPUS, load_corpus
+
+GROUPS = ("tokenization", "forward", "head", "parsing", "orchestration", "type_ahead")
+MODEL_GROUPS = {"tokenization", "forward", "head", "type_ahead"}
+# Заявок корпуса, набираемых в группе type_ahead, и шаг набора (символов между запросами)
+TYPE_AHEAD_TEXTS = 20
+TYPE_AHEAD_STEP = 2
+
+DEEP_RESPONSES = {
+    "plain": '{"class": "Ремонт оргтехники", "confidence": 0.95, "reasoning": "Совпадает с описанием"}',
+    "fenced": '```json\n{"class": "Ремонт оргтехники", "confidence": 0.7, "reasoning": "Мало деталей"}\n```',
+    "prose": 'Заявка о принтере. Ответ:\n{"class": "Ремонт оргтехники", "confidence": 0.9, "reasoning": "Принтер",}\nГотово.',
+    "truncated": '{"class": "Ремонт оргтехники", "confidence": 0.9, "reasoning": "Пользователь пишет, что прин',
+    "invalid": 'Не удалось определить класс: нет классов',
+}
+QUESTION_RESPONSES = {
+    "plain": '{"questions": ["Какое устройство не работает?", "Когда возникла проблема?", "Есть ли ошибка?"]}',
+    "fenced": '```json\n{"questions": ["Какое устройство не работает?", "Когда возникла проблема?"]}\n```',
+    "prose": 'Вот вопросы: {"questions": ["Какое устройство не работает?", "Когда возникла проблема?"]} Спасибо!',
+    "invalid": '1. Какое устройство не работает?\n2. Когда возникла проблема?\n3. Есть ли ошибка?',
+}
+
+
+class BenchmarkRunner:
+    """Замеры с калибровкой числа итераций в раунде"""
+    
+    def __init__(self, rounds: int, min_time: float):
+        self.rounds = rounds
+        self.min_time = min_time
+        self.results: List[Dict[str, Any]] = []
+    
+    def bench(self, group: str, name: str, fn: Callable[[], Any], **params):
+        """Замер синхронной функции"""
+        self._record(group, name, params, self._measure(fn))
+    
+    def bench_async(self, group: str, name: str, fn: Callable[[], Awaitable[Any]], **params):
+        """Замер корутины; все итерации выполняются внутри одного event loop"""
+        async def rounds() -> List[float]:
+            await fn()
+            start = time.perf_counter()
+            await fn()
+            iterations = self._iterations(time.perf_counter() - start)
+            timings = []
+            for _ in range(self.rounds):
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    await fn()
+                timings.append((time.perf_counter() - start) / iterations)
+            return timings
+        
+        self._record(group, name, params, asyncio.run(rounds()))
+    
+    def _iterations(self, single: float) -> int:
+        return max(1, math.ceil(self.min_time / max(single, 1e-9)))
+    
+    def _measure(self, fn: Callable[[], Any]) -> List[float]:
+        fn()  # прогрев
+        start = time.perf_counter()
+        fn()
+        iterations = self._iterations(time.perf_counter() - start)
+        timings = []
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                fn()
+            timings.append((time.perf_counter() - start) / iterations)
+        return timings
+    
+    def _record(self, group: str, name: str, params: Dict[str, Any], timings: List[float]) -> Dict[str, Any]:
+        median = statistics.median(timings)
+        stats = {
+            "min": min(timings),
+            "max": max(timings),
+            "mean": statistics.fmean(timings),
+            "median": median,
+            "p99": statistics.quantiles(timings, n=100, method="inclusive")[98] if len(timings) > 1 else timings[0],
+            "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "rounds": len(timings),
+            "ops": 1 / median if median else None,
+        }
+        self.results.append({
+            "group": group,
+            "name": name,
+            "fullname": f"{group}::{name}",
+            "params": params,
+            "stats": stats,
+        })
+        print(f"{group + '::' + name:<48} median {median * 1000:10.3f} мс  min {stats['min'] * 1000:10.3f} мс")
+        return stats
+
+
+def bench_tokenization(runner: BenchmarkRunner, agent: TicketAnalyzerAgent, corpus: List[str], batch_sizes: List[int]):
+    for batch_size in batch_sizes:
+        texts = [corpus[i % len(corpus)] for i in range(batch_size)]
+        runner.bench("tokenization", f"batch{batch_size}", lambda: agent._tokenize(texts), batch_size=batch_size)
+    
+    # Длинная заявка: письмо с логом, режется на окна
+    long_text = " ".join(corpus) * 4
+    runner.bench("tokenization", "long_text", lambda: agent._tokenize([long_text]), chars=len(long_text))
+
+
+def bench_forward(
+    runner: BenchmarkRunner,
+    agent: TicketAnalyzerAgent,
+    corpus: List[str],
+    batch_sizes: List[int],
+    seq_lens: List[int]
+):
+    text = " ".join(corpus)
+    for seq_len in seq_lens:
+        for batch_size in batch_sizes:
+            inputs = agent.tokenizer(
+                [text] * batch_size,
+                return_tensors="pt",
+                truncation=True,
+                padding="max_length",
+                max_length=seq_len
+            )
+            runner.bench(
+                "forward",
+                f"batch{batch_size}-len{seq_len}",
+                lambda: agent._encode(inputs),
+                batch_size=batch_size,
+                seq_len=seq_len
+            )
+
+
+def bench_head(runner: BenchmarkRunner, agent: TicketAnalyzerAgent, batch_sizes: List[int]):
+    hidden_size = agent.classifier.coef_.shape[1]
+    rng = np.random.default_rng(0)
+    for batch_size in batch_sizes:
+        embeddings = rng.standard_normal((batch_size, hidden_size)).astype(np.float32)
+        runner.bench("head", f"batch{batch_size}", lambda: agent._predictions(embeddings), batch_size=batch_size)
+
+
+def bench_parsing(runner: BenchmarkRunner):
+    for kind, response in DEEP_RESPONSES.items():
+        runner.bench(
+            "parsing",
+            f"parse_response-{kind}",
+            lambda: parse_output(response, ClassificationOutput, "deep_analysis")
+        )
+    for kind, response in QUESTION_RESPONSES.items():
+        runner.bench(
+            "parsing",
+            f"parse_questions-{kind}",
+            lambda: parse_output(response, QuestionsOutput, "question_generation")
+        )
+
+
+class StubMLAgent:
+    """Заглушка ML агента с заданной уверенностью top-1 класса"""
+    
+    def __init__(self, confidence: float, classes: List[str], hidden_size: int = 312):
+        top_classes = [(name, confidence / (i + 1)) for i, name in enumerate(classes[:TicketAnalyzerAgent.TOP_K])]
+        self.prediction = MLPrediction(
+            ticket_class=top_classes[0][0],
+            confidence=confidence,
+            top_classes=top_classes,
+            embedding=np.zeros(hidden_size, dtype=np.float32)
+        )
+        self.should_continue = confidence < threshold_registry.get().ml(top_classes[0][0])
+        # Без версии модели классы GigaChat не попадают в обратную связь
+        self.version = None
+        self.classifier = None
+    
+    async def analyze_detailed(self, text: str, prediction: Optional[MLPrediction] = None):
+        return self.should_continue, self.prediction
+    
+    async def predict(self, texts: List[str]) -> List[MLPrediction]:
+        return [self.prediction for _ in texts]
+
+
+def bench_orchestration(runner: BenchmarkRunner, corpus: List[str]):
+    classes = prompt_registry.classification().classes or ["Ремонт оргтехники"]
+    paths = {
+        # путь каскада: (уверенность ML, ответ глубокого анализа)
+        "ml": (0.95, DEEP_RESPONSES["plain"]),
+        "deep": (0.5, DEEP_RESPONSES["plain"].replace("Ремонт оргтехники", classes[0])),
+        "questions": (0.5, DEEP_RESPONSES["invalid"]),
+    }
+    text = corpus[0]
+    
+    for path, (confidence, deep_response) in paths.items():
+        system = SystemControlAgent(ml_agent=StubMLAgent(confidence, classes))
+        responses = {"deep_llm": deep_response, "question_llm": QUESTION_RESPONSES["plain"]}
+        
+        def stub_client(agent):
+            async def generate_response(
+                system_prompt, user_prompt, temperature=0.7, max_tokens=1024, stage="llm", functions=None
+            ):
+                return responses.get(stage, text)
+            agent.gigachat_client.generate_response = generate_response
+        
+        for agent in (system.abbreviation_agent, system.deep_agent, system.question_agent):
+            stub_client(agent)
+        
+        runner.bench_async("orchestration", f"process_ticket-{path}", lambda: system.process_ticket(text))
+
+
+def bench_type_ahead(runner: BenchmarkRunner, agent: TicketAnalyzerAgent, corpus: List[str]) -> float:
+    """
+    Подсказки при наборе: запрос на каждые TYPE_AHEAD_STEP символов заявок корпуса
+    
+    keystrokes - с кешем эмбеддингов префиксов, cold - каждый запрос считает
+    RuBERT. Замеряется каждый запрос отдельно, поэтому p99 - по запросам.
+    
+    Returns:
+        Наибольший p99 (секунд)
+    """
+    texts = corpus[:TYPE_AHEAD_TEXTS]
+    requests = [text[:end] for text in texts for end in range(1, len(text) + 1, TYPE_AHEAD_STEP)]
+    variants = {
+        "keystrokes": TypeAheadConfig(),
+        "cold": TypeAheadConfig(complete_words_only=False, cache_size=0),
+    }
+    worst = 0.0
+    hits = {name: 0 for name in variants}
+    for name, config in variants.items():
+        type_ahead = TypeAheadAgent(agent, config)
+        
+        async def run() -> List[float]:
+            await type_ahead.suggest("прогрев модели перед замером")
+            type_ahead._cache.clear()
+            timings = []
+            for text in requests:
+                start = time.perf_counter()
+                result = await type_ahead.suggest(text)
+                timings.append(time.perf_counter() - start)
+                hits[name] += result.cached
+            return timings
+        
+        stats = runner._record("type_ahead", name, {"requests": len(requests)}, asyncio.run(run()))
+        print(
+            f"{'':<48} p99    {stats['p99'] * 1000:10.3f} мс  из кеша {hits[name] / len(requests):.0%}"
+        )
+        worst = max(worst, stats["p99"])
+    return worst
+
+
+def compare(results: List[Dict[str, Any]], previous: Dict[str, Any], tolerance: float) -> List[str]:
+    """Бенчмарки, у которых медиана выросла больше чем на tolerance"""
+    previous_medians = {b["fullname"]: b["stats"]["median"] for b in previous["benchmarks"]}
+    regressions = []
+    for result in results:
+        before = previous_medians.get(result["fullname"])
+        after = result["stats"]["median"]
+        if before and after > before * (1 + tolerance):
+            regressions.append(f"{result['fullname']}: {before * 1000:.3f} -> {after * 1000:.3f} мс")
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Микробенчмарки ML пути и каскада")
+    parser.add_argument("--models-dir", help="Директория с моделями (по умолчанию data/models)")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="Корпус заявок для входных данных")
+    parser.add_argument("--groups", default=",".join(GROUPS), help="Группы бенчмарков через запятую")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32, 128])
+    parser.add_argument("--seq-lens", type=_int_list, default=[32, 128, 256])
+    parser.add_argument("--rounds", type=int, default=5, help="Раундов на бенчмарк")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Минимальная длительность раунда, секунд")
+    parser.add_argument("--backend", default="torch", help="Подпись бэкенда модели в отчете")
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads")
+    parser.add_argument("--output", help="Файл для JSON отчета")
+    parser.add_argument("--compare", help="Предыдущий отчет для поиска регрессий")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Допустимый рост медианы (доля)")
+    parser.add_argument(
+        "--type-ahead-target-ms", type=float, default=20.0, help="Допустимый p99 запроса подсказки (type_ahead)"
+    )
+    args = parser.parse_args(argv)
+    
+    # Логи агентов искажают замеры и засоряют вывод
+    logging.disable(logging.CRITICAL)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    
+    groups = [group for group in args.groups.split(",") if group]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"Неизвестные группы: {', '.join(sorted(unknown))}")
+    
+    corpus = load_corpus(Path(args.corpus))
+    runner = BenchmarkRunner(rounds=args.rounds, min_time=args.min_time)
+    
+    agent = None
+    type_ahead_p99 = None
+    if MODEL_GROUPS & set(groups):
+        agent = TicketAnalyzerAgent(models_dir=Path(args.models_dir) if args.models_dir else None)
+        if not all([agent.tokenizer, agent.model, agent.classifier]):
+            print("Модели не загружены, группы tokenization/forward/head/type_ahead пропущены", file=sys.stderr)
+            groups = [group for group in groups if group not in MODEL_GROUPS]
+    
+    for group in groups:
+        if group == "tokenization":
+            bench_tokenization(runner, agent, corpus, args.batch_sizes)
+        elif group == "forward":
+            bench_forward(runner, agent, corpus, args.batch_sizes, args.seq_lens)
+        elif group == "head":
+            bench_head(runner, agent, args.batch_sizes)
+        elif group == "parsing":
+            bench_parsing(runner)
+        elif group == "orchestration":
+            bench_orchestration(runner, corpus)
+        elif group == "type_ahead":
+            type_ahead_p99 = bench_type_ahead(runner, agent, corpus)
+    
+    report = {
+        "machine_info": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+        },
+        "backend": args.backend,
+        "models_dir": str(agent.models_dir) if agent else None,
+        "datetime": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "benchmarks": runner.results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nОтчет сохранен: {args.output}")
+    
+    if type_ahead_p99 is not None and type_ahead_p99 * 1000 > args.type_ahead_target_ms:
+        print(f"\np99 подсказки {type_ahead_p99 * 1000:.3f} мс выше цели {args.type_ahead_target_ms} мс")
+        return 1
+    
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(runner.results, previous, args.tolerance)
+        if regressions:
+            print(f"\nРегрессии относительно {args.compare}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print(f"\nРегрессий относительно {args.compare} нет")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
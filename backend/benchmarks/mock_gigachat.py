@@ -0,0 +1,290 @@
+"""
+Локальный mock-сервер GigaChat API
+
+Отвечает на запросы SDK gigachat (OAuth и /chat/completions) заготовленными
+ответами по типу промпта, с настраиваемым распределением задержек и долей
+ошибок. Позволяет гонять бенчмарки и проверять изменения агентов без
+обращения к реальному API с его лимитами.
+
+Если в запросе переданы functions, ответ приходит как function_call с
+аргументами из шаблона. С --no-function-calling mock отклоняет такие запросы
+(422), и агенты переходят на текстовые ответы, как при отказе реального API.
+
+Запуск (из каталога backend):
+    python -m benchmarks.mock_gigachat --port 8090 --latency-median-ms 800 --error-rate 0.02
+
+Приложение направляется на mock через переменные окружения:
+    GIGACHAT_API_KEY=bW9jazptb2Nr
+    GIGACHAT_BASE_URL=http://127.0.0.1:8090/v1
+    GIGACHAT_AUTH_URL=http://127.0.0.1:8090/api/v2/oauth
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter
+from string import Template
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.core.prompts import ClassificationPrompt, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TYPES = ("abbreviation", "deep", "questions", "final")
+
+# Заготовленные ответы по типам промптов; $text - текст заявки,
+# $top_class - первый класс из промпта (в компактном промпте это top-1 ML модели).
+# Ответ выбирается случайно, повторы в списке задают веса.
+DEFAULT_RESPONSES: Dict[str, List[str]] = {
+    "abbreviation": ["$text"],
+    "deep": [
+        '{"class": "$top_class", "confidence": 0.95, "reasoning": "Совпадает с описанием класса"}',
+        '{"class": "$top_class", "confidence": 0.95, "reasoning": "Совпадает с описанием класса"}',
+        '```json\n{"class": "$top_class", "confidence": 0.7, "reasoning": "Недостаточно деталей"}\n```',
+        '{"class": "нет классов", "confidence": 0.0, "reasoning": "Класс не определен"}',
+    ],
+    "questions": [
+        '{"questions": ["Какое устройство или система не работает?", '
+        '"Когда возникла проблема?", "Появляется ли сообщение об ошибке?"]}',
+    ],
+    "final": [
+        '{"class": "$top_class", "confidence": 0.9, "reasoning": "Уточнено по ответам пользователя"}',
+    ],
+}
+
+
+class MockOptions:
+    """Параметры поведения mock-сервера"""
+    
+    def __init__(
+        self,
+        latency_median_ms: float = 800.0,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        responses: Optional[Dict[str, List[str]]] = None,
+        seed: Optional[int] = None,
+        stream_chunk_chars: int = 8,
+        stream_chunk_ms: float = 20.0,
+        function_calling: bool = True
+    ):
+        self.latency_median_ms = latency_median_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.responses = {**DEFAULT_RESPONSES, **(responses or {})}
+        # Потоковый ответ (stream=true): фрагменты по stream_chunk_chars символов
+        # через stream_chunk_ms; задержка latency - до первого фрагмента
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_ms = stream_chunk_ms
+        # Без function calling запросы с functions отклоняются
+        self.function_calling = function_calling
+        self.random = random.Random(seed)
+    
+    def latency(self) -> float:
+        """Задержка ответа в секундах (логнормальное распределение)"""
+        if self.latency_median_ms <= 0:
+            return 0.0
+        return self.random.lognormvariate(math.log(self.latency_median_ms), self.latency_sigma) / 1000
+
+
+def detect_prompt_type(system_prompt: str, user_prompt: str) -> str:
+    """Тип промпта по содержимому сообщений агентов"""
+    if "аббревиатур" in system_prompt.lower():
+        return "abbreviation"
+    if "уточняющие вопросы" in system_prompt:
+        return "questions"
+    if "Дополнительная информация от пользователя" in user_prompt:
+        return "final"
+    return "deep"
+
+
+def _ticket_text(user_prompt: str) -> str:
+    # «Текст заявки:\n\n<текст>» у агента аббревиатур
+    return user_prompt.split("\n\n", 1)[-1]
+
+
+def _top_class(system_prompt: str) -> str:
+    classes = ClassificationPrompt.parse(system_prompt).classes
+    return classes[0] if classes else "нет классов"
+
+
+def _function_arguments(content: str) -> Optional[Dict]:
+    """Аргументы функции из шаблона ответа (None, если шаблон не JSON объект)"""
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        arguments = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return arguments if isinstance(arguments, dict) else None
+
+
+def create_app(options: MockOptions) -> FastAPI:
+    """Приложение mock-сервера"""
+    app = FastAPI(title="GigaChat mock")
+    stats = {"calls": Counter(), "errors": Counter(), "started_at": time.time()}
+    
+    @app.post("/api/v2/oauth")
+    async def oauth():
+        expires_at = int((time.time() + 30 * 60) * 1000)
+        return {"access_token": "mock-token", "expires_at": expires_at}
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        messages = payload.get("messages", [])
+        system_prompt = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user_prompt = next((m["content"] for m in messages if m["role"] == "user"), "")
+        prompt_type = detect_prompt_type(system_prompt, user_prompt)
+        functions = payload.get("functions") or []
+        stats["calls"][prompt_type] += 1
+        
+        if functions and not options.function_calling:
+            stats["errors"][prompt_type] += 1
+            return JSONResponse(status_code=422, content={"status": 422, "message": "functions are not supported"})
+        
+        await asyncio.sleep(options.latency())
+        
+        if options.random.random() < options.error_rate:
+            stats["errors"][prompt_type] += 1
+            return JSONResponse(
+                status_code=options.error_status,
+                content={"status": options.error_status, "message": "mock error"},
+                headers={"Retry-After": "1"} if options.error_status == 429 else None
+            )
+        
+        template = options.random.choice(options.responses[prompt_type])
+        content = Template(template).safe_substitute(
+            text=_ticket_text(user_prompt),
+            top_class=_top_class(system_prompt) if "$top_class" in template else ""
+        )
+        prompt_tokens = estimate_tokens(system_prompt + user_prompt)
+        if functions:
+            prompt_tokens += estimate_tokens(json.dumps(functions, ensure_ascii=False))
+        completion_tokens = estimate_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        model = payload.get("model") or "GigaChat"
+        if payload.get("stream"):
+            return StreamingResponse(_stream_chunks(content, model, usage), media_type="text/event-stream")
+        
+        message = {"role": "assistant", "content": content}
+        finish_reason = "stop"
+        arguments = _function_arguments(content) if functions else None
+        if arguments is not None:
+            # Функция одна на запрос: агенты передают function_call с ее именем
+            message = {
+                "role": "assistant",
+                "content": "",
+                "function_call": {"name": functions[0]["name"], "arguments": arguments},
+            }
+            finish_reason = "function_call"
+        return {
+            "choices": [{
+                "message": message,
+                "index": 0,
+                "finish_reason": finish_reason,
+            }],
+            "created": int(time.time()),
+            "model": model,
+            "usage": usage,
+            "object": "chat.completion",
+        }
+    
+    async def _stream_chunks(content: str, model: str, usage: Dict[str, int]):
+        step = max(1, options.stream_chunk_chars)
+        pieces = [content[i:i + step] for i in range(0, len(content), step)] or [""]
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            chunk = {
+                "choices": [{
+                    "delta": {"role": "assistant", "content": piece},
+                    "index": 0,
+                    "finish_reason": "stop" if last else None,
+                }],
+                "created": int(time.time()),
+                "model": model,
+                "object": "chat.completion",
+            }
+            if last:
+                chunk["usage"] = usage
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            if not last:
+                await asyncio.sleep(options.stream_chunk_ms / 1000)
+        yield "data: [DONE]\n\n"
+    
+    @app.get("/stats")
+    async def get_stats():
+        """Число вызовов и ошибок по типам промптов"""
+        return {
+            "calls": dict(stats["calls"]),
+            "errors": dict(stats["errors"]),
+            "total_calls": sum(stats["calls"].values()),
+            "uptime_s": round(time.time() - stats["started_at"], 1),
+        }
+    
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats["calls"].clear()
+        stats["errors"].clear()
+        return {"status": "ok"}
+    
+    return app
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Mock-сервер GigaChat API для бенчмарков")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-median-ms", type=float, default=800.0, help="Медиана задержки ответа")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Sigma логнормального распределения")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов с ошибкой (0-1)")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP статус ошибки (500, 429, 503)")
+    parser.add_argument("--responses", help="JSON файл с ответами: {тип промпта: [шаблон, ...]}")
+    parser.add_argument("--seed", type=int, help="Seed генератора для воспроизводимости")
+    parser.add_argument("--stream-chunk-chars", type=int, default=8, help="Размер фрагмента потокового ответа")
+    parser.add_argument("--stream-chunk-ms", type=float, default=20.0, help="Пауза между фрагментами потока")
+    parser.add_argument(
+        "--no-function-calling",
+        dest="function_calling",
+        action="store_false",
+        help="Отклонять запросы с functions (агенты переходят на текстовые ответы)"
+    )
+    args = parser.parse_args(argv)
+    
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = json.load(f)
+        unknown = set(responses) - set(PROMPT_TYPES)
+        if unknown:
+            parser.error(f"Неизвестные типы промптов: {', '.join(sorted(unknown))}")
+    
+    options = MockOptions(
+        latency_median_ms=args.latency_median_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        responses=responses,
+        seed=args.seed,
+        stream_chunk_chars=args.stream_chunk_chars,
+        stream_chunk_ms=args.stream_chunk_ms,
+        function_calling=args.function_calling
+    )
+    uvicorn.run(create_app(options), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Воспроизведение трафика из журнала классификаций
+
+Записи из сегментов журнала (data/classification_log) отправляются в
+работающий сервис с исходными интервалами между заявками, ускоренными в
+--speed раз. Запрос уходит по расписанию, даже если предыдущие еще не
+ответили, поэтому нагрузка повторяет реальные всплески, а не подстраивается
+под скорость сервиса. Отставание от расписания (--max-in-flight исчерпан
+или клиент не успевает) выводится отдельно.
+
+По каждому endpoint'у считаются p50/p95/p99 общего времени и стадий из
+Server-Timing и доля заявок, получивших тот же класс, что в журнале.
+
+Запуск (из каталога backend, сервис уже поднят):
+    python -m benchmarks.replay --log-dir data/classification_log --speed 10 \\
+        --url http://127.0.0.1:8000 --output replay-report.json
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.e2e import TOTAL_STAGE, parse_server_timing, summarize
+from src.core.classification_log import read_records, segments
+
+API_PREFIX = "/api/v1/"
+DEFAULT_LOG_DIR = Path("data") / "classification_log"
+
+
+def load_records(
+    paths: List[Path],
+    endpoints: Optional[List[str]] = None,
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Записи, пригодные для воспроизведения, по времени поступления
+    
+    Args:
+        paths: Сегменты журнала
+        endpoints: Только эти endpoint'ы (по умолчанию все)
+        limit: Первые limit записей
+    
+    Returns:
+        Записи с телом запроса
+    """
+    records = [
+        record for record in read_records(paths)
+        # Без текста (store_text=false) запись не воспроизводится
+        if record.get("request") and (not endpoints or record["endpoint"] in endpoints)
+    ]
+    records.sort(key=lambda record: record["ts"])
+    return records[:limit] if limit else records
+
+
+def result_class(endpoint: str, response: httpx.Response) -> Optional[str]:
+    """Класс из ответа сервиса (для потока - из события result)"""
+    if not endpoint.endswith("stream"):
+        return response.json().get("ticket_class")
+    data = None
+    for block in response.text.split("\n\n"):
+        lines = block.split("\n")
+        if lines[0] == "event: result" and len(lines) > 1 and lines[1].startswith("data: "):
+            data = json.loads(lines[1][len("data: "):])
+    return data.get("ticket_class") if data else None
+
+
+class ReplayResult:
+    """Замеры воспроизведения"""
+    
+    def __init__(self):
+        self.stage_ms: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+        self.lag_ms: List[float] = []
+        self.errors: Counter = Counter()
+        self.same_class = 0
+        self.compared = 0
+        self.duration_s = 0.0
+        self.original_duration_s = 0.0
+    
+    @property
+    def completed(self) -> int:
+        return sum(len(stages[TOTAL_STAGE]) for stages in self.stage_ms.values())
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "completed": self.completed,
+            "errors": dict(self.errors),
+            "duration_s": round(self.duration_s, 3),
+            "original_duration_s": round(self.original_duration_s, 3),
+            "throughput_rps": round(self.completed / self.duration_s, 3) if self.duration_s else 0.0,
+            "schedule_lag_ms": summarize(self.lag_ms) if self.lag_ms else None,
+            "latency_ms": {
+                endpoint: {stage: summarize(values) for stage, values in sorted(stages.items())}
+                for endpoint, stages in sorted(self.stage_ms.items())
+            },
+            "same_class": round(self.same_class / self.compared, 4) if self.compared else None,
+        }
+
+
+async def replay(
+    client: httpx.AsyncClient,
+    records: List[Dict[str, Any]],
+    speed: float,
+    max_in_flight: int
+) -> ReplayResult:
+    """
+    Отправка записей по расписанию исходного трафика
+    
+    Args:
+        client: HTTP клиент сервиса
+        records: Записи журнала по времени поступления
+        speed: Ускорение относительно исходных интервалов (0 - без пауз)
+        max_in_flight: Предел одновременных запросов
+    """
+    result = ReplayResult()
+    first_ts = records[0]["ts"]
+    result.original_duration_s = records[-1]["ts"] - first_ts
+    semaphore = asyncio.Semaphore(max_in_flight)
+    
+    async def send(record: Dict[str, Any], due: float):
+        async with semaphore:
+            result.lag_ms.append(max(0.0, time.perf_counter() - due) * 1000)
+            endpoint = record["endpoint"]
+            headers = {"X-Priority": record.get("priority") or "interactive"}
+            if record.get("request_id"):
+                headers["X-Request-ID"] = f"replay-{record['request_id']}"[:64]
+            start = time.perf_counter()
+            try:
+                response = await client.post(API_PREFIX + endpoint, json=record["request"], headers=headers)
+                # Поток считается завершенным после последнего события
+                await response.aread()
+            except httpx.HTTPError as e:
+                result.errors[type(e).__name__] += 1
+                return
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                result.errors[str(response.status_code)] += 1
+                return
+            
+            stages = result.stage_ms[endpoint]
+            stages[TOTAL_STAGE].append(elapsed_ms)
+            for stage, duration in parse_server_timing(response.headers.get("server-timing")).items():
+                stages[stage].append(duration)
+            
+            original = (record.get("result") or {}).get("ticket_class")
+            if original is not None:
+                result.compared += 1
+                result.same_class += result_class(endpoint, response) == original
+    
+    start = time.perf_counter()
+    tasks = []
+    for record in records:
+        offset = (record["ts"] - first_ts) / speed if speed > 0 else 0.0
+        due = start + offset
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(record, due)))
+    await asyncio.gather(*tasks)
+    result.duration_s = time.perf_counter() - start
+    return result
+
+
+def print_report(report: Dict[str, Any]):
+    print(
+        f"\n{report['completed']} ok, ошибки: {report['errors'] or 'нет'}, "
+        f"{report['duration_s']} с (исходно {report['original_duration_s']} с), {report['throughput_rps']} rps"
+    )
+    if report["schedule_lag_ms"]:
+        lag = report["schedule_lag_ms"]
+        print(f"отставание от расписания: p50 {lag['p50']} мс, p99 {lag['p99']} мс")
+    for endpoint, stages in report["latency_ms"].items():
+        print(f"\n{endpoint}")
+        print(f"  {'стадия':<26}{'p50':>10}{'p95':>10}{'p99':>10}{'n':>7}")
+        for stage, stats in stages.items():
+            print(f"  {stage:<26}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['count']:>7}")
+    if report["same_class"] is not None:
+        print(f"\nтот же класс, что в журнале: {report['same_class']:.2%}")
+
+
+async def run(args) -> Dict[str, Any]:
+    paths = [Path(path) for path in args.segments] or segments(Path(args.log_dir))
+    endpoints = args.endpoints.split(",") if args.endpoints else None
+    records = load_records(paths, endpoints, args.limit)
+    if not records:
+        raise SystemExit(f"В журнале нет записей для воспроизведения ({args.log_dir})")
+    print(f"Воспроизведение {len(records)} заявок из {len(paths)} сегментов, ускорение x{args.speed}")
+    
+    limits = httpx.Limits(max_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        result = await replay(client, records, args.speed, args.max_in_flight)
+    
+    return {
+        "meta": {
+            "url": args.url,
+            "segments": [str(path) for path in paths],
+            "records": len(records),
+            "speed": args.speed,
+        },
+        **result.to_dict(),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Воспроизведение трафика из журнала классификаций")
+    parser.add_argument("segments", nargs="*", help="Сегменты журнала (по умолчанию все из --log-dir)")
+    parser.add_argument("--log-dir", default=str(DEFAULT_LOG_DIR), help="Каталог журнала классификаций")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Адрес сервиса")
+    parser.add_argument("--speed", type=float, default=1.0, help="Ускорение исходного темпа (0 - без пауз)")
+    parser.add_argument("--endpoints", help="Только эти endpoint'ы через запятую (classify,classify/stream,...)")
+    parser.add_argument("--limit", type=int, help="Воспроизвести первые N заявок")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Предел одновременных запросов")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Таймаут запроса, секунд")
+    parser.add_argument("--output", help="Файл для JSON отчета")
+    args = parser.parse_args(argv)
+    
+    report = asyncio.run(run(args))
+    print_report(report)
+    
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nОтчет сохранен: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
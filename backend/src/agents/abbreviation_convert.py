@@ -3,6 +3,8 @@ import logging
 from typing import Optional
 
 from src.core.clients.gigachat_client import GigaChatClient
+from src.core.metrics import record_error
+from src.core.prompts import prompt_registry
 
 logger = logging.getLogger(__name__)
 
@@ -13,29 +15,16 @@ class AbbreviationConvertAgent:
     Использует GigaChat для расшифровки сокращений.
     """
     
+    PROMPT_NAME = "abbreviation_convert.txt"
+    DEFAULT_PROMPT = "Расшифруй аббревиатуры в тексте заявки. Верни ТОЛЬКО исправленный текст."
+    
     def __init__(self):
         self.gigachat_client = GigaChatClient()
-        self.system_prompt = """Ты - эксперт по аббревиатурам и сокращениям в контексте университета КФУ (Казанский федеральный университет).
-
-Твоя задача:
-1. Найти все аббревиатуры и сокращения в тексте
-2. Расшифровать их в полные слова/фразы
-3. Вернуть исправленный текст
-
-Известные аббревиатуры КФУ:
-- ИТИС - Институт вычислительной математики и информационных технологий
-- ИВМиИТ - Институт вычислительной математики и информационных технологий  
-- ИЭУиФ - Институт экономики и финансов
-- ИФМиБ - Институт фундаментальной медицины и биологии
-- ПП Парус - Программный продукт Парус (система учета)
-- ИАС - Информационно-аналитическая система
-- ОС - Операционная система
-- ПО - Программное обеспечение
-- ЭЦП - Электронная цифровая подпись
-
-Если аббревиатура неизвестна или неоднозначна - оставь как есть.
-
-Верни ТОЛЬКО исправленный текст, без дополнительных комментариев."""
+    
+    @property
+    def system_prompt(self) -> str:
+        """Системный промпт из data/prompts (перечитывается при изменении файла)"""
+        return prompt_registry.text(self.PROMPT_NAME, default=self.DEFAULT_PROMPT)
     
     async def process(self, text: str) -> str:
         """
@@ -43,7 +32,7 @@ class AbbreviationConvertAgent:
         
         Args:
             text: Исходный текст заявки
-            
+        
         Returns:
             Текст с расшифрованными аббревиатурами
         """
@@ -55,18 +44,15 @@ class AbbreviationConvertAgent:
                 system_prompt=self.system_prompt,
                 user_prompt=f"Текст заявки:\n\n{text}",
                 temperature=0.3,  # Низкая температура для более точных результатов
-                max_tokens=512
+                max_tokens=512,
+                stage="abbreviation"
             )
             
-            # ВАЖНО: если GigaChat вернул ошибку - используем исходный текст!
-            if "ошибка" in processed_text.lower() or "error" in processed_text.lower():
-                logger.warning("GigaChat вернул ошибку, используем исходный текст")
-                return text
-            
             logger.info(f"Текст после обработки: {processed_text[:100]}...")
             return processed_text.strip()
-            
+        
         except Exception as e:
             logger.error(f"Ошибка при обработке аббревиатур: {e}")
+            record_error("abbreviation")
             # В случае ошибки возвращаем исходный текст
             return text
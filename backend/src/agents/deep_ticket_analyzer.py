@@ -1,46 +1,212 @@
 """Агент для глубокого анализа заявок с использованием GigaChat"""
+import asyncio
 import logging
-from pathlib import Path
-from typing import Tuple, Optional
-import json
+from typing import Dict, List, Tuple, Optional
 
 from src.core.clients.gigachat_client import GigaChatClient
+from src.core.clients.scheduler import Priority, current_priority
+from src.core.config import BulkConfig, settings
+from src.core.metrics import DEEP_PACK_SIZE, DEEP_PACKED_TICKETS, record_error
+from src.core.prompts import (
+    ClassificationPrompt,
+    ClassificationPromptBuilder,
+    PromptSelection,
+    estimate_tokens,
+    prompt_registry,
+)
+from src.core.structured_output import ClassificationOutput, PackedClassificationOutput, generate_structured
+from src.core.thresholds import threshold_registry
 
 logger = logging.getLogger(__name__)
 
 
+class PackedTicket:
+    """Заявка, ожидающая общего запроса глубокого анализа"""
+    
+    # Разметка номера и разделители в запросе (токенов)
+    OVERHEAD_TOKENS = 8
+    
+    def __init__(self, text: str, classes: Optional[List[str]], output_tokens: int):
+        # Номер в пакете, под которым GigaChat возвращает ответ
+        self.ticket_id = 0
+        self.text = text
+        # Классы компактного промпта заявки; None - нужен полный промпт
+        self.classes = classes
+        self.tokens = estimate_tokens(text) + self.OVERHEAD_TOKENS + output_tokens
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class DeepAnalysisPacker:
+    """
+    Общие запросы глубокого анализа для пакетной обработки
+    
+    Системный промпт классификации - большая часть токенов запроса. Заявки с
+    пакетным приоритетом, пришедшие на глубокий анализ почти одновременно,
+    отправляются одним запросом: промпт оплачивается один раз на пакет, а
+    GigaChat возвращает класс каждой заявки под ее номером. Системный промпт
+    пакета - компактный по объединению классов заявок или полный, если он
+    нужен хотя бы одной из них.
+    
+    Пакет отправляется, когда набрано pack_max_tickets заявок, когда
+    следующая заявка не помещается в бюджет токенов или через
+    pack_max_wait_ms после первой заявки. Заявки без ответа в общем ответе
+    (номер потерян, запись испорчена, ошибка вызова) возвращаются с None и
+    анализируются отдельным запросом в своем контексте.
+    """
+    
+    # Обертка JSON ответа пакета (токенов)
+    RESPONSE_OVERHEAD_TOKENS = 64
+    
+    def __init__(self, agent: "DeepTicketAnalyzerAgent", config: Optional[BulkConfig] = None):
+        self.agent = agent
+        self.config = config or settings.bulk
+        self._pending: List[PackedTicket] = []
+        self._prompt: Optional[ClassificationPrompt] = None
+        # Объединение классов пакета; None - полный промпт
+        self._classes: Optional[List[str]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+    
+    @property
+    def enabled(self) -> bool:
+        """Упаковка только для пакетной полосы: интерактивные заявки не ждут соседей"""
+        return self.config.packing_enabled and current_priority() == Priority.BULK
+    
+    @property
+    def budget(self) -> float:
+        """Предел оценки токенов одного запроса"""
+        budget = float(self.config.pack_max_request_tokens)
+        # Запрос больше token_burst планировщик все равно не пропустит сразу
+        if settings.llm.enabled and settings.llm.tokens_per_minute > 0:
+            budget = min(budget, settings.llm.token_burst)
+        return budget
+    
+    async def classify(
+        self,
+        text: str,
+        prompt: ClassificationPrompt,
+        selection: PromptSelection
+    ) -> Optional[ClassificationOutput]:
+        """
+        Класс заявки из общего запроса
+        
+        Args:
+            text: Текст заявки
+            prompt: Промпт классификации
+            selection: Промпт, выбранный для заявки по ее top-k классам
+        
+        Returns:
+            Ответ GigaChat для заявки или None, если ее нужно проанализировать отдельно
+        """
+        if self._prompt is not None and self._prompt is not prompt:
+            # Промпт перечитан: пакет со старой версией уходит как есть
+            self._flush()
+        ticket = PackedTicket(text, selection.classes, self.config.pack_output_tokens)
+        if self._pending and self._tokens(prompt, ticket) > self.budget:
+            self._flush()
+        if self._tokens(prompt, ticket) > self.budget:
+            # Заявка не помещается в бюджет даже одна
+            return None
+        
+        self._prompt = prompt
+        self._classes = self._merge(self._classes, ticket.classes)
+        ticket.ticket_id = len(self._pending) + 1
+        self._pending.append(ticket)
+        if len(self._pending) >= self.config.pack_max_tickets:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.config.pack_max_wait_ms / 1000, self._flush)
+        return await ticket.future
+    
+    @staticmethod
+    def _merge(classes: Optional[List[str]], extra: Optional[List[str]]) -> Optional[List[str]]:
+        if classes is None or extra is None:
+            return None
+        return classes + [name for name in extra if name not in classes]
+    
+    def _tokens(self, prompt: ClassificationPrompt, ticket: PackedTicket) -> float:
+        """Оценка токенов запроса, если добавить заявку в текущий пакет"""
+        system_prompt = prompt.render(self._merge(self._classes, ticket.classes))
+        return estimate_tokens(system_prompt) + sum(item.tokens for item in self._pending) + ticket.tokens
+    
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        tickets, self._pending = self._pending, []
+        prompt, classes = self._prompt, self._classes
+        self._prompt, self._classes = None, []
+        if not tickets:
+            return
+        if len(tickets) == 1:
+            # Соседей не нашлось: обычный запрос дешевле разметки пакета
+            if not tickets[0].future.done():
+                tickets[0].future.set_result(None)
+            return
+        
+        # Задача наследует контекст заявки, открывшей пакет (трасса, приоритет, дедлайн)
+        task = asyncio.create_task(self._send(tickets, prompt.render(classes)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _send(self, tickets: List[PackedTicket], system_prompt: str):
+        DEEP_PACK_SIZE.observe(len(tickets))
+        outputs: Dict[int, ClassificationOutput] = {}
+        try:
+            outputs = await self.agent.analyze_pack(
+                [(ticket.ticket_id, ticket.text) for ticket in tickets],
+                system_prompt,
+                len(tickets) * self.config.pack_output_tokens + self.RESPONSE_OVERHEAD_TOKENS
+            )
+        except Exception as e:
+            logger.error(f"Ошибка общего запроса глубокого анализа ({len(tickets)} заявок): {e}")
+            record_error("deep_llm_packed")
+        finally:
+            for ticket in tickets:
+                output = outputs.get(ticket.ticket_id)
+                DEEP_PACKED_TICKETS.labels(result="resolved" if output is not None else "retried").inc()
+                if not ticket.future.done():
+                    ticket.future.set_result(output)
+
+
 class DeepTicketAnalyzerAgent:
     """
     Агент для глубокого анализа заявок с использованием GigaChat.
     Используется когда ML модель не уверена в классификации.
     """
     
-    CONFIDENCE_THRESHOLD = 0.90
+    DEFAULT_PROMPT = "Ты - эксперт по классификации заявок университета КФУ."
     
     def __init__(self):
         self.gigachat_client = GigaChatClient()
-        self.system_prompt = self._load_prompt()
+        self.prompt_builder = ClassificationPromptBuilder()
+        self.packer = DeepAnalysisPacker(self)
     
-    def _load_prompt(self) -> str:
-        """Загрузка промпта из файла"""
+    @property
+    def prompt(self) -> ClassificationPrompt:
+        """Промпт классификации из общего реестра (перечитывается при изменении файла)"""
         try:
-            prompt_path = Path(__file__).parent.parent.parent / "data" / "prompts" / "prompt.txt"
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                prompt = f.read()
-            logger.info(f"Промпт загружен из {prompt_path}")
-            return prompt
-        except Exception as e:
+            return prompt_registry.classification()
+        except OSError as e:
             logger.error(f"Ошибка при загрузке промпта: {e}")
             # Возвращаем базовый промпт
-            return "Ты - эксперт по классификации заявок университета КФУ."
+            return ClassificationPrompt.parse(self.DEFAULT_PROMPT)
     
-    async def analyze(self, text: str) -> Tuple[bool, Optional[str], Optional[float]]:
+    async def analyze(
+        self,
+        text: str,
+        candidates: Optional[List[Tuple[str, float]]] = None
+    ) -> Tuple[bool, Optional[str], Optional[float]]:
         """
         Глубокий анализ заявки с использованием GigaChat
         
+        С пакетным приоритетом заявка по возможности анализируется в общем
+        запросе с другими заявками (см. DeepAnalysisPacker).
+        
         Args:
             text: Текст заявки
-            
+            candidates: Top-k классы ML модели для компактного промпта
+        
         Returns:
             Tuple[should_continue, class_name, confidence]
             - should_continue: True если нужно передать следующему агенту (генератору вопросов)
@@ -50,83 +216,101 @@ class DeepTicketAnalyzerAgent:
         try:
             logger.info(f"Глубокий анализ заявки: {text[:100]}...")
             
-            # Формируем промпт для GigaChat
-            user_prompt = f"""Проанализируй заявку и определи её класс.
-
-Текст заявки:
-{text}
-
-Верни ответ СТРОГО в формате JSON:
-{{
-    "class": "название класса из списка или 'нет классов'",
-    "confidence": 0.95,
-    "reasoning": "краткое объяснение выбора"
-}}"""
-            
-            # Отправляем запрос
-            response = await self.gigachat_client.generate_response(
-                system_prompt=self.system_prompt,
-                user_prompt=user_prompt,
-                temperature=0.2,  # Низкая температура для точности
-                max_tokens=512
-            )
-            
-            # Парсим ответ
-            result = self._parse_response(response)
+            prompt = self.prompt
+            selection = self.prompt_builder.build(prompt, candidates)
+            result = None
+            if self.packer.enabled:
+                result = await self.packer.classify(text, prompt, selection)
+            if result is None:
+                result = await self._analyze_single(text, selection)
             
-            if result:
-                class_name = result.get("class")
-                confidence = result.get("confidence", 0.0)
+            if result is not None:
+                class_name = result.ticket_class
+                confidence = result.confidence
                 
-                if class_name and class_name != "нет классов" and confidence >= self.CONFIDENCE_THRESHOLD:
+                has_class = class_name and class_name != "нет классов"
+                if has_class and confidence >= threshold_registry.get().deep(class_name):
                     return False, class_name, confidence
                 else:
                     return True, class_name, confidence
             else:
                 logger.warning("Не удалось распарсить ответ GigaChat")
                 return True, None, None
-                
+        
         except Exception as e:
             logger.error(f"Ошибка при глубоком анализе: {e}")
+            record_error("deep_llm")
             return True, None, None
     
-    def _parse_response(self, response: str) -> Optional[dict]:
+    async def _analyze_single(self, text: str, selection: PromptSelection) -> Optional[ClassificationOutput]:
+        """Отдельный запрос GigaChat для одной заявки"""
+        # Формируем промпт для GigaChat
+        user_prompt = f"""Проанализируй заявку и определи её класс.
+
+Текст заявки:
+{text}
+
+Верни ответ СТРОГО в формате JSON:
+{{
+    "class": "название класса из списка или 'нет классов'",
+    "confidence": 0.95,
+    "reasoning": "краткое объяснение выбора"
+}}"""
+
+        # Отправляем запрос
+        return await generate_structured(
+            self.gigachat_client,
+            ClassificationOutput,
+            "deep_analysis",
+            system_prompt=selection.text,
+            user_prompt=user_prompt,
+            temperature=0.2,  # Низкая температура для точности
+            max_tokens=512,
+            stage="deep_llm"
+        )
+    
+    async def analyze_pack(
+        self,
+        tickets: List[Tuple[int, str]],
+        system_prompt: str,
+        max_tokens: int
+    ) -> Dict[int, ClassificationOutput]:
         """
-        Парсинг ответа от GigaChat
+        Один запрос GigaChat для нескольких заявок
         
         Args:
-            response: Ответ от GigaChat
-            
+            tickets: Номера заявок в пакете и их тексты
+            system_prompt: Общий системный промпт
+            max_tokens: Предел токенов ответа на весь пакет
+        
         Returns:
-            Словарь с результатами или None
+            Ответы по номерам; заявок без разборчивого ответа в словаре нет
+        
+        Raises:
+            GigaChatError: ошибка вызова GigaChat
         """
-        try:
-            # Пытаемся найти JSON в ответе
-            response = response.strip()
-            
-            # Если ответ начинается с ```json, убираем маркеры
-            if response.startswith("```json"):
-                response = response[7:]
-            if response.startswith("```"):
-                response = response[3:]
-            if response.endswith("```"):
-                response = response[:-3]
-            
-            response = response.strip()
-            
-            # Парсим JSON
-            result = json.loads(response)
-            return result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка парсинга JSON: {e}")
-            logger.error(f"Ответ: {response}")
-            
-            # Пытаемся извлечь информацию вручную
-            try:
-                # Простой парсинг если JSON невалидный
-                if "нет классов" in response.lower():
-                    return {"class": "нет классов", "confidence": 0.0, "reasoning": "Класс не определен"}
-                return None
-            except:
-                return None
+        entries = "\n\n".join(f"[{ticket_id}] {text}" for ticket_id, text in tickets)
+        user_prompt = f"""Проанализируй каждую заявку отдельно и определи её класс.
+Заявки независимы, номер заявки указан в квадратных скобках.
+
+Заявки:
+{entries}
+
+Верни ответ СТРОГО в формате JSON, по одной записи на каждую заявку:
+{{
+    "results": [
+        {{"id": 1, "class": "название класса из списка или 'нет классов'", "confidence": 0.95, "reasoning": "краткое объяснение"}}
+    ]
+}}"""
+
+        output = await generate_structured(
+            self.gigachat_client,
+            PackedClassificationOutput,
+            "deep_analysis_packed",
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            temperature=0.2,
+            max_tokens=max_tokens,
+            stage="deep_llm_packed"
+        )
+        return output.by_id(ticket_id for ticket_id, _ in tickets) if output is not None else {}
@@ -0,0 +1,307 @@
+"""
+Обратная связь и дообучение логистической головы ML модели
+
+Заявки, которые каскад передал GigaChat, - это заявки, где ML модель не
+дотянула до порога уверенности. Их итоговые классы (глубокий анализ,
+финальная классификация с ответами) и исправления операторов сохраняются
+с эмбеддингами, и голова периодически дообучается в отдельном процессе.
+Новая голова заменяет текущую, только если ее точность на отложенных
+примерах не ниже, - тогда похожие заявки начинают завершаться на стадии ML.
+Уверенные ответы «нет классов» по той же выборке обучают модель тематики
+(см. RelevanceGate).
+"""
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from src.core.config import FeedbackConfig, settings
+from src.core.feedback import FeedbackSource, FeedbackStore, feedback_store
+from src.core.metrics import CLASSIFIER_HOLDOUT_SCORE, CLASSIFIER_REFITS, FEEDBACK_EXAMPLES
+from src.core.prompts.classification import OUT_OF_SCOPE_CLASS, normalize_class_name
+from src.core.thresholds import threshold_registry
+from src.utils.head_refit import refit_and_evaluate
+
+from .relevance import RelevanceGate
+from .ticket_analyzer import MLPrediction, ModelVersion, TicketAnalyzerAgent
+
+logger = logging.getLogger(__name__)
+
+
+class FeedbackTrainer:
+    """Сбор примеров обратной связи и периодическое дообучение головы"""
+    
+    def __init__(
+        self,
+        ml_agent: TicketAnalyzerAgent,
+        store: Optional[FeedbackStore] = None,
+        config: Optional[FeedbackConfig] = None,
+        relevance: Optional[RelevanceGate] = None
+    ):
+        self.ml_agent = ml_agent
+        self.store = store or feedback_store
+        self.config = config or settings.feedback
+        # Модель тематики обучается по той же выборке в том же цикле
+        self.relevance = relevance
+        self.last_report: Optional[Dict] = None
+        # Файл головы активной версии и его mtime, когда голова была применена
+        self._head_state: Tuple[Optional[Path], float] = (None, 0.0)
+        # Версия модели и момент изменения выборки при последнем дообучении
+        self._trained: Tuple[Optional[str], float] = (None, 0.0)
+        if ml_agent.version is not None:
+            head_path = self._head_path(ml_agent.version)
+            self._head_state = (head_path, self._mtime(head_path))
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+    
+    def known_class(self, ticket_class: Optional[str]) -> bool:
+        """Есть ли класс в голове ML модели (GigaChat может вернуть произвольную строку)"""
+        classifier = self.ml_agent.classifier
+        return classifier is not None and ticket_class in set(classifier.classes_)
+    
+    @staticmethod
+    def out_of_scope(ticket_class: Optional[str]) -> bool:
+        """Ответ «нет классов»: пример для модели тематики"""
+        return bool(ticket_class) and normalize_class_name(ticket_class) == OUT_OF_SCOPE_CLASS
+    
+    async def record(
+        self,
+        ml_prediction: Optional[MLPrediction],
+        ticket_class: Optional[str],
+        source: FeedbackSource,
+        confidence: Optional[float],
+        text: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Сохранение заявки, классифицированной GigaChat
+        
+        Args:
+            ml_prediction: Предсказание ML стадии по тексту заявки (с эмбеддингом)
+            ticket_class: Итоговый класс («нет классов» - пример для модели тематики)
+            source: Стадия, определившая класс
+            confidence: Уверенность GigaChat
+            text: Текст заявки
+        
+        Returns:
+            Идентификатор примера или None, если заявка в выборку не попала
+        """
+        if not self.enabled or ml_prediction is None or ml_prediction.embedding is None:
+            return None
+        if self.out_of_scope(ticket_class):
+            ticket_class = OUT_OF_SCOPE_CLASS
+        elif not self.known_class(ticket_class):
+            return None
+        if (confidence or 0.0) < self.config.min_confidence:
+            return None
+        # Предсказание из сессии не помнит версию: она почти всегда совпадает с активной
+        encoder = ml_prediction.encoder or self.ml_agent.version.encoder
+        
+        try:
+            example_id = await self.store.add(ml_prediction.embedding, ticket_class, source, encoder, confidence, text)
+        except Exception as e:
+            # Сбой записи обратной связи не должен влиять на ответ
+            logger.error(f"Ошибка сохранения обратной связи: {e}")
+            return None
+        
+        FEEDBACK_EXAMPLES.labels(source=source.value).inc()
+        self._ensure_task()
+        return example_id
+    
+    async def correct(
+        self,
+        ticket_class: str,
+        feedback_id: Optional[int] = None,
+        text: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Исправление класса оператором
+        
+        Args:
+            ticket_class: Верный класс
+            feedback_id: Идентификатор примера из ответа /classify
+            text: Текст заявки, если примера нет (например, заявка решена ML моделью)
+        
+        Returns:
+            Идентификатор примера или None, если feedback_id не найден
+        """
+        if self.out_of_scope(ticket_class):
+            ticket_class = OUT_OF_SCOPE_CLASS
+        if feedback_id is not None:
+            if not await self.store.correct(feedback_id, ticket_class):
+                return None
+            example_id = feedback_id
+        else:
+            prediction = (await self.ml_agent.predict([text]))[0]
+            example_id = await self.store.add(
+                prediction.embedding, ticket_class, FeedbackSource.CORRECTION, prediction.encoder, 1.0, text
+            )
+        
+        FEEDBACK_EXAMPLES.labels(source=FeedbackSource.CORRECTION.value).inc()
+        self._ensure_task()
+        return example_id
+    
+    async def stats(self) -> Dict:
+        return {
+            "examples": await self.store.stats() if self.enabled else {},
+            "last_refit": self.last_report,
+            "relevance": self.relevance.last_report if self.relevance is not None else None
+        }
+    
+    async def refit(self, force: bool = False) -> Dict:
+        """
+        Дообучение головы на накопленной обратной связи
+        
+        Args:
+            force: Дообучить, даже если выборка не менялась с прошлого раза
+        
+        Returns:
+            Отчет: status (promoted, rejected, skipped, running) и метрики
+            текущей и новой головы на отложенных примерах
+        """
+        if self._lock.locked():
+            return {"status": "running"}
+        
+        async with self._lock:
+            report = await self._refit(force)
+        
+        self.last_report = report
+        CLASSIFIER_REFITS.labels(result=report["status"]).inc()
+        return report
+    
+    async def _refit(self, force: bool) -> Dict:
+        if not self.enabled:
+            return {"status": "skipped", "reason": "disabled"}
+        # Голову мог заменить другой воркер
+        self._reload_promoted()
+        
+        version = self.ml_agent.version
+        if version is None or version.classifier is None:
+            return {"status": "skipped", "reason": "no_model"}
+        classifier = version.classifier
+        
+        # Эмбеддинги другой версии RuBERT несовместимы с головой этой версии
+        dataset = await self.store.dataset(version.encoder)
+        if not force and self._trained[0] == version.name and dataset.updated_at <= self._trained[1]:
+            return {"status": "skipped", "reason": "no_changes"}
+        
+        known = np.isin(dataset.labels, classifier.classes_)
+        ids, embeddings, labels = dataset.ids[known], dataset.embeddings[known], dataset.labels[known]
+        holdout = ids % self.config.holdout_every == 0
+        if len(ids) < self.config.min_examples or holdout.sum() < self.config.min_holdout:
+            return {
+                "status": "skipped",
+                "reason": "not_enough_examples",
+                "examples": int(len(ids)),
+                "holdout": int(holdout.sum())
+            }
+        
+        corrections = dataset.sources[known] == FeedbackSource.CORRECTION.value
+        weights = np.where(corrections, self.config.correction_weight, 1.0)
+        thresholds = threshold_registry.get()
+        class_thresholds = np.array([thresholds.ml(name) for name in classifier.classes_])
+        logger.info(f"Дообучение головы ML модели на {len(ids)} примерах обратной связи")
+        
+        loop = asyncio.get_running_loop()
+        # Отдельный процесс: L-BFGS не конкурирует за GIL с event loop и инференсом
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            candidate, scores = await loop.run_in_executor(
+                executor,
+                refit_and_evaluate,
+                classifier,
+                embeddings,
+                labels,
+                weights,
+                holdout,
+                self.config.regularization,
+                self.config.max_iter,
+                class_thresholds
+            )
+        finally:
+            executor.shutdown(wait=False)
+        self._trained = (version.name, dataset.updated_at)
+        
+        for head, metrics in scores.items():
+            for metric, value in metrics.items():
+                CLASSIFIER_HOLDOUT_SCORE.labels(head=head, metric=metric).set(value)
+        report = {"examples": int(len(ids)), "holdout": int(holdout.sum()), **scores}
+        
+        if scores["candidate"]["accuracy"] < scores["current"]["accuracy"]:
+            logger.warning(
+                f"Новая голова отклонена: точность {scores['candidate']['accuracy']:.2%} "
+                f"ниже текущей {scores['current']['accuracy']:.2%}"
+            )
+            return {"status": "rejected", **report}
+        
+        if not self.ml_agent.set_classifier(candidate, version=version):
+            return {"status": "skipped", "reason": "version_changed", **report}
+        await asyncio.to_thread(self._save, candidate, version)
+        logger.info(
+            f"Голова ML модели заменена: точность {scores['current']['accuracy']:.2%} -> "
+            f"{scores['candidate']['accuracy']:.2%}, решено на стадии ML "
+            f"{scores['current']['ml_resolved']:.2%} -> {scores['candidate']['ml_resolved']:.2%}"
+        )
+        return {"status": "promoted", **report}
+    
+    @staticmethod
+    def _head_path(version: ModelVersion) -> Path:
+        return version.path / TicketAnalyzerAgent.FEEDBACK_HEAD_FILE
+    
+    @staticmethod
+    def _mtime(path: Path) -> float:
+        return path.stat().st_mtime if path.exists() else 0.0
+    
+    def _save(self, classifier, version: ModelVersion):
+        # Запись через временный файл: воркеры не прочитают недописанную голову
+        head_path = self._head_path(version)
+        tmp_path = head_path.with_suffix(".tmp")
+        joblib.dump(classifier, str(tmp_path))
+        os.replace(tmp_path, head_path)
+        self._head_state = (head_path, self._mtime(head_path))
+    
+    def _reload_promoted(self):
+        version = self.ml_agent.version
+        if version is None:
+            return
+        head_path = self._head_path(version)
+        mtime = self._mtime(head_path)
+        known_path, known_mtime = self._head_state
+        if known_path != head_path:
+            # Версия сменилась: ее голова применена при загрузке версии
+            self._head_state = (head_path, mtime)
+        elif mtime > known_mtime:
+            if self.ml_agent.set_classifier(joblib.load(str(head_path)), version=version):
+                logger.info("Загружена голова ML модели, дообученная другим воркером")
+            self._head_state = (head_path, mtime)
+    
+    def _ensure_task(self):
+        # Цикл дообучения стартует в event loop'е первого запроса с обратной
+        # связью; пустой контекст - без трассы, дедлайна и приоритета запроса
+        if self.config.refit_interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._refit_loop(), context=contextvars.Context())
+    
+    async def _refit_loop(self):
+        while True:
+            await asyncio.sleep(self.config.refit_interval)
+            try:
+                await self.refit()
+            except Exception as e:
+                logger.error(f"Ошибка дообучения головы ML модели: {e}", exc_info=True)
+            if self.relevance is None:
+                continue
+            try:
+                await self.relevance.refit()
+            except Exception as e:
+                logger.error(f"Ошибка обучения модели тематики: {e}", exc_info=True)
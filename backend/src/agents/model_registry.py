@@ -0,0 +1,300 @@
+"""
+Реестр версий ML модели с заменой без перезапуска
+
+Версия - директория data/models/versions/<имя> с головой
+logistic_classifier_new_dataset.pkl и, если меняется RuBERT, своей
+rubert-tiny2-local; data/models - версия base. Новая версия загружается
+и прогревается в фоне, при желании проходит теневую проверку на доле
+живых запросов (сравнение классов и задержки с активной версией) и затем
+атомарно заменяет активную. Запросы, начавшие предсказание до замены,
+дорабатывают со старой версией; ее память освобождается, когда они
+завершатся.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Deque, Dict, List, Optional, Tuple
+
+from src.core.config import ModelRegistryConfig, settings
+from src.core.metrics import ML_MODEL_ACTIVE, ML_SHADOW_COMPARISONS, ML_SHADOW_LATENCY
+from src.core.thresholds import threshold_registry
+from src.utils.tokenizer_migration import SAMPLE_TEXTS
+
+from .ticket_analyzer import MLPrediction, ModelVersion, TicketAnalyzerAgent
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateStatus(str, Enum):
+    LOADING = "loading"
+    READY = "ready"
+    SHADOW = "shadow"
+    FAILED = "failed"
+
+
+def _quantile(values: Deque[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ShadowStats:
+    """Сравнение версии-кандидата с активной на одних и тех же запросах"""
+    
+    def __init__(self, window: int = 1000):
+        self.compared = 0
+        self.agreed = 0
+        self.dropped = 0
+        self.live_resolved = 0
+        self.candidate_resolved = 0
+        self.live_seconds: Deque[float] = deque(maxlen=window)
+        self.candidate_seconds: Deque[float] = deque(maxlen=window)
+    
+    def add(
+        self,
+        live: List[MLPrediction],
+        candidate: List[MLPrediction],
+        live_seconds: float,
+        candidate_seconds: float
+    ):
+        thresholds = threshold_registry.get()
+        for live_prediction, candidate_prediction in zip(live, candidate):
+            agreed = live_prediction.ticket_class == candidate_prediction.ticket_class
+            self.compared += 1
+            self.agreed += agreed
+            self.live_resolved += live_prediction.confidence >= thresholds.ml(live_prediction.ticket_class)
+            self.candidate_resolved += candidate_prediction.confidence >= thresholds.ml(candidate_prediction.ticket_class)
+            ML_SHADOW_COMPARISONS.labels(result="agree" if agreed else "disagree").inc()
+        self.live_seconds.append(live_seconds)
+        self.candidate_seconds.append(candidate_seconds)
+        ML_SHADOW_LATENCY.labels(model="live").observe(live_seconds)
+        ML_SHADOW_LATENCY.labels(model="candidate").observe(candidate_seconds)
+    
+    def to_dict(self) -> Dict:
+        compared = self.compared or 1
+        return {
+            "compared": self.compared,
+            "dropped": self.dropped,
+            "agreement": self.agreed / compared,
+            # Доля заявок, которые каскад завершил бы на стадии ML
+            "live_ml_resolved": self.live_resolved / compared,
+            "candidate_ml_resolved": self.candidate_resolved / compared,
+            "live_p50_seconds": _quantile(self.live_seconds, 0.5),
+            "live_p95_seconds": _quantile(self.live_seconds, 0.95),
+            "candidate_p50_seconds": _quantile(self.candidate_seconds, 0.5),
+            "candidate_p95_seconds": _quantile(self.candidate_seconds, 0.95)
+        }
+
+
+class ModelRegistry:
+    """Загрузка, теневая проверка и замена версий ML модели"""
+    
+    def __init__(self, ml_agent: TicketAnalyzerAgent, config: Optional[ModelRegistryConfig] = None):
+        self.ml_agent = ml_agent
+        self.config = config or settings.models
+        self.candidate: Optional[ModelVersion] = None
+        self.candidate_name: Optional[str] = None
+        self.status: Optional[CandidateStatus] = None
+        self.error: Optional[str] = None
+        self.warmup_seconds: Optional[float] = None
+        self.shadow_stats: Optional[ShadowStats] = None
+        self._promote_when_ready = False
+        self._task: Optional[asyncio.Task] = None
+        self._shadow_executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        # Замененные версии: weakref становится пустым, когда память освобождена
+        self._retired: List[Tuple[str, weakref.ref]] = []
+        if ml_agent.version is not None:
+            ML_MODEL_ACTIVE.labels(version=ml_agent.version.name).set(1)
+    
+    def versions(self) -> List[str]:
+        """Версии, доступные для загрузки"""
+        versions_dir = self.ml_agent.models_dir / TicketAnalyzerAgent.VERSIONS_DIR
+        names = [TicketAnalyzerAgent.BASE_VERSION]
+        if versions_dir.is_dir():
+            names += sorted(
+                path.name for path in versions_dir.iterdir()
+                if (path / TicketAnalyzerAgent.CLASSIFIER_FILE).exists()
+            )
+        return names
+    
+    def describe(self) -> Dict:
+        """Активная версия, кандидат и замененные версии"""
+        active = self.ml_agent.version
+        return {
+            "active": active.name if active else None,
+            "encoder": active.encoder if active else None,
+            "versions": self.versions(),
+            "candidate": {
+                "version": self.candidate_name,
+                "status": self.status,
+                "error": self.error,
+                "warmup_seconds": self.warmup_seconds,
+                "shadow": self.shadow_stats.to_dict() if self.shadow_stats else None
+            } if self.status else None,
+            "retired": [{"version": name, "released": ref() is None} for name, ref in self._retired]
+        }
+    
+    def load(self, name: str, shadow: bool = True, promote: bool = False) -> Dict:
+        """
+        Фоновая загрузка и прогрев версии
+        
+        Args:
+            name: Имя версии из versions()
+            shadow: Сравнивать кандидата с активной версией на живых запросах
+            promote: Заменить активную версию сразу после прогрева
+        
+        Raises:
+            KeyError: Версии нет в реестре
+            RuntimeError: Уже загружается другая версия
+        """
+        if name not in self.versions():
+            raise KeyError(name)
+        if self.status == CandidateStatus.LOADING:
+            raise RuntimeError(f"Уже загружается версия {self.candidate_name}")
+        
+        self.discard()
+        self.candidate_name = name
+        self.status = CandidateStatus.LOADING
+        self._promote_when_ready = promote
+        self._task = asyncio.create_task(self._load(name, shadow and not promote))
+        return self.describe()
+    
+    async def _load(self, name: str, shadow: bool):
+        try:
+            version = await asyncio.to_thread(self.ml_agent.load_version, name)
+            if not version.ready:
+                raise RuntimeError("не все артефакты версии загружены")
+            # Первые прогоны медленнее из-за выделения памяти и ленивой инициализации torch
+            self.warmup_seconds = await asyncio.to_thread(self._warmup, version)
+        except Exception as e:
+            logger.error(f"Не удалось загрузить версию модели {name}: {e}")
+            if asyncio.current_task() is self._task:
+                self.status, self.error = CandidateStatus.FAILED, str(e)
+            return
+        
+        if asyncio.current_task() is not self._task:
+            # Пока шла загрузка, кандидат был отменен
+            return
+        self.candidate = version
+        logger.info(f"Версия модели {name} загружена и прогрета ({self.warmup_seconds * 1000:.0f} мс на пакет)")
+        
+        if self._promote_when_ready:
+            self.promote()
+        elif shadow:
+            self.shadow_stats = ShadowStats()
+            self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+            self.status = CandidateStatus.SHADOW
+            self.ml_agent.shadow = self
+        else:
+            self.status = CandidateStatus.READY
+    
+    def _warmup(self, version: ModelVersion) -> float:
+        elapsed = 0.0
+        for _ in range(max(1, self.config.warmup_rounds)):
+            started = time.perf_counter()
+            self.ml_agent.predict_sync(SAMPLE_TEXTS, version)
+            elapsed = time.perf_counter() - started
+        return elapsed
+    
+    def observe(self, texts: List[str], live: List[MLPrediction], live_seconds: float):
+        """Теневой прогон кандидата на доле живых запросов (вызывается из TicketAnalyzerAgent.predict)"""
+        if random.random() >= self.config.shadow_sample_rate:
+            return
+        if self._pending >= self.config.shadow_max_pending:
+            self.shadow_stats.dropped += 1
+            ML_SHADOW_COMPARISONS.labels(result="dropped").inc()
+            return
+        
+        self._pending += 1
+        # Пустой контекст: теневой прогон не попадает в трассу запроса
+        asyncio.get_running_loop().create_task(
+            self._compare(texts, live, live_seconds, self.candidate, self._shadow_executor, self.shadow_stats),
+            context=contextvars.Context()
+        )
+    
+    async def _compare(
+        self,
+        texts: List[str],
+        live: List[MLPrediction],
+        live_seconds: float,
+        candidate: ModelVersion,
+        executor: ThreadPoolExecutor,
+        stats: ShadowStats
+    ):
+        try:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            # Свой поток: живые запросы не ждут теневые прогоны в очереди инференса
+            predictions = await loop.run_in_executor(executor, self.ml_agent.predict_sync, texts, candidate)
+            stats.add(live, predictions, live_seconds, time.perf_counter() - started)
+        except Exception as e:
+            logger.warning(f"Ошибка теневого прогона версии {candidate.name}: {e}")
+        finally:
+            self._pending -= 1
+    
+    def promote(self) -> Dict:
+        """
+        Атомарная замена активной версии кандидатом
+        
+        Raises:
+            RuntimeError: Кандидат не загружен
+        """
+        if self.candidate is None:
+            raise RuntimeError("Нет загруженной версии-кандидата")
+        
+        candidate = self.candidate
+        self._stop_shadow()
+        previous = self.ml_agent.set_version(candidate)
+        self._write_active(candidate.name)
+        self.candidate, self.candidate_name, self.status = None, None, None
+        self.error, self.warmup_seconds, self.shadow_stats = None, None, None
+        
+        if previous is not None:
+            ML_MODEL_ACTIVE.labels(version=previous.name).set(0)
+            self._retire(previous)
+        ML_MODEL_ACTIVE.labels(version=candidate.name).set(1)
+        return self.describe()
+    
+    def discard(self):
+        """Отмена кандидата"""
+        self._task = None
+        self._stop_shadow()
+        self.candidate, self.candidate_name, self.status = None, None, None
+        self.error, self.warmup_seconds, self.shadow_stats = None, None, None
+    
+    def _stop_shadow(self):
+        self.ml_agent.shadow = None
+        if self._shadow_executor is not None:
+            self._shadow_executor.shutdown(wait=False)
+            self._shadow_executor = None
+    
+    def _write_active(self, name: str):
+        # Другие воркеры и перезапуск загрузят ту же версию
+        active_path = self.ml_agent.models_dir / TicketAnalyzerAgent.VERSIONS_DIR / TicketAnalyzerAgent.ACTIVE_FILE
+        active_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = active_path.with_suffix(".tmp")
+        tmp_path.write_text(name, encoding="utf-8")
+        os.replace(tmp_path, active_path)
+    
+    def _retire(self, version: ModelVersion):
+        self._retired.append((version.name, weakref.ref(version)))
+        self._retired = self._retired[-10:]
+        asyncio.get_running_loop().call_later(self.config.release_check_delay, self._check_released, version.name)
+    
+    def _check_released(self, name: str):
+        # Без gc.collect(): сборка по всей куче с тензорами блокирует event loop,
+        # а версия освобождается подсчетом ссылок, когда дорабатывают ее запросы
+        alive = [ref for retired, ref in self._retired if retired == name and ref() is not None]
+        if alive:
+            logger.warning(f"Память версии модели {name} не освобождена: на нее остались ссылки")
+        else:
+            logger.info(f"Память версии модели {name} освобождена")
@@ -1,12 +1,54 @@
 """Агент для генерации уточняющих вопросов"""
 import logging
-from typing import List, Optional, Dict
+import re
+from typing import AsyncIterator, List, Optional, Tuple
 import json
 
 from src.core.clients.gigachat_client import GigaChatClient
+from src.core.metrics import record_error
+from src.core.prompts import ClassificationPromptBuilder, prompt_registry
+from src.core.structured_output import ClassificationOutput, QuestionsOutput, generate_structured, parse_output
 
 logger = logging.getLogger(__name__)
 
+# Завершенный строковый литерал JSON, за которым следует запятая или конец массива
+_JSON_STRING_ITEM = re.compile(r'\s*("(?:[^"\\]|\\.)*")\s*[,\]]')
+
+
+class QuestionStreamParser:
+    """
+    Инкрементальный разбор ответа вида {"questions": ["...", "..."]}
+    
+    Вопрос отдается, как только в потоке закрылась его строка, не дожидаясь
+    конца ответа. Окончательный список все равно берется из полного ответа.
+    """
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.buffer = ""
+        self.emitted = 0
+        self._position: Optional[int] = None
+    
+    def feed(self, text: str) -> List[str]:
+        """Добавление фрагмента ответа; возвращает новые завершенные вопросы"""
+        self.buffer += text
+        if self._position is None:
+            key = self.buffer.find('"questions"')
+            start = self.buffer.find("[", key) if key >= 0 else -1
+            if start < 0:
+                return []
+            self._position = start + 1
+        
+        questions = []
+        while self.emitted < self.limit:
+            match = _JSON_STRING_ITEM.match(self.buffer, self._position)
+            if not match:
+                break
+            self._position = match.end()
+            self.emitted += 1
+            questions.append(json.loads(match.group(1)))
+        return questions
+
 
 class QuestionGeneratorAgent:
     """
@@ -15,28 +57,23 @@ class QuestionGeneratorAgent:
     """
     
     MAX_QUESTIONS = 5
+    PROMPT_NAME = "question_generator.txt"
+    DEFAULT_PROMPT = 'Сгенерируй уточняющие вопросы к заявке. Верни JSON: {"questions": ["Вопрос?"]}'
+    # Вопросы на случай недоступности GigaChat
+    DEFAULT_QUESTIONS = (
+        "Опишите подробнее, что именно не работает?",
+        "Когда началась проблема?",
+        "Эта проблема связана с компьютером, программой или доступом к системе?"
+    )
     
     def __init__(self):
         self.gigachat_client = GigaChatClient()
-        self.system_prompt = """Ты - эксперт техподдержки университета КФУ.
-
-Твоя задача - сгенерировать уточняющие вопросы для сотрудника техподдержки, которые он может задать пользователю по телефону, чтобы точно определить класс заявки.
-
-Правила:
-1. Генерируй от 3 до 5 вопросов
-2. Вопросы должны быть конкретными и помогать определить класс заявки
-3. Вопросы должны быть понятны обычному пользователю
-4. Не используй технический жаргон без объяснений
-5. Каждый вопрос должен помочь сузить круг возможных классов
-
-Верни ответ СТРОГО в формате JSON:
-{
-    "questions": [
-        "Вопрос 1?",
-        "Вопрос 2?",
-        "Вопрос 3?"
-    ]
-}"""
+        self.prompt_builder = ClassificationPromptBuilder()
+    
+    @property
+    def system_prompt(self) -> str:
+        """Системный промпт из data/prompts (перечитывается при изменении файла)"""
+        return prompt_registry.text(self.PROMPT_NAME, default=self.DEFAULT_PROMPT)
     
     async def generate_questions(self, ticket_text: str, ml_class: Optional[str] = None) -> List[str]:
         """
@@ -45,32 +82,25 @@ class QuestionGeneratorAgent:
         Args:
             ticket_text: Исходный текст заявки
             ml_class: Класс, предложенный ML моделью (если есть)
-            
+        
         Returns:
             Список вопросов (макс. 5)
         """
         try:
             logger.info(f"Генерация вопросов для заявки: {ticket_text[:100]}...")
             
-            # Формируем промпт
-            user_prompt = f"""Текст заявки от пользователя:
-{ticket_text}
-"""
-            if ml_class:
-                user_prompt += f"\nМодель предположила класс: {ml_class} (но с низкой уверенностью)\n"
-            
-            user_prompt += f"\nСгенерируй {self.MAX_QUESTIONS} уточняющих вопросов, которые помогут точно определить класс заявки."
-            
             # Отправляем запрос
-            response = await self.gigachat_client.generate_response(
+            result = await generate_structured(
+                self.gigachat_client,
+                QuestionsOutput,
+                "question_generation",
                 system_prompt=self.system_prompt,
-                user_prompt=user_prompt,
+                user_prompt=self._questions_prompt(ticket_text, ml_class),
                 temperature=0.7,  # Средняя температура для разнообразия вопросов
-                max_tokens=512
+                max_tokens=512,
+                stage="question_llm"
             )
-            
-            # Парсим ответ
-            questions = self._parse_questions(response)
+            questions = result.questions if result is not None else list(self.DEFAULT_QUESTIONS)
             
             # Ограничиваем количество вопросов
             if len(questions) > self.MAX_QUESTIONS:
@@ -78,21 +108,78 @@ class QuestionGeneratorAgent:
             
             logger.info(f"Сгенерировано {len(questions)} вопросов")
             return questions
-            
+        
         except Exception as e:
             logger.error(f"Ошибка при генерации вопросов: {e}")
+            record_error("question_llm")
             # Возвращаем базовые вопросы
-            return [
-                "Опишите подробнее, что именно не работает?",
-                "Когда началась проблема?",
-                "Эта проблема связана с компьютером, программой или доступом к системе?"
-            ]
+            return list(self.DEFAULT_QUESTIONS)
+    
+    async def stream_questions(
+        self,
+        ticket_text: str,
+        ml_class: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, object]]:
+        """
+        Генерация уточняющих вопросов с потоковой выдачей
+        
+        Args:
+            ticket_text: Исходный текст заявки
+            ml_class: Класс, предложенный ML моделью (если есть)
+        
+        Yields:
+            ("token", фрагмент ответа GigaChat), ("question", вопрос) по мере
+            разбора и в конце ("questions", окончательный список вопросов)
+        """
+        parser = QuestionStreamParser(self.MAX_QUESTIONS)
+        streamed: List[str] = []
+        try:
+            logger.info(f"Потоковая генерация вопросов для заявки: {ticket_text[:100]}...")
+            
+            async for token in self.gigachat_client.stream_response(
+                system_prompt=self.system_prompt,
+                user_prompt=self._questions_prompt(ticket_text, ml_class),
+                temperature=0.7,
+                max_tokens=512,
+                stage="question_llm"
+            ):
+                yield "token", token
+                for question in parser.feed(token):
+                    streamed.append(question)
+                    yield "question", question
+            
+            result = parse_output(parser.buffer, QuestionsOutput, "question_generation")
+            questions = result.questions[:self.MAX_QUESTIONS] if result is not None else streamed
+            questions = questions or list(self.DEFAULT_QUESTIONS)
+        
+        except Exception as e:
+            logger.error(f"Ошибка при генерации вопросов: {e}")
+            record_error("question_llm")
+            questions = streamed or list(self.DEFAULT_QUESTIONS)
+        
+        # Вопросы, которые не удалось выделить по ходу потока (не-JSON ответ)
+        for question in questions[len(streamed):]:
+            yield "question", question
+        logger.info(f"Сгенерировано {len(questions)} вопросов")
+        yield "questions", questions
+    
+    def _questions_prompt(self, ticket_text: str, ml_class: Optional[str]) -> str:
+        """Пользовательский промпт генерации вопросов"""
+        user_prompt = f"""Текст заявки от пользователя:
+{ticket_text}
+"""
+        if ml_class:
+            user_prompt += f"\nМодель предположила класс: {ml_class} (но с низкой уверенностью)\n"
+        
+        user_prompt += f"\nСгенерируй {self.MAX_QUESTIONS} уточняющих вопросов, которые помогут точно определить класс заявки."
+        return user_prompt
     
     async def analyze_with_answers(
         self, 
         ticket_text: str, 
         questions: List[str], 
-        answers: List[str]
+        answers: List[str],
+        candidates: Optional[List[Tuple[str, float]]] = None
     ) -> tuple[str, float]:
         """
         Анализ заявки с учетом ответов на вопросы
@@ -101,18 +188,16 @@ class QuestionGeneratorAgent:
             ticket_text: Исходный текст заявки
             questions: Заданные вопросы
             answers: Ответы пользователя
-            
+            candidates: Top-k классы ML модели для компактного промпта
+        
         Returns:
             Tuple[class_name, confidence]
         """
         try:
             logger.info("Анализ с учетом ответов на вопросы")
             
-            # Загружаем промпт классификации
-            from pathlib import Path
-            prompt_path = Path(__file__).parent.parent.parent / "data" / "prompts" / "prompt.txt"
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                classification_prompt = f.read()
+            # Промпт классификации из общего реестра (кешируется в памяти)
+            selection = self.prompt_builder.build(prompt_registry.classification(), candidates)
             
             # Формируем контекст с вопросами и ответами
             qa_context = "\n\nДополнительная информация от пользователя:\n"
@@ -131,22 +216,23 @@ class QuestionGeneratorAgent:
     "confidence": 0.95,
     "reasoning": "объяснение"
 }}"""
-            
+
             # Отправляем запрос
-            response = await self.gigachat_client.generate_response(
-                system_prompt=classification_prompt,
+            result = await generate_structured(
+                self.gigachat_client,
+                ClassificationOutput,
+                "final_analysis",
+                system_prompt=selection.text,
                 user_prompt=user_prompt,
                 temperature=0.2,
-                max_tokens=512
+                max_tokens=512,
+                stage="final_llm"
             )
             
-            # Парсим результат
-            result = self._parse_classification(response)
-            
-            if result:
-                class_name = result.get("class", "нет классов")
-                confidence = result.get("confidence", 0.0)
-                reasoning = result.get("reasoning", "")
+            if result is not None:
+                class_name = result.ticket_class or "нет классов"
+                confidence = result.confidence
+                reasoning = result.reasoning
                 
                 logger.info(f"Финальная классификация: {class_name}, уверенность: {confidence:.2%}")
                 logger.info(f"Обоснование: {reasoning}")
@@ -155,60 +241,8 @@ class QuestionGeneratorAgent:
             else:
                 logger.warning("Не удалось распарсить результат классификации")
                 return "нет классов", 0.0
-                
+        
         except Exception as e:
             logger.error(f"Ошибка при анализе с ответами: {e}")
+            record_error("final_llm")
             return "нет классов", 0.0
-    
-    def _parse_questions(self, response: str) -> List[str]:
-        """Парсинг списка вопросов из ответа"""
-        try:
-            # Убираем markdown маркеры
-            response = response.strip()
-            if response.startswith("```json"):
-                response = response[7:]
-            if response.startswith("```"):
-                response = response[3:]
-            if response.endswith("```"):
-                response = response[:-3]
-            response = response.strip()
-            
-            # Парсим JSON
-            result = json.loads(response)
-            questions = result.get("questions", [])
-            
-            return questions
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка парсинга JSON: {e}")
-            
-            # Пытаемся извлечь вопросы построчно
-            questions = []
-            for line in response.split('\n'):
-                line = line.strip()
-                if line and '?' in line:
-                    # Убираем нумерацию
-                    line = line.lstrip('0123456789.-) ')
-                    if line:
-                        questions.append(line)
-            
-            return questions[:self.MAX_QUESTIONS]
-    
-    def _parse_classification(self, response: str) -> Optional[Dict]:
-        """Парсинг результата классификации"""
-        try:
-            response = response.strip()
-            if response.startswith("```json"):
-                response = response[7:]
-            if response.startswith("```"):
-                response = response[3:]
-            if response.endswith("```"):
-                response = response[:-3]
-            response = response.strip()
-            
-            result = json.loads(response)
-            return result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка парсинга JSON: {e}")
-            return None
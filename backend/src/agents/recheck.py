@@ -0,0 +1,155 @@
+"""
+Фоновая перепроверка ответов, выданных в деградированном режиме
+
+Заявка с ответом ML низкой уверенности ставится в очередь; воркеры
+прогоняют ее глубоким анализом, когда сервис вернется в обычный режим,
+с пакетным приоритетом, чтобы не мешать интерактивным запросам.
+Результат доступен по идентификатору из ответа /classify.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from enum import Enum
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.core.admission import ServiceMode, admission_controller
+from src.core.clients import Priority, llm_priority
+from src.core.config import AdmissionConfig, settings
+from src.core.metrics import RECHECK_JOBS, RECHECK_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class RecheckStatus(str, Enum):
+    PENDING = "pending"
+    DONE = "done"
+    UNRESOLVED = "unresolved"
+    FAILED = "failed"
+
+
+class RecheckJob:
+    """Задание перепроверки одной заявки"""
+    
+    def __init__(
+        self,
+        text: str,
+        ml_class: Optional[str],
+        ml_confidence: Optional[float],
+        candidates: Optional[List[Tuple[str, float]]]
+    ):
+        self.id = uuid.uuid4().hex
+        self.text = text
+        self.ml_class = ml_class
+        self.ml_confidence = ml_confidence
+        self.candidates = candidates
+        self.status = RecheckStatus.PENDING
+        self.ticket_class: Optional[str] = None
+        self.confidence: Optional[float] = None
+        self.created_at = time.monotonic()
+    
+    def to_dict(self) -> Dict:
+        return {
+            "recheck_id": self.id,
+            "status": self.status,
+            "ticket_class": self.ticket_class,
+            "confidence": self.confidence,
+            "ml_class": self.ml_class,
+            "ml_confidence": self.ml_confidence
+        }
+
+
+RecheckHandler = Callable[[RecheckJob], Awaitable[Tuple[Optional[str], Optional[float]]]]
+
+
+class RecheckQueue:
+    """Ограниченная очередь перепроверки с хранением результатов по TTL"""
+    
+    # Как часто воркер проверяет, вышел ли сервис из деградированного режима (секунд)
+    POLL_INTERVAL = 1.0
+    
+    def __init__(self, handler: RecheckHandler, config: Optional[AdmissionConfig] = None):
+        self.handler = handler
+        self.config = config or settings.admission
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.recheck_queue_size)
+        self._jobs: "OrderedDict[str, RecheckJob]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+    
+    def submit(
+        self,
+        text: str,
+        ml_class: Optional[str],
+        ml_confidence: Optional[float],
+        candidates: Optional[List[Tuple[str, float]]] = None
+    ) -> Optional[str]:
+        """
+        Постановка заявки в очередь перепроверки
+        
+        Returns:
+            Идентификатор задания или None, если перепроверка отключена или очередь полна
+        """
+        if not self.config.recheck_enabled:
+            return None
+        
+        job = RecheckJob(text, ml_class, ml_confidence, candidates)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            RECHECK_JOBS.labels(status="dropped").inc()
+            logger.warning("Очередь перепроверки заполнена, заявка не будет перепроверена")
+            return None
+        
+        RECHECK_QUEUE_DEPTH.inc()
+        self._store(job)
+        self._ensure_workers()
+        return job.id
+    
+    def get(self, job_id: str) -> Optional[RecheckJob]:
+        self._evict()
+        return self._jobs.get(job_id)
+    
+    def _store(self, job: RecheckJob):
+        self._jobs[job.id] = job
+        self._evict()
+    
+    def _evict(self):
+        expired_before = time.monotonic() - self.config.recheck_result_ttl
+        while self._jobs:
+            oldest = next(iter(self._jobs.values()))
+            if len(self._jobs) <= self.config.recheck_max_results and oldest.created_at >= expired_before:
+                break
+            self._jobs.popitem(last=False)
+    
+    def _ensure_workers(self):
+        # Воркеры стартуют в event loop'е первого запроса, но с пустым
+        # контекстом: иначе они унаследуют его трассу и истекший дедлайн
+        self._workers = [task for task in self._workers if not task.done()]
+        while len(self._workers) < self.config.recheck_workers:
+            self._workers.append(asyncio.create_task(self._worker(), context=contextvars.Context()))
+    
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            RECHECK_QUEUE_DEPTH.dec()
+            try:
+                # Перепроверка не должна усугублять перегрузку
+                while admission_controller.current_mode() == ServiceMode.DEGRADED:
+                    await asyncio.sleep(self.POLL_INTERVAL)
+                
+                with llm_priority(Priority.BULK):
+                    ticket_class, confidence = await self.handler(job)
+                
+                if ticket_class:
+                    job.ticket_class, job.confidence = ticket_class, confidence
+                    job.status = RecheckStatus.DONE
+                else:
+                    job.status = RecheckStatus.UNRESOLVED
+            except Exception as e:
+                logger.error(f"Ошибка перепроверки заявки {job.id}: {e}")
+                job.status = RecheckStatus.FAILED
+            finally:
+                self._queue.task_done()
+            
+            RECHECK_JOBS.labels(status=job.status.value).inc()
@@ -0,0 +1,278 @@
+"""
+Проверка тематики заявки - первая стадия каскада
+
+Заметная часть заявок не относится к IT (сантехника, кадры, другие
+организации), но проходит раскрытие сокращений, ML, глубокий анализ и
+вопросы, чтобы в итоге получить «нет классов». Бинарная логистическая
+модель по эмбеддингу RuBERT отклоняет такие заявки за миллисекунды без
+вызовов GigaChat.
+
+Примеры берутся из хранилища обратной связи: «нет классов» из уверенной
+финальной классификации и исправлений операторов против заявок с классом.
+Порог выбирается выше всех отложенных заявок по теме. Кроме того,
+отклоняются только заявки, которые ML стадия не решила бы сама: заявок,
+уверенно классифицированных ML моделью, в выборке нет, и модели тематики
+о них судить не по чему.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from src.core.config import RelevanceConfig, settings
+from src.core.feedback import FeedbackSource, FeedbackStore, feedback_store
+from src.core.metrics import RELEVANCE_DECISIONS, RELEVANCE_HOLDOUT_SCORE, timed_stage
+from src.core.prompts.classification import OUT_OF_SCOPE_CLASS
+from src.core.thresholds import threshold_registry
+from src.utils.relevance_fit import fit_relevance
+
+from .ticket_analyzer import MLPrediction, ModelVersion, TicketAnalyzerAgent
+
+logger = logging.getLogger(__name__)
+
+
+class RelevanceResult:
+    """Решение проверки тематики по одной заявке"""
+    
+    def __init__(self, rejected: bool, probability: float, threshold: float, prediction: MLPrediction):
+        self.rejected = rejected
+        # Вероятность того, что заявка не по теме
+        self.probability = probability
+        self.threshold = threshold
+        # Предсказание ML модели по исходному тексту: переиспользуется ML стадией
+        self.prediction = prediction
+    
+    def to_dict(self) -> Dict:
+        return {
+            "rejected": self.rejected,
+            "probability": self.probability,
+            "threshold": self.threshold
+        }
+
+
+class RelevanceModel:
+    """Модель тематики, обученная на эмбеддингах одной версии RuBERT"""
+    
+    def __init__(self, classifier, threshold: float, encoder: str, metrics: Dict[str, float]):
+        self.classifier = classifier
+        self.threshold = threshold
+        self.encoder = encoder
+        self.metrics = metrics
+    
+    def probability(self, embedding: np.ndarray) -> float:
+        """Вероятность того, что заявка не по теме"""
+        return float(self.classifier.predict_proba(embedding[None, :])[0, 1])
+    
+    def to_dict(self) -> Dict:
+        return {
+            "classifier": self.classifier,
+            "threshold": self.threshold,
+            "encoder": self.encoder,
+            "metrics": self.metrics
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RelevanceModel":
+        return cls(data["classifier"], data["threshold"], data["encoder"], data["metrics"])
+
+
+class RelevanceGate:
+    """Отсев заявок не по теме IT до вызовов GigaChat"""
+    
+    MODEL_FILE = "relevance_gate.pkl"
+    
+    def __init__(
+        self,
+        ml_agent: TicketAnalyzerAgent,
+        store: Optional[FeedbackStore] = None,
+        config: Optional[RelevanceConfig] = None
+    ):
+        self.ml_agent = ml_agent
+        self.store = store or feedback_store
+        self.config = config or settings.relevance
+        self.last_report: Optional[Dict] = None
+        self._model: Optional[RelevanceModel] = None
+        # Файл модели активной версии и его mtime при загрузке
+        self._model_state: Tuple[Optional[Path], Optional[int]] = (None, None)
+        self._checked_at: Optional[float] = None
+        # Версия модели и момент изменения выборки при последнем обучении
+        self._trained: Tuple[Optional[str], float] = (None, 0.0)
+        self._lock = asyncio.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled and self.store is not None
+    
+    def model(self) -> Optional[RelevanceModel]:
+        """Модель тематики активной версии или None, если она еще не обучена"""
+        version = self.ml_agent.version
+        if not self.enabled or version is None:
+            return None
+        path = self._model_path(version)
+        now = time.monotonic()
+        # Модель мог обучить другой воркер: файл проверяется не чаще reload_interval
+        stale = self._checked_at is None or now - self._checked_at >= self.config.reload_interval
+        if path != self._model_state[0] or stale:
+            self._checked_at = now
+            self._load(path)
+        model = self._model
+        return model if model is not None and model.encoder == version.encoder else None
+    
+    async def check(self, text: str) -> Optional[RelevanceResult]:
+        """
+        Проверка тематики заявки
+        
+        Args:
+            text: Исходный текст заявки
+        
+        Returns:
+            RelevanceResult или None, если модели тематики нет или ML модель недоступна
+        """
+        model = self.model()
+        if model is None:
+            return None
+        try:
+            prediction = (await self.ml_agent.predict([text]))[0]
+        except Exception as e:
+            logger.error(f"Ошибка проверки тематики: {e}")
+            return None
+        # Эмбеддинг другой версии RuBERT (идет замена модели)
+        if prediction.encoder != model.encoder:
+            return None
+        
+        with timed_stage("relevance"):
+            probability = model.probability(prediction.embedding)
+        resolved_by_ml = prediction.confidence >= threshold_registry.get().ml(prediction.ticket_class)
+        rejected = probability >= model.threshold and not resolved_by_ml
+        RELEVANCE_DECISIONS.labels(result="rejected" if rejected else "accepted").inc()
+        return RelevanceResult(rejected, probability, model.threshold, prediction)
+    
+    async def refit(self, force: bool = False) -> Dict:
+        """
+        Обучение модели тематики на обратной связи
+        
+        Args:
+            force: Обучить, даже если выборка не менялась с прошлого раза
+        
+        Returns:
+            Отчет: status (trained, skipped, running), порог и метрики на
+            отложенных примерах
+        """
+        if self._lock.locked():
+            return {"status": "running"}
+        
+        async with self._lock:
+            report = await self._refit(force)
+        
+        self.last_report = report
+        return report
+    
+    async def _refit(self, force: bool) -> Dict:
+        if not self.enabled:
+            return {"status": "skipped", "reason": "disabled"}
+        version = self.ml_agent.version
+        if version is None or not version.ready:
+            return {"status": "skipped", "reason": "no_model"}
+        
+        dataset = await self.store.dataset(version.encoder)
+        if not force and self._trained[0] == version.name and dataset.updated_at <= self._trained[1]:
+            return {"status": "skipped", "reason": "no_changes"}
+        
+        out_of_scope = dataset.labels == OUT_OF_SCOPE_CLASS
+        holdout = dataset.ids % settings.feedback.holdout_every == 0
+        counts = {
+            "out_of_scope": int(out_of_scope.sum()),
+            "in_scope": int((~out_of_scope).sum()),
+            "holdout_out_of_scope": int((holdout & out_of_scope).sum()),
+            "holdout_in_scope": int((holdout & ~out_of_scope).sum())
+        }
+        if (
+            counts["out_of_scope"] < self.config.min_out_of_scope
+            or counts["in_scope"] < self.config.min_in_scope
+            or not counts["holdout_out_of_scope"]
+            or not counts["holdout_in_scope"]
+        ):
+            return {"status": "skipped", "reason": "not_enough_examples", **counts}
+        
+        corrections = dataset.sources == FeedbackSource.CORRECTION.value
+        weights = np.where(corrections, settings.feedback.correction_weight, 1.0)
+        logger.info(
+            f"Обучение модели тематики: {counts['out_of_scope']} заявок не по теме, "
+            f"{counts['in_scope']} по теме"
+        )
+        
+        loop = asyncio.get_running_loop()
+        # Отдельный процесс, как при дообучении головы: оптимизатор не держит GIL event loop'а
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            classifier, threshold, metrics = await loop.run_in_executor(
+                executor,
+                fit_relevance,
+                dataset.embeddings,
+                out_of_scope,
+                weights,
+                holdout,
+                self.config.regularization,
+                self.config.max_iter,
+                self.config.min_probability,
+                self.config.max_false_reject
+            )
+        finally:
+            executor.shutdown(wait=False)
+        self._trained = (version.name, dataset.updated_at)
+        
+        for metric, value in metrics.items():
+            RELEVANCE_HOLDOUT_SCORE.labels(metric=metric).set(value)
+        report = {**counts, **metrics}
+        
+        current = self.ml_agent.version
+        if current is None or current.encoder != version.encoder:
+            return {"status": "skipped", "reason": "version_changed", **report}
+        
+        model = RelevanceModel(classifier, threshold, version.encoder, metrics)
+        path = self._model_path(version)
+        await asyncio.to_thread(self._save, model, path)
+        logger.info(
+            f"Модель тематики обновлена: порог {threshold:.3f}, отклонено бы "
+            f"{metrics['recall']:.2%} заявок не по теме и {metrics['false_reject']:.2%} по теме"
+        )
+        return {"status": "trained", **report}
+    
+    def _model_path(self, version: ModelVersion) -> Path:
+        return version.path / self.MODEL_FILE
+    
+    def _load(self, path: Path):
+        """Загрузка модели тематики, если файл появился или изменился"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._model, self._model_state = None, (path, None)
+            return
+        except OSError as e:
+            logger.error(f"Не удалось проверить модель тематики {path}: {e}")
+            return
+        if self._model_state == (path, mtime_ns):
+            return
+        
+        try:
+            self._model = RelevanceModel.from_dict(joblib.load(str(path)))
+            logger.info(f"Загружена модель тематики {path} (порог {self._model.threshold:.3f})")
+        except Exception as e:
+            logger.error(f"Не удалось загрузить модель тематики {path}: {e}")
+            self._model = None
+        self._model_state = (path, mtime_ns)
+    
+    def _save(self, model: RelevanceModel, path: Path):
+        # Запись через временный файл: воркеры не прочитают недописанную модель
+        tmp_path = path.with_suffix(".tmp")
+        joblib.dump(model.to_dict(), str(tmp_path))
+        os.replace(tmp_path, path)
+        self._model = model
+        self._model_state = (path, os.stat(path).st_mtime_ns)
@@ -1,26 +1,63 @@
 """Системный контроллер для управления цепочкой агентов"""
+import asyncio
+import contextvars
 import logging
-from typing import Optional, List, Dict
+import random
+from typing import AsyncIterator, Any, Optional, List, Dict, Tuple
 from enum import Enum
 
+from src.core import deadline, tracing
+from src.core.admission import ServiceMode, admission_controller
+from src.core.classification_log import classification_log
+from src.core.clients import Priority, llm_priority
+from src.core.clients.resilience import circuit_breaker, latency_tracker
+from src.core.config import settings
+from src.core.metrics import (
+    ANSWER_RECLASSIFICATIONS,
+    CASCADE_FALLBACKS,
+    CASCADE_TERMINAL_STAGE,
+    LLM_CALLS_SAVED,
+    LLM_SECONDS_SAVED,
+    ZERO_SHOT_AUDITS,
+    timed_stage,
+)
+from src.core.feedback import FeedbackSource
+from src.core.prompts.classification import OUT_OF_SCOPE_CLASS, normalize_class_name
+from src.core.sessions import TicketSession, session_store
+from src.core.thresholds import threshold_registry
 from .abbreviation_convert import AbbreviationConvertAgent
-from .ticket_analyzer import TicketAnalyzerAgent
+from .ticket_analyzer import MLPrediction, TicketAnalyzerAgent
 from .deep_ticket_analyzer import DeepTicketAnalyzerAgent
+from .feedback_trainer import FeedbackTrainer
+from .model_registry import ModelRegistry
 from .question_generator import QuestionGeneratorAgent
+from .recheck import RecheckJob, RecheckQueue
+from .relevance import RelevanceGate
+from .type_ahead import TypeAheadAgent
+from .zero_shot import ZeroShotAgent
 
 logger = logging.getLogger(__name__)
 
 
 class ProcessingStage(str, Enum):
     """Стадии обработки заявки"""
+    RELEVANCE = "relevance"
     ABBREVIATION_CONVERT = "abbreviation_convert"
     ML_CLASSIFICATION = "ml_classification"
+    ZERO_SHOT = "zero_shot"
     DEEP_ANALYSIS = "deep_analysis"
     QUESTION_GENERATION = "question_generation"
     FINAL_ANALYSIS = "final_analysis"
     COMPLETED = "completed"
 
 
+def _class_list(top_classes: Optional[List[Tuple[str, float]]]) -> Optional[List[Dict]]:
+    """Top-k классы ML модели в формате API"""
+    if not top_classes:
+        return None
+    return [{"ticket_class": name, "probability": probability} for name, probability in top_classes]
+
+
 class ClassificationResult:
     """Результат классификации заявки"""
     
@@ -31,7 +68,13 @@ class ClassificationResult:
         confidence: Optional[float] = None,
         questions: Optional[List[str]] = None,
         processed_text: Optional[str] = None,
-        reasoning: Optional[str] = None
+        reasoning: Optional[str] = None,
+        low_confidence: bool = False,
+        top_classes: Optional[List[Tuple[str, float]]] = None,
+        recheck_id: Optional[str] = None,
+        mode: ServiceMode = ServiceMode.NORMAL,
+        session_token: Optional[str] = None,
+        feedback_id: Optional[int] = None
     ):
         self.stage = stage
         self.ticket_class = ticket_class
@@ -39,6 +82,12 @@ class ClassificationResult:
         self.questions = questions
         self.processed_text = processed_text
         self.reasoning = reasoning
+        self.low_confidence = low_confidence
+        self.top_classes = top_classes
+        self.recheck_id = recheck_id
+        self.mode = mode
+        self.session_token = session_token
+        self.feedback_id = feedback_id
     
     def to_dict(self) -> Dict:
         """Конвертация в словарь для API"""
@@ -48,7 +97,13 @@ class ClassificationResult:
             "confidence": self.confidence,
             "questions": self.questions,
             "processed_text": self.processed_text,
-            "reasoning": self.reasoning
+            "reasoning": self.reasoning,
+            "low_confidence": self.low_confidence,
+            "top_classes": _class_list(self.top_classes),
+            "recheck_id": self.recheck_id,
+            "mode": self.mode,
+            "session_token": self.session_token,
+            "feedback_id": self.feedback_id
         }
 
 
@@ -58,28 +113,53 @@ class SystemControlAgent:
     Управляет цепочкой обработки заявки.
     """
     
-    def __init__(self):
+    def __init__(self, ml_agent: Optional[TicketAnalyzerAgent] = None):
         self.abbreviation_agent = AbbreviationConvertAgent()
-        self.ml_agent = TicketAnalyzerAgent()
+        self.ml_agent = ml_agent or TicketAnalyzerAgent()
+        self.zero_shot_agent = ZeroShotAgent(self.ml_agent)
+        self.type_ahead_agent = TypeAheadAgent(self.ml_agent)
         self.deep_agent = DeepTicketAnalyzerAgent()
         self.question_agent = QuestionGeneratorAgent()
+        self.recheck_queue = RecheckQueue(self._recheck)
+        self.relevance_gate = RelevanceGate(self.ml_agent)
+        self.feedback = FeedbackTrainer(self.ml_agent, relevance=self.relevance_gate)
+        self.model_registry = ModelRegistry(self.ml_agent)
+        self._zero_shot_audits = 0
     
-    async def process_ticket(self, ticket_text: str) -> ClassificationResult:
+    async def process_ticket(self, ticket_text: str, timeout: Optional[float] = None) -> ClassificationResult:
         """
         Основной метод обработки заявки
         
         Цепочка:
+        0. RelevanceGate - проверка тематики по исходному тексту
+           - Если заявка явно не по теме IT -> возврат «нет классов»
+             без вызовов GigaChat
         1. AbbreviationConvert - исправление аббревиатур
         2. TicketAnalyzer (ML) - классификация
-           - Если confidence >= 90% -> возврат результата
+           - Если confidence не ниже порога класса -> возврат результата
+           - Иначе -> zero-shot: если top-1 ML совпадает с ближайшим
+             описанием класса из промпта -> возврат результата
            - Иначе -> переход к 3
         3. DeepTicketAnalyzer (GigaChat) - глубокий анализ
            - Если удалось классифицировать -> возврат результата
            - Иначе -> переход к 4
         4. QuestionGenerator - генерация вопросов
         
+        Проверка тематики и zero-shot стадия локальные и работают и в режиме
+        degraded.
+        
+        Если GigaChat недоступен (открыт circuit breaker) или до дедлайна
+        запроса осталось меньше min_llm_budget, стадии 3-4 пропускаются и
+        возвращается лучший ответ ML модели.
+        
+        Под перегрузкой (см. AdmissionController) каскад работает в режиме
+        degraded: без сокращений и GigaChat, с ответом ML top-k и флагом
+        низкой уверенности, а глубокий анализ откладывается в очередь
+        перепроверки.
+        
         Args:
             ticket_text: Исходный текст заявки
+            timeout: Бюджет времени на заявку в секундах (по умолчанию из настроек)
             
         Returns:
             ClassificationResult с результатом или вопросами
@@ -87,84 +167,556 @@ class SystemControlAgent:
         try:
             logger.info("Начало обработки заявки")
             
-            processed_text = await self.abbreviation_agent.process(ticket_text)
-            should_continue, ml_class, ml_confidence = await self.ml_agent.analyze(processed_text)
+            with deadline.deadline_scope(timeout or settings.resilience.request_deadline):
+                mode = admission_controller.current_mode()
+                async for event, payload in self._logged_cascade("classify", ticket_text, mode):
+                    if event == "result":
+                        result = payload
             
-            if not should_continue and ml_class:
-                logger.info(f"ML: {ml_class} ({ml_confidence:.2%})")
-                return ClassificationResult(
-                    stage=ProcessingStage.ML_CLASSIFICATION,
-                    ticket_class=ml_class,
-                    confidence=ml_confidence,
-                    processed_text=processed_text,
-                    reasoning="Классифицировано ML моделью с высокой уверенностью"
-                )
+            CASCADE_TERMINAL_STAGE.labels(stage=result.stage.value).inc()
+            return result
             
-            should_continue, deep_class, deep_confidence = await self.deep_agent.analyze(processed_text)
+        except Exception as e:
+            logger.error(f"Ошибка в процессе обработки: {e}", exc_info=True)
+            raise
+    
+    async def stream_ticket(
+        self,
+        ticket_text: str,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Обработка заявки с выдачей результата каждой стадии по мере готовности
+        
+        Цепочка та же, что в process_ticket; вопросы генерируются с потоковой
+        выдачей токенов GigaChat, и каждый вопрос отдается, как только разобран.
+        
+        Args:
+            ticket_text: Исходный текст заявки
+            timeout: Бюджет времени на заявку в секундах (по умолчанию из настроек)
+        
+        Yields:
+            (событие, данные): mode, relevance, abbreviation, ml, zero_shot, deep, question_token,
+            question и последним result - итог в формате ClassificationResult.to_dict
+        """
+        logger.info("Начало потоковой обработки заявки")
+        
+        with deadline.deadline_scope(timeout or settings.resilience.request_deadline):
+            mode = admission_controller.current_mode()
+            yield "mode", {"mode": mode}
             
-            if not should_continue and deep_class:
-                logger.info(f"Deep: {deep_class} ({deep_confidence:.2%})")
-                return ClassificationResult(
-                    stage=ProcessingStage.DEEP_ANALYSIS,
-                    ticket_class=deep_class,
-                    confidence=deep_confidence,
-                    processed_text=processed_text,
-                    reasoning="Классифицировано GigaChat с высокой уверенностью"
+            async for event, payload in self._logged_cascade(
+                "classify/stream",
+                ticket_text,
+                mode,
+                stream_questions=True
+            ):
+                if event == "result":
+                    CASCADE_TERMINAL_STAGE.labels(stage=payload.stage.value).inc()
+                    payload = payload.to_dict()
+                yield event, payload
+    
+    async def _logged_cascade(
+        self,
+        endpoint: str,
+        ticket_text: str,
+        mode: ServiceMode,
+        stream_questions: bool = False
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        _cascade_events под замером стадии cascade с записью в журнал классификаций
+        
+        Запись ставится в очередь после последнего события, в том числе при
+        ошибке или обрыве потока; на диск она попадает в фоне.
+        """
+        events: List[Tuple[str, Any]] = []
+        result: Optional[ClassificationResult] = None
+        cascade: Optional[tracing.Span] = None
+        error: Optional[str] = None
+        attributes = {"stream": True} if stream_questions else {}
+        try:
+            with timed_stage("cascade", mode=mode.value, **attributes) as cascade:
+                async for event, payload in self._cascade_events(ticket_text, mode, stream_questions):
+                    if event == "result":
+                        payload.mode = mode
+                        result = payload
+                    elif event != "question_token":
+                        events.append((event, payload))
+                    yield event, payload
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            classification_log.log(
+                endpoint,
+                {"text": ticket_text},
+                events,
+                result.to_dict() if result is not None else None,
+                cascade,
+                error
+            )
+    
+    async def _cascade_events(
+        self,
+        ticket_text: str,
+        mode: ServiceMode,
+        stream_questions: bool = False
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Прохождение заявки по цепочке агентов
+        
+        Yields:
+            Промежуточные результаты стадий и последним ("result", ClassificationResult)
+        """
+        relevance = await self.relevance_gate.check(ticket_text)
+        if relevance is not None:
+            yield "relevance", relevance.to_dict()
+            if relevance.rejected:
+                logger.info(f"Заявка не по теме IT ({relevance.probability:.2%})")
+                yield "result", ClassificationResult(
+                    stage=ProcessingStage.RELEVANCE,
+                    ticket_class=OUT_OF_SCOPE_CLASS,
+                    confidence=relevance.probability,
+                    processed_text=ticket_text,
+                    reasoning="Заявка не относится к IT поддержке"
                 )
-            
+                return
+        
+        if mode == ServiceMode.DEGRADED:
+            # ML модель обходится без раскрытия сокращений, GigaChat не вызывается
+            processed_text = ticket_text
+        else:
+            processed_text = await self.abbreviation_agent.process(ticket_text)
+        yield "abbreviation", {"processed_text": processed_text, "skipped": mode == ServiceMode.DEGRADED}
+        
+        # Если сокращений не было, предсказание из проверки тематики уже посчитано по этому тексту
+        known = relevance.prediction if relevance is not None and processed_text == ticket_text else None
+        should_continue, ml_prediction = await self.ml_agent.analyze_detailed(processed_text, prediction=known)
+        ml_class = ml_prediction.ticket_class if ml_prediction else None
+        ml_confidence = ml_prediction.confidence if ml_prediction else None
+        yield "ml", {
+            "ticket_class": ml_class,
+            "confidence": ml_confidence,
+            "top_classes": _class_list(ml_prediction.top_classes) if ml_prediction else None
+        }
+        
+        if not should_continue and ml_class:
+            logger.info(f"ML: {ml_class} ({ml_confidence:.2%})")
+            yield "result", ClassificationResult(
+                stage=ProcessingStage.ML_CLASSIFICATION,
+                ticket_class=ml_class,
+                confidence=ml_confidence,
+                processed_text=processed_text,
+                reasoning="Классифицировано ML моделью с высокой уверенностью"
+            )
+            return
+        
+        zero_shot = await self.zero_shot_agent.analyze(ml_prediction)
+        yield "zero_shot", zero_shot.to_dict()
+        
+        if zero_shot.accepted:
+            logger.info(f"Zero-shot: {ml_class} ({ml_confidence:.2%}, отрыв {zero_shot.margin:.3f})")
+            self._audit_zero_shot(processed_text, ml_prediction, mode)
+            yield "result", ClassificationResult(
+                stage=ProcessingStage.ZERO_SHOT,
+                ticket_class=ml_class,
+                confidence=ml_confidence,
+                processed_text=processed_text,
+                reasoning="ML модель и описание класса из промпта указывают на один класс"
+            )
+            return
+        
+        fallback = self._ml_fallback(ml_prediction, processed_text, mode)
+        if fallback:
+            yield "result", fallback
+            return
+        
+        should_continue, deep_class, deep_confidence = await self.deep_agent.analyze(
+            processed_text,
+            candidates=ml_prediction.top_classes if ml_prediction else None
+        )
+        yield "deep", {"ticket_class": deep_class, "confidence": deep_confidence, "resolved": not should_continue}
+        
+        if not should_continue and deep_class:
+            logger.info(f"Deep: {deep_class} ({deep_confidence:.2%})")
+            # Заявка, которую ML модель не решила, становится примером для дообучения
+            feedback_id = await self.feedback.record(
+                ml_prediction,
+                deep_class,
+                FeedbackSource.DEEP_ANALYSIS,
+                deep_confidence,
+                processed_text
+            )
+            yield "result", ClassificationResult(
+                stage=ProcessingStage.DEEP_ANALYSIS,
+                ticket_class=deep_class,
+                confidence=deep_confidence,
+                processed_text=processed_text,
+                reasoning="Классифицировано GigaChat с высокой уверенностью",
+                feedback_id=feedback_id
+            )
+            return
+        
+        fallback = self._ml_fallback(ml_prediction, processed_text, mode)
+        if fallback:
+            yield "result", fallback
+            return
+        
+        if stream_questions:
+            questions: List[str] = []
+            index = 0
+            async for kind, value in self.question_agent.stream_questions(
+                ticket_text=processed_text,
+                ml_class=ml_class or deep_class
+            ):
+                if kind == "token":
+                    yield "question_token", {"text": value}
+                elif kind == "question":
+                    yield "question", {"index": index, "text": value}
+                    index += 1
+                else:
+                    questions = value
+        else:
             questions = await self.question_agent.generate_questions(
                 ticket_text=processed_text,
                 ml_class=ml_class or deep_class
             )
+        
+        # Все вычисленное по заявке сохраняется: с ответами придет только токен
+        session = TicketSession(
+            processed_text=processed_text,
+            questions=questions,
+            ml_class=ml_class,
+            ml_confidence=ml_confidence,
+            top_classes=ml_prediction.top_classes if ml_prediction else None,
+            embedding=ml_prediction.embedding if ml_prediction else None,
+            deep_class=deep_class,
+            deep_confidence=deep_confidence
+        )
+        await session_store.put(session)
+        
+        yield "result", ClassificationResult(
+            stage=ProcessingStage.QUESTION_GENERATION,
+            questions=questions,
+            processed_text=processed_text,
+            ticket_class=ml_class or deep_class,  # Предварительный класс
+            confidence=ml_confidence or deep_confidence,
+            reasoning="Требуется дополнительная информация от пользователя",
+            session_token=session.token
+        )
+    
+    def _audit_zero_shot(self, processed_text: str, ml_prediction: MLPrediction, mode: ServiceMode):
+        """Выборочная фоновая перепроверка принятого zero-shot ответа глубоким анализом"""
+        config = settings.zero_shot
+        if mode == ServiceMode.DEGRADED or self._zero_shot_audits >= config.audit_max_pending:
+            return
+        if random.random() >= config.audit_sample_rate:
+            return
+        
+        self._zero_shot_audits += 1
+        # Пустой контекст: перепроверка не попадает в трассу и дедлайн запроса
+        asyncio.get_running_loop().create_task(
+            self._zero_shot_audit(processed_text, ml_prediction),
+            context=contextvars.Context()
+        )
+    
+    async def _zero_shot_audit(self, processed_text: str, ml_prediction: MLPrediction):
+        try:
+            with deadline.deadline_scope(settings.resilience.request_deadline), llm_priority(Priority.BULK):
+                # Полный промпт: с top-k ML модели GigaChat склонен соглашаться с ее top-1
+                should_continue, deep_class, deep_confidence = await self.deep_agent.analyze(processed_text)
             
-            return ClassificationResult(
-                stage=ProcessingStage.QUESTION_GENERATION,
-                questions=questions,
-                processed_text=processed_text,
-                ticket_class=ml_class or deep_class,  # Предварительный класс
-                confidence=ml_confidence or deep_confidence,
-                reasoning="Требуется дополнительная информация от пользователя"
+            if should_continue or not deep_class:
+                ZERO_SHOT_AUDITS.labels(result="unresolved").inc()
+                return
+            agreed = normalize_class_name(deep_class) == normalize_class_name(ml_prediction.ticket_class)
+            ZERO_SHOT_AUDITS.labels(result="agree" if agreed else "disagree").inc()
+            if not agreed:
+                logger.warning(f"Zero-shot ответ {ml_prediction.ticket_class} не подтвержден: GigaChat - {deep_class}")
+            await self.feedback.record(
+                ml_prediction,
+                deep_class,
+                FeedbackSource.DEEP_ANALYSIS,
+                deep_confidence,
+                processed_text
             )
-            
         except Exception as e:
-            logger.error(f"Ошибка в процессе обработки: {e}", exc_info=True)
-            raise
+            logger.warning(f"Ошибка перепроверки zero-shot ответа: {e}")
+        finally:
+            self._zero_shot_audits -= 1
     
-    async def process_with_answers(
+    @staticmethod
+    def _llm_unavailable_reason(mode: ServiceMode) -> Optional[str]:
+        """Причина не вызывать GigaChat или None, если вызов имеет смысл"""
+        if mode == ServiceMode.DEGRADED:
+            return "degraded"
+        if circuit_breaker.is_open:
+            return "circuit_open"
+        left = deadline.remaining()
+        if left is not None and left < settings.resilience.min_llm_budget:
+            return "deadline"
+        return None
+    
+    def _ml_fallback(
+        self,
+        ml_prediction: Optional[MLPrediction],
+        processed_text: str,
+        mode: ServiceMode,
+        recheck: bool = True
+    ) -> Optional[ClassificationResult]:
+        """
+        Лучший ответ ML модели, если стадии GigaChat сейчас выполнять не стоит
+        
+        Args:
+            ml_prediction: Предсказание ML модели
+            processed_text: Текст заявки
+            mode: Режим обслуживания
+            recheck: Поставить заявку в очередь фоновой перепроверки
+        
+        Returns:
+            ClassificationResult с флагом низкой уверенности или None
+        """
+        reason = self._llm_unavailable_reason(mode)
+        ml_class = ml_prediction.ticket_class if ml_prediction else None
+        # Без ответа ML продолжать каскад имеет смысл, только если сервис не перегружен
+        if reason is None or (not ml_class and mode != ServiceMode.DEGRADED):
+            return None
+        
+        ml_confidence = ml_prediction.confidence if ml_prediction else None
+        logger.warning(f"GigaChat пропущен ({reason}), возвращен ответ ML: {ml_class} ({ml_confidence or 0:.2%})")
+        CASCADE_FALLBACKS.labels(reason=reason).inc()
+        
+        recheck_id = None
+        if recheck:
+            recheck_id = self.recheck_queue.submit(
+                processed_text,
+                ml_class,
+                ml_confidence,
+                candidates=ml_prediction.top_classes if ml_prediction else None
+            )
+        
+        if mode == ServiceMode.DEGRADED:
+            reasoning = "Сервис перегружен: ответ ML модели с низкой уверенностью, глубокий анализ отложен"
+        else:
+            reasoning = "GigaChat недоступен: возвращен лучший ответ ML модели"
+        return ClassificationResult(
+            stage=ProcessingStage.ML_CLASSIFICATION,
+            ticket_class=ml_class,
+            confidence=ml_confidence,
+            processed_text=processed_text,
+            reasoning=reasoning,
+            low_confidence=True,
+            top_classes=ml_prediction.top_classes if ml_prediction else None,
+            recheck_id=recheck_id
+        )
+    
+    async def _recheck(self, job: RecheckJob) -> Tuple[Optional[str], Optional[float]]:
+        """Отложенный глубокий анализ заявки из очереди перепроверки"""
+        with deadline.deadline_scope(settings.resilience.request_deadline):
+            processed_text = await self.abbreviation_agent.process(job.text)
+            should_continue, deep_class, deep_confidence = await self.deep_agent.analyze(
+                processed_text,
+                candidates=job.candidates
+            )
+        if should_continue or not deep_class:
+            return None, None
+        return deep_class, deep_confidence
+    
+    @staticmethod
+    def _session_prediction(session: TicketSession) -> Optional[MLPrediction]:
+        """Предсказание ML модели, сохраненное в сессии"""
+        if not session.ml_class:
+            return None
+        return MLPrediction(
+            ticket_class=session.ml_class,
+            confidence=session.ml_confidence,
+            top_classes=session.top_classes or [],
+            embedding=session.embedding
+        )
+    
+    @staticmethod
+    def _final_candidates(
+        ml_prediction: Optional[MLPrediction],
+        session: Optional[TicketSession]
+    ) -> Optional[List[Tuple[str, float]]]:
+        """Top-k классы ML модели и класс глубокого анализа для промпта финальной классификации"""
+        candidates = list(ml_prediction.top_classes) if ml_prediction else None
+        if candidates and session and session.deep_class:
+            if session.deep_class not in {name for name, _ in candidates}:
+                candidates.append((session.deep_class, session.deep_confidence or 0.0))
+        return candidates
+    
+    async def _final_predictions(
         self,
         ticket_text: str,
-        questions: List[str],
-        answers: List[str]
+        answers: List[str],
+        session: Optional[TicketSession]
+    ) -> Tuple[Optional[MLPrediction], Optional[MLPrediction]]:
+        """
+        Предсказания ML модели для финальной стадии
+        
+        Ответы вроде «это wifi» или «нужен пароль от почты» часто делают
+        заявку однозначной, поэтому текст заявки с ответами тоже проходит
+        ML модель - в одном батче с текстом заявки (если предсказания по нему
+        нет в сессии).
+        
+        Returns:
+            Tuple[предсказание по тексту заявки, предсказание с учетом ответов]
+        """
+        ml_prediction = self._session_prediction(session) if session is not None else None
+        texts = [ticket_text] if session is None else []
+        
+        answered = "\n".join(answer.strip() for answer in answers if answer and answer.strip())
+        with_answers = settings.ml.answer_reclassify_enabled and bool(answered)
+        if with_answers:
+            texts.append(f"{ticket_text}\n{answered}")
+        if not texts:
+            return ml_prediction, None
+        
+        try:
+            with timed_stage("answer_reclassify", batch_size=len(texts)):
+                predictions = await self.ml_agent.predict(texts)
+        except Exception as e:
+            logger.error(f"Ошибка ML классификации с ответами: {e}")
+            return ml_prediction, None
+        
+        if session is None:
+            ml_prediction = predictions[0]
+        return ml_prediction, predictions[-1] if with_answers else None
+    
+    async def process_with_answers(
+        self,
+        ticket_text: Optional[str],
+        questions: Optional[List[str]],
+        answers: List[str],
+        timeout: Optional[float] = None,
+        session: Optional[TicketSession] = None
     ) -> ClassificationResult:
         """
         Финальная обработка заявки с ответами на вопросы
         
         Args:
-            ticket_text: Исходный текст заявки (уже обработанный)
-            questions: Вопросы, которые были заданы
+            ticket_text: Исходный текст заявки (уже обработанный); не нужен при session
+            questions: Вопросы, которые были заданы; не нужны при session
             answers: Ответы пользователя
+            timeout: Бюджет времени на запрос в секундах (по умолчанию из настроек)
+            session: Сессия из process_ticket: текст, вопросы и предсказание ML
+                берутся из нее без повторного прогона модели
             
         Returns:
             ClassificationResult с финальным результатом
         """
+        # В журнал пишется запрос без токена сессии: сессия к моменту воспроизведения истечет
+        request = {
+            "text": session.processed_text if session is not None else ticket_text,
+            "questions": session.questions if session is not None else questions,
+            "answers": answers
+        }
+        result: Optional[ClassificationResult] = None
+        error: Optional[str] = None
+        with tracing.span(ProcessingStage.FINAL_ANALYSIS.value) as final:
+            try:
+                result = await self._final_analysis(ticket_text, questions, answers, timeout, session)
+                return result
+            except BaseException as e:
+                error = repr(e)
+                raise
+            finally:
+                final.finish()
+                classification_log.log(
+                    "classify-with-answers",
+                    request,
+                    [],
+                    result.to_dict() if result is not None else None,
+                    final,
+                    error
+                )
+    
+    async def _final_analysis(
+        self,
+        ticket_text: Optional[str],
+        questions: Optional[List[str]],
+        answers: List[str],
+        timeout: Optional[float],
+        session: Optional[TicketSession]
+    ) -> ClassificationResult:
         try:
             logger.info("Финальный анализ с ответами")
             
-            # Используем QuestionGenerator для анализа с учетом ответов
-            final_class, final_confidence = await self.question_agent.analyze_with_answers(
-                ticket_text=ticket_text,
-                questions=questions,
-                answers=answers
-            )
+            mode = admission_controller.current_mode()
+            with deadline.deadline_scope(timeout or settings.resilience.request_deadline):
+                if session is not None:
+                    ticket_text, questions = session.processed_text, session.questions
+                
+                # Top-k классы ML модели сужают список классов в промпте
+                ml_prediction, answered_prediction = await self._final_predictions(ticket_text, answers, session)
+                # Для дообучения нужен эмбеддинг текста заявки без ответов: его видит ML стадия
+                ticket_prediction = ml_prediction
+                
+                if answered_prediction is not None:
+                    threshold = threshold_registry.get().ml(answered_prediction.ticket_class)
+                    if answered_prediction.confidence >= threshold:
+                        ANSWER_RECLASSIFICATIONS.labels(result="resolved").inc()
+                        LLM_CALLS_SAVED.labels(stage="final_llm").inc()
+                        median = latency_tracker.quantile("final_llm", 0.5)
+                        if median is not None:
+                            LLM_SECONDS_SAVED.labels(stage="final_llm").inc(median)
+                        
+                        logger.info(
+                            f"ML с учетом ответов: {answered_prediction.ticket_class} "
+                            f"({answered_prediction.confidence:.2%}), GigaChat не нужен"
+                        )
+                        if session is not None:
+                            await session_store.delete(session.token)
+                        CASCADE_TERMINAL_STAGE.labels(stage=ProcessingStage.COMPLETED.value).inc()
+                        return ClassificationResult(
+                            stage=ProcessingStage.COMPLETED,
+                            ticket_class=answered_prediction.ticket_class,
+                            confidence=answered_prediction.confidence,
+                            processed_text=ticket_text,
+                            reasoning="Классифицировано ML моделью с учетом ответов пользователя",
+                            mode=mode
+                        )
+                    
+                    # Top-k с учетом ответов точнее сужают промпт GigaChat
+                    ANSWER_RECLASSIFICATIONS.labels(result="llm").inc()
+                    ml_prediction = answered_prediction
+                
+                fallback = self._ml_fallback(ml_prediction, ticket_text, mode, recheck=False)
+                if fallback:
+                    fallback.mode = mode
+                    CASCADE_TERMINAL_STAGE.labels(stage=fallback.stage.value).inc()
+                    return fallback
+                
+                # Используем QuestionGenerator для анализа с учетом ответов
+                final_class, final_confidence = await self.question_agent.analyze_with_answers(
+                    ticket_text=ticket_text,
+                    questions=questions,
+                    answers=answers,
+                    candidates=self._final_candidates(ml_prediction, session)
+                )
+            
+            if session is not None:
+                await session_store.delete(session.token)
             
             logger.info(f"Финальная классификация: {final_class} ({final_confidence:.2%})")
+            CASCADE_TERMINAL_STAGE.labels(stage=ProcessingStage.COMPLETED.value).inc()
+            feedback_id = await self.feedback.record(
+                ticket_prediction,
+                final_class,
+                FeedbackSource.FINAL_ANALYSIS,
+                final_confidence,
+                ticket_text
+            )
             
             return ClassificationResult(
                 stage=ProcessingStage.COMPLETED,
                 ticket_class=final_class,
                 confidence=final_confidence,
                 processed_text=ticket_text,
-                reasoning="Классифицировано на основе дополнительных ответов пользователя"
+                reasoning="Классифицировано на основе дополнительных ответов пользователя",
+                mode=mode,
+                feedback_id=feedback_id
             )
             
         except Exception as e:
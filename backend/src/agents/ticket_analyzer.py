@@ -1,130 +1,530 @@
 """Агент для классификации заявок с использованием ML модели"""
+import asyncio
+import contextvars
 import logging
-import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional
 import joblib
 import torch
 import numpy as np
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoTokenizer, AutoModel, BatchEncoding
 
-from ..utils.model_downloader import ensure_models_available
+from src.core.clients.inference_client import inference_client
+from src.core.config import settings
+from src.core.metrics import timed_stage
+from src.core.thresholds import threshold_registry
+from ..utils.model_downloader import ensure_models_available, BERT_MODEL_DIR, LEGACY_TOKENIZER_FILE
 
 logger = logging.getLogger(__name__)
 
 
+class MLPrediction:
+    """Предсказание ML модели для одной заявки"""
+    
+    def __init__(
+        self,
+        ticket_class: str,
+        confidence: float,
+        top_classes: List[Tuple[str, float]],
+        embedding: np.ndarray,
+        encoder: Optional[str] = None
+    ):
+        self.ticket_class = ticket_class
+        self.confidence = confidence
+        self.top_classes = top_classes
+        self.embedding = embedding
+        # Версия, чьи веса RuBERT посчитали эмбеддинг
+        self.encoder = encoder
+
+
+class LazyEncoder:
+    """
+    RuBERT, загружаемый при первом обращении
+    
+    В режиме remote воркер держит только токенизатор и голову: веса RuBERT
+    нужны лишь при локальном расчете (сервер инференса недоступен, прогрев
+    версии-кандидата).
+    """
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self._model = None
+        self._lock = threading.Lock()
+    
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    logger.info(f"Загрузка RuBERT для локального расчета: {self.path}")
+                    model = AutoModel.from_pretrained(str(self.path))
+                    model.eval()
+                    self._model = model
+        return self._model
+
+
+class ModelVersion:
+    """
+    Артефакты одной версии модели: токенизатор, RuBERT и логистическая голова
+    
+    Пакет заявок целиком обрабатывается одной версией, поэтому замена
+    версии в агенте - одно присваивание: запросы, уже начавшие предсказание,
+    дорабатывают со старой версией.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        path: Path,
+        tokenizer,
+        model,
+        classifier,
+        encoder: str
+    ):
+        self.name = name
+        # Директория с головой версии (и головой, дообученной на обратной связи)
+        self.path = path
+        self.tokenizer = tokenizer
+        # Модель или LazyEncoder (режим remote)
+        self._model = model
+        self.classifier = classifier
+        # Версия, чьи веса RuBERT используются: эмбеддинги разных encoder несовместимы
+        self.encoder = encoder
+    
+    @property
+    def model(self):
+        if isinstance(self._model, LazyEncoder):
+            return self._model.get()
+        return self._model
+    
+    @property
+    def ready(self) -> bool:
+        return all([self.tokenizer, self._model, self.classifier])
+    
+    def with_classifier(self, classifier) -> "ModelVersion":
+        return ModelVersion(self.name, self.path, self.tokenizer, self._model, classifier, self.encoder)
+
+
 class TicketAnalyzerAgent:
     """
     Агент для классификации заявок с использованием обученной ML модели.
-    Если уверенность > 90%, возвращает результат.
+    Если уверенность не ниже порога предсказанного класса (см.
+    src.core.thresholds), возвращает результат.
     Иначе передает управление следующему агенту.
     """
     
-    CONFIDENCE_THRESHOLD = 0.90
+    MAX_LENGTH = 256
+    TOP_K = 10
     
-    def __init__(self):
-        self.tokenizer: Optional[AutoTokenizer] = None
-        self.model: Optional[AutoModel] = None
-        self.classifier = None
+    CLASSIFIER_FILE = "logistic_classifier_new_dataset.pkl"
+    # Голова, дообученная на обратной связи (см. FeedbackTrainer)
+    FEEDBACK_HEAD_FILE = "logistic_classifier_feedback.pkl"
+    
+    MODELS_DIR = Path(__file__).parent.parent.parent / "data" / "models"
+    # Реестр версий: data/models - версия base, data/models/versions/<имя> - остальные,
+    # в файле versions/ACTIVE - имя версии, загружаемой при старте
+    BASE_VERSION = "base"
+    VERSIONS_DIR = "versions"
+    ACTIVE_FILE = "ACTIVE"
+    
+    def __init__(self, models_dir: Optional[Path] = None, remote: Optional[bool] = None):
+        self.models_dir = Path(models_dir) if models_dir else self.MODELS_DIR
+        # Эмбеддинги от сервера инференса (по умолчанию - по settings.inference.mode)
+        self.remote = inference_client.enabled if remote is None else remote
+        self.version: Optional[ModelVersion] = None
+        # Теневая проверка версии-кандидата (см. ModelRegistry)
+        self.shadow = None
+        # Токенизация и прямой проход выполняются в отдельных потоках:
+        # Rust-токенизатор отпускает GIL, поэтому токенизация следующей заявки
+        # идет параллельно с вычислениями модели для предыдущей.
+        self._tokenizer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tokenizer")
+        self._inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
         self._load_models()
     
+    @property
+    def tokenizer(self):
+        return self.version.tokenizer if self.version else None
+    
+    @property
+    def model(self):
+        return self.version.model if self.version else None
+    
+    @property
+    def classifier(self):
+        return self.version.classifier if self.version else None
+    
     def _load_models(self):
-        """Загрузка моделей"""
+        """Загрузка активной версии моделей"""
         try:
-            models_dir = Path(__file__).parent.parent.parent / "data" / "models"
-            
-            if not ensure_models_available(models_dir):
+            if not ensure_models_available(self.models_dir):
                 logger.error("Не удалось загрузить модели")
                 return
             
-            tokenizer_path = models_dir / "tokenizer_new_dataset.pkl"
-            if tokenizer_path.exists():
-                self.tokenizer = joblib.load(str(tokenizer_path))
-            else:
-                logger.warning(f"Токенизатор не найден: {tokenizer_path}")
-            
-            bert_model_path = models_dir / "rubert-tiny2-local"
-            if bert_model_path.exists():
-                self.model = AutoModel.from_pretrained(str(bert_model_path))
-                self.model.eval()
-            else:
-                logger.warning(f"BERT модель не найдена: {bert_model_path}")
-            
-            classifier_path = models_dir / "logistic_classifier_new_dataset.pkl"
-            if classifier_path.exists():
-                self.classifier = joblib.load(str(classifier_path))
-            else:
-                logger.warning(f"Классификатор не найден: {classifier_path}")
+            name = self.active_version_name()
+            try:
+                self.version = self.load_version(name)
+            except Exception as e:
+                if name == self.BASE_VERSION:
+                    raise
+                logger.error(f"Не удалось загрузить версию модели {name}: {e}, используется {self.BASE_VERSION}")
+                self.version = self.load_version(self.BASE_VERSION)
             
-            if self.tokenizer and self.model and self.classifier:
-                logger.info("Модели успешно загружены")
+            if self.version.ready:
+                logger.info(f"Модели успешно загружены (версия {self.version.name})")
             else:
                 logger.error("Не все модели загружены")
-                
+        
         except Exception as e:
             logger.error(f"Ошибка при загрузке моделей: {e}")
             raise
     
+    def version_path(self, name: str) -> Path:
+        """Директория версии модели"""
+        if name == self.BASE_VERSION:
+            return self.models_dir
+        return self.models_dir / self.VERSIONS_DIR / name
+    
+    def active_version_name(self) -> str:
+        """Версия, выбранная через реестр, или base"""
+        active_path = self.models_dir / self.VERSIONS_DIR / self.ACTIVE_FILE
+        if active_path.exists():
+            name = active_path.read_text(encoding="utf-8").strip()
+            if name:
+                return name
+        return self.BASE_VERSION
+    
+    def load_version(self, name: str) -> ModelVersion:
+        """
+        Загрузка версии модели (долгая, выполняется вне event loop)
+        
+        Версия без своей директории rubert-tiny2-local использует RuBERT
+        версии base и отличается только головой.
+        
+        Args:
+            name: Имя версии
+        
+        Returns:
+            ModelVersion (без отсутствующих артефактов, см. ready)
+        """
+        path = self.version_path(name)
+        if not path.is_dir():
+            raise FileNotFoundError(f"Версия модели не найдена: {path}")
+        
+        own_encoder = name == self.BASE_VERSION or (path / BERT_MODEL_DIR).exists()
+        encoder_dir = path if own_encoder else self.models_dir
+        bert_model_path = encoder_dir / BERT_MODEL_DIR
+        tokenizer = self._load_tokenizer(encoder_dir)
+        
+        model = None
+        if bert_model_path.exists() and self.remote:
+            model = LazyEncoder(bert_model_path)
+        elif bert_model_path.exists():
+            model = AutoModel.from_pretrained(str(bert_model_path))
+            model.eval()
+        else:
+            logger.warning(f"BERT модель не найдена: {bert_model_path}")
+        
+        classifier = None
+        classifier_path = path / self.CLASSIFIER_FILE
+        if classifier_path.exists():
+            classifier = joblib.load(str(classifier_path))
+        else:
+            logger.warning(f"Классификатор не найден: {classifier_path}")
+        
+        feedback_head_path = path / self.FEEDBACK_HEAD_FILE
+        if settings.feedback.enabled and classifier is not None and feedback_head_path.exists():
+            feedback_head = joblib.load(str(feedback_head_path))
+            if list(feedback_head.classes_) == list(classifier.classes_):
+                classifier = feedback_head
+                logger.info(f"Загружена голова, дообученная на обратной связи: {feedback_head_path}")
+            else:
+                logger.warning(f"Классы головы {feedback_head_path} не совпадают с версией {name}")
+        
+        encoder = name if own_encoder else self.BASE_VERSION
+        return ModelVersion(name, path, tokenizer, model, classifier, encoder)
+    
+    def set_version(self, version: ModelVersion) -> Optional[ModelVersion]:
+        """
+        Атомарная замена версии модели
+        
+        Returns:
+            Предыдущая версия
+        """
+        previous, self.version = self.version, version
+        logger.info(f"Версия модели: {previous.name if previous else None} -> {version.name}")
+        return previous
+    
+    def set_classifier(self, classifier, version: Optional[ModelVersion] = None) -> bool:
+        """
+        Замена логистической головы без остановки сервиса
+        
+        Args:
+            classifier: Новая голова с теми же классами
+            version: Версия, для которой обучена голова; если активная версия
+                с тех пор сменилась, замена отменяется
+        
+        Returns:
+            False, если голова не подходит к активной версии
+        """
+        current = self.version
+        if current is None or (version is not None and current is not version):
+            logger.warning("Версия модели сменилась, замена головы отменена")
+            return False
+        if list(classifier.classes_) != list(current.classifier.classes_):
+            logger.warning("Классы новой головы не совпадают с текущими, замена отменена")
+            return False
+        self.version = current.with_classifier(classifier)
+        return True
+    
+    def _load_tokenizer(self, models_dir: Path):
+        """
+        Загрузка быстрого (Rust) токенизатора из директории модели.
+        Pickle-файл используется только как запасной вариант.
+        
+        Args:
+            models_dir: Директория с моделями
+        
+        Returns:
+            Токенизатор или None
+        """
+        bert_model_path = models_dir / BERT_MODEL_DIR
+        try:
+            tokenizer = AutoTokenizer.from_pretrained(str(bert_model_path), use_fast=True)
+            if not tokenizer.is_fast:
+                logger.warning("Загружен медленный Python-токенизатор, проверьте tokenizer.json")
+            return tokenizer
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить токенизатор из {bert_model_path}: {e}")
+        
+        legacy_path = models_dir / LEGACY_TOKENIZER_FILE
+        if legacy_path.exists():
+            logger.warning(f"Используется устаревший pickle-токенизатор: {legacy_path}")
+            return joblib.load(str(legacy_path))
+        
+        logger.warning(f"Токенизатор не найден: {bert_model_path}")
+        return None
+    
     async def analyze(self, text: str) -> Tuple[bool, Optional[str], Optional[float]]:
         """
         Анализ текста заявки
         
         Args:
             text: Текст заявки (уже обработанный abbreviation_convert)
-            
+        
         Returns:
             Tuple[should_continue, class_name, confidence]
             - should_continue: True если нужно передать следующему агенту
             - class_name: Название класса заявки (если определен)
             - confidence: Уверенность классификации (0-1)
         """
+        should_continue, prediction = await self.analyze_detailed(text)
+        if prediction is None:
+            return should_continue, None, None
+        return should_continue, prediction.ticket_class, prediction.confidence
+    
+    async def analyze_detailed(
+        self,
+        text: str,
+        prediction: Optional[MLPrediction] = None
+    ) -> Tuple[bool, Optional[MLPrediction]]:
+        """
+        Анализ текста заявки с top-k классами и эмбеддингом
+        
+        Args:
+            text: Текст заявки (уже обработанный abbreviation_convert)
+            prediction: Готовое предсказание по этому же тексту (например, из
+                проверки тематики), чтобы не прогонять модель повторно
+        
+        Returns:
+            Tuple[should_continue, prediction]
+            - should_continue: True если нужно передать следующему агенту
+            - prediction: Предсказание ML модели (None при ошибке)
+        """
         try:
-            if not all([self.tokenizer, self.model, self.classifier]):
+            if self.version is None or not self.version.ready:
                 logger.error("Модели не загружены")
-                return True, None, None
+                return True, None
             
-            predicted_class, confidence = self._predict(text)
+            if prediction is None:
+                prediction = (await self.predict([text]))[0]
             
-            if confidence >= self.CONFIDENCE_THRESHOLD:
-                return False, predicted_class, confidence
+            if prediction.confidence >= threshold_registry.get().ml(prediction.ticket_class):
+                return False, prediction
             else:
-                return True, predicted_class, confidence
-                
+                return True, prediction
+        
         except Exception as e:
             logger.error(f"Ошибка при анализе: {e}")
             # При ошибке передаем следующему агенту
-            return True, None, None
+            return True, None
     
-    def _predict(self, text: str) -> Tuple[str, float]:
+    async def predict(self, texts: List[str]) -> List[MLPrediction]:
         """
-        Предсказание класса заявки
+        Пакетное предсказание с top-k классами
         
         Args:
-            text: Текст заявки
-            
+            texts: Тексты заявок
+        
+        Returns:
+            Список MLPrediction в порядке входных текстов
+        """
+        # Версия фиксируется на весь пакет: замена версии не смешивает артефакты
+        version = self.version
+        started = time.perf_counter()
+        embeddings = await self._embed(texts, version)
+        predictions = self._predictions(embeddings, version)
+        
+        shadow = self.shadow
+        if shadow is not None:
+            shadow.observe(texts, predictions, time.perf_counter() - started)
+        return predictions
+    
+    def predict_sync(self, texts: List[str], version: ModelVersion) -> List[MLPrediction]:
+        """Предсказание заданной версией в текущем потоке (прогрев и теневая проверка)"""
+        return self._predictions(self.embed_sync(texts, version), version)
+    
+    def classify_embeddings(self, embeddings: np.ndarray, version: ModelVersion) -> List[MLPrediction]:
+        """Предсказания головы по готовым эмбеддингам заданной версии"""
+        return self._predictions(embeddings, version)
+    
+    def embed_sync(self, texts: List[str], version: ModelVersion) -> np.ndarray:
+        """Эмбеддинги заданной версией в текущем потоке"""
+        return self._encode(self._tokenize(texts, version), version)
+    
+    async def embed(self, texts: List[str], version: Optional[ModelVersion] = None) -> np.ndarray:
+        """
+        Получение эмбеддингов без блокировки event loop
+        
+        Args:
+            texts: Тексты заявок
+            version: Версия модели (по умолчанию активная)
+        
         Returns:
-            Tuple[class_name, confidence]
-        """
-        # Токенизация
-        inputs = self.tokenizer(
-            text, 
-            return_tensors="pt", 
-            truncation=True, 
-            padding=True, 
-            max_length=256
+            Матрица эмбеддингов [len(texts), hidden_size]
+        """
+        return await self._embed(texts, version or self.version)
+    
+    async def _embed(self, texts: List[str], version: ModelVersion) -> np.ndarray:
+        if self.remote:
+            embeddings = await inference_client.embed(texts, version.encoder)
+            if embeddings is not None:
+                return embeddings
+        
+        loop = asyncio.get_running_loop()
+        # Контекст копируется, чтобы span'ы из рабочих потоков попали в трассу запроса
+        inputs = await loop.run_in_executor(
+            self._tokenizer_executor, contextvars.copy_context().run, self._tokenize, texts, version
         )
+        return await loop.run_in_executor(
+            self._inference_executor, contextvars.copy_context().run, self._encode, inputs, version
+        )
+    
+    def _char_budget(self) -> int:
+        """Сколько символов текста может попасть в окна токенов"""
+        tokens = self.MAX_LENGTH
+        if settings.ml.long_text_enabled:
+            step = self.MAX_LENGTH - settings.ml.window_stride
+            tokens += step * (settings.ml.max_windows - 1)
+        return tokens * settings.ml.chars_per_token
+    
+    def _tokenize(self, texts: List[str], version: Optional[ModelVersion] = None) -> BatchEncoding:
+        """
+        Пакетная токенизация (быстрый токенизатор отпускает GIL)
         
-        # Получение эмбеддингов
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            # Берем [CLS] token embedding
-            embeddings = outputs.last_hidden_state[:, 0, :].numpy()
+        Текст предварительно обрезается по бюджету символов, чтобы не
+        токенизировать целиком длинные письма и логи. В режиме длинных заявок
+        текст режется на перекрывающиеся окна, не более max_windows на заявку;
+        поле overflow_to_sample_mapping связывает окна с исходными текстами.
         
-        # Предсказание класса
-        predicted_class = self.classifier.predict(embeddings)[0]
+        Args:
+            texts: Тексты заявок
+            version: Версия модели (по умолчанию активная)
         
-        # Получение вероятностей
-        probabilities = self.classifier.predict_proba(embeddings)[0]
-        confidence = np.max(probabilities)
+        Returns:
+            BatchEncoding для прямого прохода модели
+        """
+        tokenizer = (version or self.version).tokenizer
+        with timed_stage("tokenization", batch_size=len(texts)) as span:
+            budget = self._char_budget()
+            texts = [text[:budget] for text in texts]
+            
+            if not (settings.ml.long_text_enabled and tokenizer.is_fast):
+                return tokenizer(
+                    texts,
+                    return_tensors="pt",
+                    truncation=True,
+                    padding=True,
+                    max_length=self.MAX_LENGTH
+                )
+            
+            inputs = tokenizer(
+                texts,
+                return_tensors="pt",
+                truncation=True,
+                padding=True,
+                max_length=self.MAX_LENGTH,
+                stride=settings.ml.window_stride,
+                return_overflowing_tokens=True
+            )
+            
+            # Ограничиваем число окон на заявку, чтобы стоимость была предсказуемой
+            mapping = inputs["overflow_to_sample_mapping"]
+            window_index = torch.zeros_like(mapping)
+            for i in range(1, len(mapping)):
+                if mapping[i] == mapping[i - 1]:
+                    window_index[i] = window_index[i - 1] + 1
+            keep = window_index < settings.ml.max_windows
+            
+            if not bool(keep.all()):
+                seq_len = int(inputs["attention_mask"][keep].sum(dim=1).max())
+                for key in list(inputs.keys()):
+                    value = inputs[key][keep]
+                    inputs[key] = value if key == "overflow_to_sample_mapping" else value[:, :seq_len]
+            
+            span.set_attribute("windows", len(inputs["input_ids"]))
+            return inputs
+    
+    def _encode(self, inputs: BatchEncoding, version: Optional[ModelVersion] = None) -> np.ndarray:
+        """
+        Прямой проход модели, возвращает [CLS] эмбеддинги
         
-        return predicted_class, confidence
+        Все окна всех заявок обрабатываются одним батчем, затем эмбеддинги
+        окон одной заявки усредняются.
+        """
+        model = (version or self.version).model
+        with timed_stage("forward", batch_size=len(inputs["input_ids"])):
+            inputs = dict(inputs)
+            mapping = inputs.pop("overflow_to_sample_mapping", None)
+            
+            with torch.inference_mode():
+                outputs = model(**inputs)
+                embeddings = outputs.last_hidden_state[:, 0, :].numpy()
+            
+            if mapping is None:
+                return embeddings
+            
+            mapping = mapping.numpy()
+            n_texts = int(mapping.max()) + 1
+            pooled = np.zeros((n_texts, embeddings.shape[1]), dtype=embeddings.dtype)
+            np.add.at(pooled, mapping, embeddings)
+            counts = np.bincount(mapping, minlength=n_texts).astype(embeddings.dtype)
+            return pooled / counts[:, None]
+    
+    def _predictions(self, embeddings: np.ndarray, version: Optional[ModelVersion] = None) -> List[MLPrediction]:
+        """Предсказания с top-k классами по эмбеддингам"""
+        version = version or self.version
+        classifier = version.classifier
+        with timed_stage("classifier_head", batch_size=len(embeddings)):
+            probabilities = classifier.predict_proba(embeddings)
+            top = np.argsort(-probabilities, axis=1)[:, :self.TOP_K]
+        predictions = []
+        for row, indices in enumerate(top):
+            top_classes = [
+                (str(classifier.classes_[idx]), float(probabilities[row, idx]))
+                for idx in indices
+            ]
+            ticket_class, confidence = top_classes[0]
+            predictions.append(MLPrediction(ticket_class, confidence, top_classes, embeddings[row], version.encoder))
+        return predictions
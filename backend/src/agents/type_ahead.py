@@ -0,0 +1,150 @@
+"""
+Подсказка класса при наборе заявки (/classify/fast)
+
+Работает только локальный путь: RuBERT и голова классификатора, без
+GigaChat и остальных стадий каскада. Словаря сокращений в проекте нет (их
+раскрывает GigaChat), поэтому текст идет в модель как есть.
+
+Запросы приходят на каждое нажатие клавиши (после debounce на клиенте), и
+соседние запросы отличаются хвостом последнего слова. Эмбеддинг считается по
+тексту до последнего законченного слова и кешируется (LRU) с ключом по версии
+RuBERT. Пока пользователь набирает слово, модель не вызывается: голова
+(доли миллисекунды) применяется к эмбеддингу из кеша. Сама голова не
+кешируется, поэтому после дообучения на обратной связи подсказки сразу
+используют новую.
+
+Прямой проход выполняется в собственном потоке, а не в общем потоке
+инференса, чтобы короткий запрос подсказки не ждал пакеты массовой обработки.
+"""
+import asyncio
+import contextvars
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.core.config import TypeAheadConfig, settings
+from src.core.metrics import record_cache, timed_stage
+
+from .ticket_analyzer import ModelVersion, TicketAnalyzerAgent
+
+_LAST_WORD = re.compile(r"\w+$")
+_SPACES = re.compile(r"\s+")
+
+
+class TypeAheadResult:
+    """Подсказка по набираемому тексту"""
+    
+    def __init__(
+        self,
+        top_classes: List[Tuple[str, float]],
+        prefix: str,
+        cached: bool,
+        version: Optional[str]
+    ):
+        self.top_classes = top_classes
+        # Текст, по которому посчитан эмбеддинг
+        self.prefix = prefix
+        self.cached = cached
+        self.version = version
+    
+    def to_dict(self) -> Dict:
+        return {
+            "top_classes": [
+                {"ticket_class": name, "probability": probability}
+                for name, probability in self.top_classes
+            ],
+            "prefix": self.prefix,
+            "cached": self.cached,
+            "version": self.version
+        }
+
+
+class TypeAheadAgent:
+    """Top-k классы ML модели для набираемого текста с кешем эмбеддингов префиксов"""
+    
+    def __init__(self, ml_agent: TicketAnalyzerAgent, config: Optional[TypeAheadConfig] = None):
+        self.ml_agent = ml_agent
+        self.config = config or settings.type_ahead
+        self._cache: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        # Эмбеддинги, которые уже считаются: одинаковые запросы ждут один расчет
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="type-ahead")
+    
+    def prefix(self, text: str) -> str:
+        """Часть текста, по которой считается эмбеддинг"""
+        text = text[:self.config.max_chars]
+        if self.config.complete_words_only:
+            # Недописанное последнее слово отбрасывается, если перед ним что-то есть
+            head = _LAST_WORD.sub("", text)
+            if head.strip():
+                text = head
+        return _SPACES.sub(" ", text).strip()
+    
+    async def suggest(self, text: str) -> TypeAheadResult:
+        """
+        Top-k классы для набираемого текста
+        
+        Args:
+            text: Текст заявки в момент запроса
+        
+        Returns:
+            TypeAheadResult; для текста короче min_chars - без классов
+        
+        Raises:
+            RuntimeError: ML модель не загружена
+        """
+        # Версия фиксируется на весь запрос, как в TicketAnalyzerAgent.predict
+        version = self.ml_agent.version
+        if version is None or not version.ready:
+            raise RuntimeError("ML модель не загружена")
+        
+        prefix = self.prefix(text)
+        if len(prefix) < self.config.min_chars:
+            return TypeAheadResult([], prefix, False, version.name)
+        
+        with timed_stage("type_ahead") as span:
+            key = (version.encoder, prefix)
+            embedding = self._cache.get(key)
+            cached = embedding is not None
+            record_cache("type_ahead", hit=cached)
+            if cached:
+                self._cache.move_to_end(key)
+            else:
+                embedding = await self._embedding(key, version)
+            span.set_attribute("cached", cached)
+            
+            prediction = self.ml_agent.classify_embeddings(embedding[None, :], version)[0]
+        return TypeAheadResult(prediction.top_classes[:self.config.top_k], prefix, cached, version.name)
+    
+    async def _embedding(self, key: Tuple[str, str], version: ModelVersion) -> np.ndarray:
+        future = self._pending.get(key)
+        if future is None:
+            # Расчет общий для всех ждущих запросов: пустой контекст, чтобы в
+            # него не попали трасса и дедлайн запроса, который его начал
+            future = asyncio.get_running_loop().create_task(
+                self._compute(key, version), context=contextvars.Context()
+            )
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        # Отмена одного запроса не отменяет расчет для остальных
+        return await asyncio.shield(future)
+    
+    async def _compute(self, key: Tuple[str, str], version: ModelVersion) -> np.ndarray:
+        prefix = key[1]
+        if self.ml_agent.remote:
+            # Сервер инференса сам собирает пакеты; локальный RuBERT не загружается
+            embeddings = await self.ml_agent.embed([prefix], version)
+        else:
+            loop = asyncio.get_running_loop()
+            embeddings = await loop.run_in_executor(
+                self._executor, contextvars.copy_context().run, self.ml_agent.embed_sync, [prefix], version
+            )
+        
+        embedding = embeddings[0]
+        self._cache[key] = embedding
+        while len(self._cache) > self.config.cache_size:
+            self._cache.popitem(last=False)
+        return embedding
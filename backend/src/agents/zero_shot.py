@@ -0,0 +1,218 @@
+"""
+Zero-shot стадия каскада по названиям классов из промпта
+
+Названия классов (список классов в data/prompts/prompt.txt) прогоняются через
+тот же RuBERT, что и заявки, один раз на версию промпта и модели. Эмбеддинг
+заявки к этому моменту уже посчитан ML стадией, поэтому сама стадия - одно
+умножение матрицы на вектор, доли миллисекунды. Заявка принимается без
+GigaChat, если выполнены три условия:
+- ближайшее по косинусной близости описание относится к top-1 классу
+  логистической головы;
+- отрыв этого описания от второго не меньше min_margin;
+- вероятность класса у головы не ниже min_probability.
+Голова обучена на заявках, а названия классов написаны независимо. Такие две
+оценки редко ошибаются одинаково, поэтому их согласие заменяет высокий порог
+уверенности ML стадии. Не у всех классов головы есть пара в промпте: такие
+заявки стадия не принимает (no_description).
+
+Стадия выключена по умолчанию (ZERO_SHOT__ENABLED): пороги min_probability и
+min_margin нужно сначала подобрать симулятором каскада (benchmarks/cascade.py).
+"""
+import asyncio
+import logging
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.core.config import ZeroShotConfig, settings
+from src.core.metrics import ZERO_SHOT_DECISIONS, timed_stage
+from src.core.prompts import prompt_registry
+
+from .ticket_analyzer import MLPrediction, ModelVersion, TicketAnalyzerAgent
+
+logger = logging.getLogger(__name__)
+
+
+class ZeroShotDecision(str, Enum):
+    ACCEPTED = "accepted"
+    DISAGREE = "disagree"
+    LOW_MARGIN = "low_margin"
+    LOW_PROBABILITY = "low_probability"
+    # У top-1 класса головы нет описания в промпте
+    NO_DESCRIPTION = "no_description"
+    UNAVAILABLE = "unavailable"
+
+
+class ZeroShotResult:
+    """Решение zero-shot стадии по одной заявке"""
+    
+    def __init__(
+        self,
+        decision: ZeroShotDecision,
+        ticket_class: Optional[str] = None,
+        similarity: Optional[float] = None,
+        margin: Optional[float] = None
+    ):
+        self.decision = decision
+        # Класс ближайшего описания
+        self.ticket_class = ticket_class
+        self.similarity = similarity
+        self.margin = margin
+    
+    @property
+    def accepted(self) -> bool:
+        return self.decision == ZeroShotDecision.ACCEPTED
+    
+    def to_dict(self) -> Dict:
+        return {
+            "decision": self.decision,
+            "ticket_class": self.ticket_class,
+            "similarity": self.similarity,
+            "margin": self.margin
+        }
+
+
+class ClassDescriptions:
+    """Нормированные эмбеддинги описаний классов для версии промпта и модели"""
+    
+    def __init__(self, key: Tuple[str, str], encoder: str, classes: List[str], embeddings: np.ndarray):
+        self.key = key
+        self.encoder = encoder
+        self.classes = classes
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True) if len(classes) else 1.0
+        self.embeddings = embeddings / np.maximum(norms, 1e-12)
+        self.index = {name: position for position, name in enumerate(classes)}
+
+
+class ZeroShotAgent:
+    """Классификация по согласию логистической головы и описаний классов"""
+    
+    def __init__(self, ml_agent: TicketAnalyzerAgent, config: Optional[ZeroShotConfig] = None):
+        self.ml_agent = ml_agent
+        self.config = config or settings.zero_shot
+        self._descriptions: Optional[ClassDescriptions] = None
+        self._lock = asyncio.Lock()
+        if self.config.enabled:
+            self._warmup()
+    
+    def _warmup(self):
+        # Эмбеддинги описаний считаются при старте, чтобы первая заявка их не ждала.
+        # В режиме remote - при первой заявке: сервер инференса может стартовать позже воркера
+        version = self.ml_agent.version
+        if version is None or not version.ready or self.ml_agent.remote:
+            return
+        try:
+            classes, descriptions = self._class_descriptions(version)
+            embeddings = None
+            if classes:
+                with timed_stage("zero_shot_index", classes=len(classes)):
+                    embeddings = self.ml_agent.embed_sync(descriptions, version)
+            self._descriptions = self._index(self._key(version), version, classes, embeddings)
+        except Exception as e:
+            logger.error(f"Не удалось посчитать эмбеддинги описаний классов: {e}")
+    
+    @staticmethod
+    def _key(version: ModelVersion) -> Tuple[str, str]:
+        return prompt_registry.version(), version.name
+    
+    @staticmethod
+    def _class_descriptions(version: ModelVersion) -> Tuple[List[str], List[str]]:
+        """Классы головы, у которых есть описание в промпте, и их описания"""
+        prompt = prompt_registry.classification()
+        classes, descriptions = [], []
+        for name in version.classifier.classes_:
+            description = prompt.find_class(str(name))
+            if description:
+                classes.append(str(name))
+                descriptions.append(description)
+        return classes, descriptions
+    
+    @staticmethod
+    def _index(
+        key: Tuple[str, str],
+        version: ModelVersion,
+        classes: List[str],
+        embeddings: Optional[np.ndarray]
+    ) -> ClassDescriptions:
+        if not classes:
+            return ClassDescriptions(key, version.encoder, [], np.empty((0, 0), dtype=np.float32))
+        logger.info(
+            f"Эмбеддинги описаний {len(classes)} классов посчитаны (промпт {key[0]}, модель {key[1]})"
+        )
+        return ClassDescriptions(key, version.encoder, classes, embeddings)
+    
+    async def _current(self) -> Optional[ClassDescriptions]:
+        """Эмбеддинги описаний для текущих промпта и модели"""
+        version = self.ml_agent.version
+        if version is None or not version.ready:
+            return None
+        key = self._key(version)
+        descriptions = self._descriptions
+        if descriptions is not None and descriptions.key == key:
+            return descriptions
+        
+        async with self._lock:
+            if self._descriptions is None or self._descriptions.key != key:
+                # Промпт или модель сменились: пересчет в рабочих потоках
+                # (или на сервере инференса), event loop не блокируется
+                classes, descriptions = self._class_descriptions(version)
+                embeddings = None
+                if classes:
+                    with timed_stage("zero_shot_index", classes=len(classes)):
+                        embeddings = await self.ml_agent.embed(descriptions, version)
+                self._descriptions = self._index(key, version, classes, embeddings)
+            return self._descriptions
+    
+    async def analyze(self, prediction: Optional[MLPrediction]) -> ZeroShotResult:
+        """
+        Решение по заявке, которую ML стадия не завершила
+        
+        Args:
+            prediction: Предсказание ML стадии (с эмбеддингом)
+        
+        Returns:
+            ZeroShotResult; при accepted класс заявки - prediction.ticket_class
+        """
+        result = await self._analyze(prediction)
+        ZERO_SHOT_DECISIONS.labels(result=result.decision.value).inc()
+        return result
+    
+    async def _analyze(self, prediction: Optional[MLPrediction]) -> ZeroShotResult:
+        if not self.config.enabled or prediction is None or prediction.embedding is None:
+            return ZeroShotResult(ZeroShotDecision.UNAVAILABLE)
+        try:
+            descriptions = await self._current()
+        except Exception as e:
+            logger.error(f"Ошибка zero-shot стадии: {e}")
+            return ZeroShotResult(ZeroShotDecision.UNAVAILABLE)
+        
+        if descriptions is None or len(descriptions.classes) < 2:
+            return ZeroShotResult(ZeroShotDecision.UNAVAILABLE)
+        # Эмбеддинг другой версии RuBERT несравним с описаниями (идет замена модели)
+        if prediction.encoder is not None and prediction.encoder != descriptions.encoder:
+            return ZeroShotResult(ZeroShotDecision.UNAVAILABLE)
+        
+        with timed_stage("zero_shot"):
+            return self.score(descriptions, prediction)
+    
+    def score(self, descriptions: ClassDescriptions, prediction: MLPrediction) -> ZeroShotResult:
+        """Сравнение эмбеддинга заявки с описаниями и решение о приеме"""
+        embedding = prediction.embedding / max(float(np.linalg.norm(prediction.embedding)), 1e-12)
+        similarities = descriptions.embeddings @ embedding
+        first, second = np.argsort(-similarities)[:2]
+        ticket_class = descriptions.classes[first]
+        similarity = float(similarities[first])
+        margin = float(similarities[first] - similarities[second])
+        
+        if prediction.ticket_class not in descriptions.index:
+            decision = ZeroShotDecision.NO_DESCRIPTION
+        elif prediction.confidence < self.config.min_probability:
+            decision = ZeroShotDecision.LOW_PROBABILITY
+        elif ticket_class != prediction.ticket_class:
+            decision = ZeroShotDecision.DISAGREE
+        elif margin < self.config.min_margin:
+            decision = ZeroShotDecision.LOW_MARGIN
+        else:
+            decision = ZeroShotDecision.ACCEPTED
+        return ZeroShotResult(decision, ticket_class, similarity, margin)
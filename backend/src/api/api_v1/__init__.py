@@ -1,10 +1,12 @@
 """API v1 endpoints"""
 
 from fastapi import APIRouter
-from . import tickets
+from . import tickets, debug, admin
 
 router = APIRouter(prefix="/api/v1")
 
 router.include_router(tickets.router)
+router.include_router(debug.router)
+router.include_router(admin.router)
 
 __all__ = ["router"]
@@ -0,0 +1,162 @@
+"""Административные endpoints (доступны только с X-Admin-Token)"""
+import asyncio
+import secrets
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from src.core.config import settings
+from src.core.profiling import SamplingProfiler
+from src.core.schemas import FeedbackCorrection
+
+from . import tickets
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Проверка токена администратора; без настроенного токена endpoints скрыты"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+# В воркере одновременно работает не больше одного профилировщика
+_profile_lock = asyncio.Lock()
+
+
+@router.get("/profile")
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(10.0),
+    format: Literal["collapsed", "speedscope"] = Query("collapsed")
+):
+    """
+    Семплирующий профиль текущего воркера
+    
+    Снимает стеки всех потоков (event loop, потоки токенизации и инференса)
+    в течение seconds секунд.
+    
+    Args:
+        seconds: Длительность профилирования
+        interval_ms: Интервал между снимками стеков
+        format: collapsed (flamegraph.pl, speedscope) или speedscope (JSON)
+    """
+    if seconds > settings.profiling.max_seconds:
+        raise HTTPException(status_code=422, detail=f"seconds > {settings.profiling.max_seconds}")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="Профилирование уже запущено")
+    
+    async with _profile_lock:
+        profiler = SamplingProfiler(interval=max(interval_ms, settings.profiling.min_interval_ms) / 1000)
+        # Семплирование идет в отдельном потоке, event loop продолжает обслуживать запросы
+        await asyncio.to_thread(profiler.run, seconds)
+    
+    if format == "speedscope":
+        return JSONResponse(
+            profiler.speedscope(),
+            headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'}
+        )
+    return PlainTextResponse(
+        profiler.collapsed(),
+        headers={"Content-Disposition": 'attachment; filename="profile.collapsed.txt"'}
+    )
+
+
+@router.get("/feedback")
+async def feedback_stats():
+    """Число примеров обратной связи по источникам и отчет последнего дообучения"""
+    return await tickets.agent_system.feedback.stats()
+
+
+@router.post("/feedback")
+async def correct_feedback(request: FeedbackCorrection):
+    """
+    Исправление класса заявки оператором
+    
+    Исправление по feedback_id заменяет класс, выставленный GigaChat; по
+    тексту заявки (например, ошибка ML стадии, у которой feedback_id нет)
+    добавляется новый пример. Исправления весят больше автоматической
+    разметки при дообучении. Класс «нет классов» помечает заявку не по теме
+    IT - пример для модели тематики.
+    """
+    trainer = tickets.agent_system.feedback
+    if not trainer.enabled:
+        raise HTTPException(status_code=409, detail="Сбор обратной связи отключен")
+    if not (trainer.known_class(request.ticket_class) or trainer.out_of_scope(request.ticket_class)):
+        raise HTTPException(status_code=422, detail=f"Неизвестный класс: {request.ticket_class}")
+    
+    feedback_id = await trainer.correct(request.ticket_class, feedback_id=request.feedback_id, text=request.text)
+    if feedback_id is None:
+        raise HTTPException(status_code=404, detail="Пример не найден")
+    return {"feedback_id": feedback_id, "ticket_class": request.ticket_class}
+
+
+@router.post("/feedback/refit")
+async def refit_classifier(force: bool = Query(False)):
+    """
+    Немедленное дообучение головы ML модели на обратной связи
+    
+    Args:
+        force: Дообучить, даже если выборка не менялась с прошлого раза
+    """
+    return await tickets.agent_system.feedback.refit(force=force)
+
+
+@router.post("/relevance/refit")
+async def refit_relevance(force: bool = Query(False)):
+    """
+    Немедленное обучение модели тематики на обратной связи
+    
+    Args:
+        force: Обучить, даже если выборка не менялась с прошлого раза
+    """
+    return await tickets.agent_system.relevance_gate.refit(force=force)
+
+
+@router.get("/models")
+async def model_versions():
+    """Активная версия ML модели, доступные версии и состояние кандидата"""
+    return tickets.agent_system.model_registry.describe()
+
+
+@router.post("/models/{version}/load", status_code=202)
+async def load_model_version(
+    version: str,
+    shadow: bool = Query(True),
+    promote: bool = Query(False)
+):
+    """
+    Фоновая загрузка и прогрев версии из data/models/versions
+    
+    Args:
+        version: Имя версии (директория в data/models/versions или base)
+        shadow: После прогрева сравнивать кандидата с активной версией на доле
+            живых запросов (см. GET /admin/models)
+        promote: Заменить активную версию сразу после прогрева
+    """
+    try:
+        return tickets.agent_system.model_registry.load(version, shadow=shadow, promote=promote)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Версия модели не найдена: {version}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/models/promote")
+async def promote_model_version():
+    """Атомарная замена активной версии загруженным кандидатом"""
+    try:
+        return tickets.agent_system.model_registry.promote()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.delete("/models/candidate")
+async def discard_model_version():
+    """Отмена кандидата и теневой проверки"""
+    registry = tickets.agent_system.model_registry
+    registry.discard()
+    return registry.describe()
@@ -0,0 +1,22 @@
+"""Отладочные endpoints"""
+from fastapi import APIRouter, HTTPException, Query
+
+from src.core.config import settings
+from src.core.tracing import tracer
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+@router.get("/traces")
+async def slow_traces(limit: int = Query(20, ge=1, le=100)):
+    """
+    Последние медленные трассы запросов (дерево span'ов по стадиям)
+    
+    Доступно только при DEBUG=True.
+    """
+    if not settings.debug:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {
+        "slow_threshold_ms": settings.tracing.slow_threshold_ms,
+        "traces": tracer.recent_slow(limit)
+    }
@@ -1,39 +1,53 @@
 """Endpoints для работы с заявками"""
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from typing import List
+import json
+from fastapi import APIRouter, HTTPException, UploadFile, File, Header
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict
 
 from src.core.schemas import (
     TicketRequest, 
     TicketWithAnswersRequest,
-    AnalysisResult,
-    AgentClassificationResult
+    AgentClassificationResult,
+    BulkAnalysisResult,
+    FastClassificationResult,
+    RecheckResult
 )
 from src.services import TicketAnalyzerService
 from src.agents import SystemControlAgent
+from src.core.clients import Priority, llm_priority
+from src.core.sessions import session_store
 
 router = APIRouter(tags=["tickets"])
 
 agent_system = SystemControlAgent()
+bulk_service = TicketAnalyzerService(agent_system)
 
 
 @router.post("/classify", response_model=AgentClassificationResult)
-async def classify_ticket(request: TicketRequest) -> AgentClassificationResult:
+async def classify_ticket(
+    request: TicketRequest,
+    x_priority: Priority = Header(Priority.INTERACTIVE)
+) -> AgentClassificationResult:
     """
     Классификация заявки через систему агентов
     
     Цепочка обработки:
     1. AbbreviationConvert - исправление аббревиатур
     2. TicketAnalyzer (ML) - классификация с ML моделью
-       - Если уверенность >= 90% -> возврат результата
+       - Если уверенность не ниже порога класса (по умолчанию 90%) -> возврат результата
     3. DeepTicketAnalyzer (GigaChat) - глубокий анализ
        - Если удалось классифицировать -> возврат результата
     4. QuestionGenerator - генерация вопросов для уточнения
     
+    Пакетные клиенты передают заголовок X-Priority: bulk, чтобы их вызовы
+    GigaChat не вытесняли интерактивные запросы.
+    
     Returns:
         Результат классификации или список вопросов для уточнения
     """
     try:
-        result = await agent_system.process_ticket(request.text)
+        with llm_priority(x_priority):
+            result = await agent_system.process_ticket(request.text)
         return AgentClassificationResult(**result.to_dict())
     except Exception as e:
         raise HTTPException(
@@ -42,12 +56,80 @@ async def classify_ticket(request: TicketRequest) -> AgentClassificationResult:
         )
 
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Событие в формате Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=float)}\n\n"
+
+
+@router.post("/classify/stream")
+async def classify_ticket_stream(
+    request: TicketRequest,
+    x_priority: Priority = Header(Priority.INTERACTIVE)
+) -> StreamingResponse:
+    """
+    Классификация заявки с потоковой выдачей результатов стадий (SSE)
+    
+    События по мере готовности стадий:
+    - mode - режим обслуживания
+    - abbreviation - текст после раскрытия сокращений
+    - ml - класс, уверенность и top-k классы ML модели
+    - deep - результат глубокого анализа GigaChat
+    - question_token - фрагмент ответа GigaChat при генерации вопросов
+    - question - очередной разобранный вопрос
+    - result - итог в том же формате, что у /classify
+    - error - ошибка обработки (поток завершается)
+    
+    Первое полезное событие (ml) приходит через время работы ML модели,
+    даже если весь каскад занимает секунды.
+    """
+    async def events() -> AsyncIterator[str]:
+        with llm_priority(x_priority):
+            try:
+                async for event, payload in agent_system.stream_ticket(request.text):
+                    yield _sse(event, payload)
+            except Exception as e:
+                yield _sse("error", {"detail": f"Ошибка при классификации заявки: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Прокси не должны буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/classify/fast", response_model=FastClassificationResult)
+async def classify_ticket_fast(request: TicketRequest) -> FastClassificationResult:
+    """
+    Подсказка класса по набираемому тексту заявки
+    
+    Только ML модель: без сокращений, GigaChat и вопросов, поэтому ответ
+    приходит за миллисекунды и endpoint можно вызывать на нажатия клавиш.
+    Эмбеддинг считается по тексту до последнего законченного слова и
+    кешируется: пока набирается слово, модель не вызывается.
+    
+    Returns:
+        Top-k классы ML модели с вероятностями
+    """
+    try:
+        result = await agent_system.type_ahead_agent.suggest(request.text)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return FastClassificationResult(**result.to_dict())
+
+
 @router.post("/classify-with-answers", response_model=AgentClassificationResult)
-async def classify_with_answers(request: TicketWithAnswersRequest) -> AgentClassificationResult:
+async def classify_with_answers(
+    request: TicketWithAnswersRequest,
+    x_priority: Priority = Header(Priority.INTERACTIVE)
+) -> AgentClassificationResult:
     """
     Финальная классификация заявки с ответами на вопросы
     
     Используется когда система сгенерировала вопросы и получила на них ответы.
+    Достаточно передать session_token из ответа /classify и ответы: текст,
+    вопросы и результаты ML модели берутся из серверной сессии. Без токена
+    нужно передать text и questions.
     
     Args:
         request: Заявка с вопросами и ответами
@@ -55,12 +137,20 @@ async def classify_with_answers(request: TicketWithAnswersRequest) -> AgentClass
     Returns:
         Финальный результат классификации
     """
+    session = None
+    if request.session_token:
+        session = await session_store.get(request.session_token)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Сессия не найдена или истекла")
+    
     try:
-        result = await agent_system.process_with_answers(
-            ticket_text=request.text,
-            questions=request.questions,
-            answers=request.answers
-        )
+        with llm_priority(x_priority):
+            result = await agent_system.process_with_answers(
+                ticket_text=request.text,
+                questions=request.questions,
+                answers=request.answers,
+                session=session
+            )
         return AgentClassificationResult(**result.to_dict())
     except Exception as e:
         raise HTTPException(
@@ -69,6 +159,46 @@ async def classify_with_answers(request: TicketWithAnswersRequest) -> AgentClass
         )
 
 
+@router.post("/analyze-excel", response_model=BulkAnalysisResult)
+async def analyze_excel(file: UploadFile = File(...)) -> BulkAnalysisResult:
+    """
+    Массовая классификация заявок из Excel файла
+    
+    Текст заявки берется из колонки text, текст, описание, заявка или
+    description, иначе из первой колонки. Одинаковые и почти одинаковые
+    заявки (одна авария от нескольких подразделений) группируются: каскад
+    проходит одна заявка группы, остальные получают ее результат с
+    близостью к ней. Вызовы GigaChat идут с пакетным приоритетом.
+    
+    Returns:
+        Результаты по строкам и сводка: группы, вызовы GigaChat и время в
+        сравнении с обработкой каждой заявки
+    """
+    content = await file.read()
+    try:
+        return await bulk_service.analyze_excel(content)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/recheck/{recheck_id}", response_model=RecheckResult)
+async def get_recheck(recheck_id: str) -> RecheckResult:
+    """
+    Результат отложенной перепроверки заявки
+    
+    В деградированном режиме /classify возвращает ответ ML модели с флагом
+    low_confidence и recheck_id; глубокий анализ выполняется в фоне после
+    снятия перегрузки.
+    
+    Returns:
+        Статус перепроверки и, если она завершена, класс заявки
+    """
+    job = agent_system.recheck_queue.get(recheck_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Перепроверка не найдена или устарела")
+    return RecheckResult(**job.to_dict())
+
+
 @router.get("/health")
 async def health_check():
     """Проверка работоспособности сервиса"""
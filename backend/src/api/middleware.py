@@ -0,0 +1,41 @@
+"""ASGI middleware приложения"""
+from src.core.tracing import tracer
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+class TracingMiddleware:
+    """
+    Трасса на каждый HTTP запрос.
+    Request ID берется из заголовка X-Request-ID или генерируется; в ответ
+    добавляются X-Request-ID и Server-Timing с длительностями стадий.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(REQUEST_ID_HEADER, b"").decode("latin-1")[:64] or None
+        trace = tracer.start_trace(f"{scope['method']} {scope['path']}", request_id)
+        
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                response_headers = list(message.get("headers", []))
+                response_headers.append((REQUEST_ID_HEADER, trace.request_id.encode("latin-1")))
+                timings = ", ".join(
+                    f"{name};dur={duration:.1f}" for name, duration in trace.stage_durations().items()
+                )
+                if timings:
+                    response_headers.append((b"server-timing", timings.encode("latin-1")))
+                message = {**message, "headers": response_headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            tracer.finish_trace(trace)
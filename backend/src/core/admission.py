@@ -0,0 +1,114 @@
+"""
+Контроль допуска: переключение в деградированный режим под перегрузкой
+
+Когда заканчивается квота GigaChat, растет очередь вызовов или задержка
+стадий LLM, либо event loop не успевает обслуживать запросы, каскад
+переходит в режим degraded: без сокращений и GigaChat, с ответом ML top-k
+и отложенной перепроверкой. Обратно в normal сервис возвращается только
+после recovery_seconds без сигналов перегрузки, чтобы режим не «дребезжал».
+"""
+import asyncio
+import logging
+import time
+from enum import Enum
+from typing import Optional
+
+from src.core.clients.resilience import circuit_breaker, latency_tracker
+from src.core.clients.scheduler import Priority, gigachat_scheduler
+from src.core.config import AdmissionConfig, settings
+from src.core.metrics import EVENT_LOOP_LAG, SERVICE_MODE, SERVICE_MODE_CHANGES
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceMode(str, Enum):
+    """Режимы обслуживания заявок"""
+    NORMAL = "normal"
+    DEGRADED = "degraded"
+
+
+class AdmissionController:
+    """Выбор режима обслуживания по сигналам перегрузки"""
+    
+    def __init__(self, config: Optional[AdmissionConfig] = None):
+        self.config = config or settings.admission
+        self.mode = ServiceMode.NORMAL
+        self.reason: Optional[str] = None
+        self.loop_lag = 0.0
+        self._calm_since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Запуск замера отставания event loop"""
+        self._task = loop.create_task(self._probe_loop())
+    
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+    
+    async def _probe_loop(self):
+        interval = self.config.loop_probe_interval_ms / 1000
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.monotonic() - started - interval)
+            # Сглаживание: единичная задержка не переключает режим
+            self.loop_lag = 0.7 * self.loop_lag + 0.3 * lag
+            EVENT_LOOP_LAG.set(self.loop_lag)
+    
+    def overload_reason(self) -> Optional[str]:
+        """Первый сработавший сигнал перегрузки или None"""
+        if circuit_breaker.is_open:
+            return "circuit_open"
+        if gigachat_scheduler.paused:
+            return "rate_limited"
+        if gigachat_scheduler.queue_depth(Priority.INTERACTIVE) >= self.config.max_llm_queue:
+            return "llm_queue"
+        if self.loop_lag * 1000 >= self.config.max_loop_lag_ms:
+            return "loop_lag"
+        for stage in latency_tracker.stages:
+            p95 = latency_tracker.quantile(stage, 0.95, max_age=self.config.latency_window)
+            if p95 is not None and p95 >= self.config.max_llm_p95:
+                return "llm_latency"
+        return None
+    
+    def current_mode(self) -> ServiceMode:
+        """
+        Режим для очередного запроса
+        
+        В degraded сервис переходит сразу при любом сигнале перегрузки,
+        а возвращается только после recovery_seconds без сигналов.
+        """
+        if self.config.force_mode:
+            mode = ServiceMode(self.config.force_mode)
+            SERVICE_MODE.set(1 if mode == ServiceMode.DEGRADED else 0)
+            return mode
+        if not self.config.enabled:
+            return ServiceMode.NORMAL
+        
+        reason = self.overload_reason()
+        now = time.monotonic()
+        if reason:
+            self._calm_since = None
+            if self.mode != ServiceMode.DEGRADED:
+                self._switch(ServiceMode.DEGRADED, reason)
+        elif self.mode == ServiceMode.DEGRADED:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.config.recovery_seconds:
+                self._switch(ServiceMode.NORMAL, "recovered")
+        return self.mode
+    
+    def _switch(self, mode: ServiceMode, reason: str):
+        if mode == ServiceMode.DEGRADED:
+            logger.warning(f"Перегрузка ({reason}): переход в деградированный режим, только ML")
+        else:
+            logger.info("Перегрузка снята: возврат в обычный режим")
+        self.mode = mode
+        self.reason = reason
+        SERVICE_MODE.set(1 if mode == ServiceMode.DEGRADED else 0)
+        SERVICE_MODE_CHANGES.labels(mode=mode.value, reason=reason).inc()
+
+
+admission_controller = AdmissionController()
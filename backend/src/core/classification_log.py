@@ -0,0 +1,235 @@
+"""
+Журнал классификаций: каждая заявка с результатами стадий каскада
+
+Запись собирается SystemControlAgent после завершения каскада и кладется в
+очередь в памяти без ожидания: на пути запроса нет ни диска, ни сжатия.
+Фоновая задача забирает записи пачками и в отдельном потоке дописывает их в
+сегменты JSON Lines, сжатые gzip. Каждая пачка - отдельный gzip member,
+поэтому при падении процесса теряется только недописанная пачка. Сегмент
+закрывается по размеру, старые сегменты сверх max_segments удаляются.
+При заполненной очереди записи отбрасываются: журнал не должен тормозить
+классификацию.
+
+Запись содержит:
+- ts - время поступления заявки (unix, секунды);
+- endpoint и request - тело запроса к API, по которому заявку можно отправить повторно;
+- input_hash - sha256 текста заявки;
+- events - результаты стадий в том же виде, что у /classify/stream;
+- result - итог в формате ответа API;
+- timings_ms - длительности стадий из трассы запроса;
+- llm - вызовы GigaChat и токены по стадиям.
+
+Сегменты читает read_records; на них работает воспроизведение трафика
+(benchmarks/replay.py).
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.core import tracing
+from src.core.clients.scheduler import current_priority
+from src.core.config import ClassificationLogConfig, settings
+from src.core.metrics import CLASSIFICATION_LOG_QUEUE, CLASSIFICATION_LOG_RECORDS, timed_stage
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_GLOB = "classifications-*.jsonl.gz"
+
+
+def _json_default(value: Any) -> Any:
+    # numpy скаляры из ML стадии
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def segments(directory: Path) -> List[Path]:
+    """Сегменты журнала от старых к новым"""
+    return sorted(Path(directory).glob(SEGMENT_GLOB))
+
+
+def read_records(paths: Iterable[Path]) -> Iterator[Dict[str, Any]]:
+    """
+    Чтение записей из сегментов
+    
+    Оборванный конец сегмента (процесс упал во время записи или сегмент
+    еще дописывается) пропускается с предупреждением.
+    
+    Args:
+        paths: Сегменты журнала
+    
+    Yields:
+        Записи в порядке записи внутри каждого сегмента
+    """
+    for path in paths:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Пропущена поврежденная запись журнала в {path}")
+        except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+            logger.warning(f"Сегмент журнала {path} оборван: {e}")
+
+
+class ClassificationLog:
+    """Асинхронная запись заявок в журнал классификаций"""
+    
+    CLOSE_TIMEOUT = 10.0
+    
+    def __init__(self, config: Optional[ClassificationLogConfig] = None):
+        self.config = config or settings.classification_log
+        self.directory = Path(self.config.directory)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Текущий сегмент и номер следующего (в пределах процесса)
+        self._segment: Optional[Path] = None
+        self._sequence = 0
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Запуск фоновой записи; до запуска записи не собираются"""
+        if not self.config.enabled or self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.config.queue_size)
+        self._task = loop.create_task(self._writer())
+    
+    async def close(self):
+        """Запись накопленных записей и остановка"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        try:
+            await asyncio.wait_for(self._task, timeout=self.CLOSE_TIMEOUT)
+        except TimeoutError:
+            logger.warning("Журнал классификаций не успел записать очередь при остановке")
+        self._task = None
+        self._queue = None
+    
+    def log(
+        self,
+        endpoint: str,
+        request: Dict[str, Any],
+        events: List[Tuple[str, Any]],
+        result: Optional[Dict[str, Any]],
+        span: Optional[tracing.Span],
+        error: Optional[str] = None
+    ):
+        """
+        Постановка записи в очередь без ожидания
+        
+        Args:
+            endpoint: Endpoint API без префикса (classify, classify/stream, classify-with-answers)
+            request: Тело запроса к endpoint'у
+            events: Результаты стадий (событие, данные)
+            result: Итог в формате ответа API или None при ошибке
+            span: Span обработки заявки: из его поддерева берутся длительности и токены
+            error: Ошибка обработки
+        """
+        if self._queue is None:
+            return
+        text = request.get("text") or ""
+        record = {
+            "ts": span.start_unix_ns / 1e9 if span is not None else time.time(),
+            "request_id": tracing.current_request_id(),
+            "endpoint": endpoint,
+            "priority": current_priority().value,
+            "input_hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            "request": request if self.config.store_text else None,
+            "events": [{"event": event, "data": data} for event, data in events],
+            "result": result,
+            "error": error,
+        }
+        record.update(self._usage(span))
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            CLASSIFICATION_LOG_RECORDS.labels(result="dropped").inc()
+            return
+        CLASSIFICATION_LOG_QUEUE.inc()
+    
+    @staticmethod
+    def _usage(span: Optional[tracing.Span]) -> Dict[str, Any]:
+        """Длительности стадий и вызовы GigaChat из поддерева span'а"""
+        if span is None:
+            return {"duration_ms": None, "timings_ms": {}, "llm": {}}
+        timings, llm = tracing.subtree_usage(span)
+        return {"duration_ms": round(span.duration_ms, 3), "timings_ms": timings, "llm": llm}
+    
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            record = await self._queue.get()
+            closing = record is None
+            batch = [] if closing else [record]
+            flush_at = loop.time() + self.config.flush_interval
+            # Добор пачки: до batch_size записей или до flush_interval после первой
+            while not closing and len(batch) < self.config.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    left = flush_at - loop.time()
+                    if left <= 0:
+                        break
+                    try:
+                        record = await asyncio.wait_for(self._queue.get(), left)
+                    except TimeoutError:
+                        break
+                if record is None:
+                    closing = True
+                else:
+                    batch.append(record)
+            
+            if batch:
+                CLASSIFICATION_LOG_QUEUE.dec(len(batch))
+                try:
+                    with timed_stage("classification_log_write", records=len(batch)):
+                        await asyncio.to_thread(self._write, batch)
+                    CLASSIFICATION_LOG_RECORDS.labels(result="written").inc(len(batch))
+                except Exception as e:
+                    logger.error(f"Ошибка записи журнала классификаций: {e}")
+                    CLASSIFICATION_LOG_RECORDS.labels(result="failed").inc(len(batch))
+            if closing:
+                return
+    
+    def _write(self, batch: List[Dict[str, Any]]):
+        """Сериализация, сжатие и дозапись пачки (в потоке)"""
+        lines = "".join(
+            json.dumps(record, ensure_ascii=False, default=_json_default) + "\n" for record in batch
+        )
+        data = gzip.compress(lines.encode("utf-8"))
+        
+        if self._segment is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Несколько воркеров пишут в один каталог: у каждого свои сегменты
+            stamp = time.strftime("%Y%m%dT%H%M%S")
+            self._segment = self.directory / f"classifications-{stamp}-{os.getpid()}-{self._sequence:04d}.jsonl.gz"
+            self._sequence += 1
+        with open(self._segment, "ab") as f:
+            f.write(data)
+            size = f.tell()
+        
+        if size >= self.config.segment_max_bytes:
+            logger.info(f"Сегмент журнала классификаций закрыт: {self._segment} ({size} байт)")
+            self._segment = None
+            self._prune()
+    
+    def _prune(self):
+        if self.config.max_segments <= 0:
+            return
+        stale = segments(self.directory)[:-self.config.max_segments]
+        for path in stale:
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"Не удалось удалить сегмент журнала {path}: {e}")
+
+
+classification_log = ClassificationLog()
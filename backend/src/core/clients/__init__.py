@@ -1,5 +1,20 @@
 """Клиенты для AI провайдеров"""
 
-from .gigachat_client import GigaChatClient
+from .gigachat_client import CircuitOpenError, GigaChatClient, GigaChatError
+from .inference_client import InferenceClient, inference_client
+from .resilience import CircuitBreaker, circuit_breaker
+from .scheduler import GigaChatScheduler, Priority, gigachat_scheduler, llm_priority
 
-__all__ = ["GigaChatClient"]
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "GigaChatClient",
+    "GigaChatError",
+    "GigaChatScheduler",
+    "InferenceClient",
+    "Priority",
+    "circuit_breaker",
+    "gigachat_scheduler",
+    "inference_client",
+    "llm_priority",
+]
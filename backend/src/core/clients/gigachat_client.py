@@ -1,24 +1,79 @@
+import asyncio
+import json
 import logging
+import time
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Dict, List, Optional
 
 from gigachat import GigaChat
+from gigachat.exceptions import ResponseError
+from src.core import deadline
 from src.core.config import settings
+from src.core.metrics import LLM_HEDGED, LLM_TOKENS, timed_stage
+from src.core.prompts import estimate_tokens
+from .resilience import circuit_breaker, latency_tracker
+from .scheduler import gigachat_scheduler
 
 
 logger = logging.getLogger(__name__)
 
 
-class GigaChatClient:
+class GigaChatError(Exception):
+    """Ошибка вызова GigaChat"""
     
+    def __init__(self, message: str, status_code: Optional[int] = None, body: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        # Тело ответа API с ошибкой (по нему видно, что именно отклонено)
+        self.body = body
+
+
+class CircuitOpenError(GigaChatError):
+    """Вызов отклонен: circuit breaker открыт"""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    # ResponseError(url, status_code, content, headers)
+    if isinstance(error, ResponseError) and len(error.args) > 1:
+        return error.args[1]
+    return None
+
+
+def _response_body(error: Exception) -> Optional[str]:
+    if isinstance(error, ResponseError) and len(error.args) > 2 and error.args[2]:
+        content = error.args[2]
+        if isinstance(content, bytes):
+            content = content.decode("utf-8", errors="replace")
+        return str(content)[:1000]
+    return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = error.args[3] if len(error.args) > 3 else None
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class GigaChatClient:
+
     def __init__(self):
         self.api_key = settings.gigachat_api_key
         self._client = None
     
     def _get_client(self) -> GigaChat:
         if self._client is None:
+            urls = {}
+            if settings.gigachat_base_url:
+                urls["base_url"] = settings.gigachat_base_url
+            if settings.gigachat_auth_url:
+                urls["auth_url"] = settings.gigachat_auth_url
             self._client = GigaChat(
                 credentials=self.api_key,
                 verify_ssl_certs=False,
-                scope="GIGACHAT_API_PERS"
+                scope="GIGACHAT_API_PERS",
+                **urls
             )
         return self._client
     
@@ -27,50 +82,315 @@ class GigaChatClient:
         system_prompt: str,
         user_prompt: str,
         temperature: float = 0.7,
-        max_tokens: int = 1024
+        max_tokens: int = 1024,
+        stage: str = "llm",
+        idempotent: bool = True,
+        functions: Optional[List[Dict]] = None
     ) -> str:
         """
         Генерация ответа от GigaChat
         
+        Вызов ограничен таймаутом и остатком дедлайна запроса; при открытом
+        circuit breaker завершается сразу. Идемпотентные вызовы при включенном
+        хеджировании дублируются, если первый не ответил за p95 задержки стадии.
+        
         Args:
             system_prompt: Системный промпт
             user_prompt: Запрос пользователя
             temperature: Температура генерации (0.0-1.0) - игнорируется
             max_tokens: Максимальное количество токенов - игнорируется
-            
+            stage: Стадия каскада (для метрик и трассировки)
+            idempotent: Вызов можно безопасно повторить (хеджирование)
+            functions: Описание функции для function calling; модель обязана
+                вызвать первую функцию списка
+        
         Returns:
-            Сгенерированный ответ
+            Сгенерированный ответ (при function calling - аргументы функции в JSON)
+        
+        Raises:
+            GigaChatError: ошибка API, превышение квоты, таймаут или пустой ответ
         """
+        error: Optional[GigaChatError] = None
+        with timed_stage(stage, prompt_chars=len(system_prompt) + len(user_prompt)) as span:
+            try:
+                payload = {
+                    "messages": [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    "temperature": temperature,
+                    "top_p": 0.9,
+                    "max_tokens": max_tokens
+                }
+                estimated_tokens = estimate_tokens(system_prompt + user_prompt) + max_tokens
+                if functions:
+                    payload["functions"] = functions
+                    payload["function_call"] = {"name": functions[0]["name"]}
+                    estimated_tokens += estimate_tokens(json.dumps(functions, ensure_ascii=False))
+                response = await self._complete(payload, stage, estimated_tokens, idempotent)
+                
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    span.set_attribute("prompt_tokens", usage.prompt_tokens)
+                    span.set_attribute("completion_tokens", usage.completion_tokens)
+                    LLM_TOKENS.labels(stage=stage, kind="prompt").inc(usage.prompt_tokens)
+                    LLM_TOKENS.labels(stage=stage, kind="completion").inc(usage.completion_tokens)
+                    logger.debug(f"GigaChat [{stage}]: {usage.prompt_tokens} + {usage.completion_tokens} токенов")
+                
+                # Извлекаем текст ответа
+                if response and hasattr(response, 'choices') and len(response.choices) > 0:
+                    message = response.choices[0].message
+                    function_call = getattr(message, "function_call", None)
+                    if function_call is not None and function_call.arguments is not None:
+                        return json.dumps(function_call.arguments, ensure_ascii=False)
+                    return message.content
+                
+                error = GigaChatError("GigaChat вернул пустой ответ")
+            
+            except GigaChatError as e:
+                error = e
+            except Exception as e:
+                status_code = _status_code(e)
+                message = f"HTTP {status_code}" if status_code else str(e) or type(e).__name__
+                error = GigaChatError(f"Ошибка GigaChat: {message}", status_code, _response_body(e))
+                error.__cause__ = e
+            
+            # Ошибку учитывает агент, перехватывающий исключение
+            span.error = repr(error)
+        
+        if isinstance(error, CircuitOpenError):
+            logger.warning(f"GigaChat [{stage}]: {error}")
+        else:
+            logger.error(f"GigaChat [{stage}]: {error}")
+        raise error
+    
+    async def _complete(self, payload: dict, stage: str, estimated_tokens: int, idempotent: bool):
+        """Вызов с таймаутом по дедлайну и, при необходимости, хеджированием"""
+        left = deadline.remaining()
+        if left is not None and left <= 0:
+            raise GigaChatError("Ошибка GigaChat: дедлайн запроса истек")
+        
+        timeout = settings.resilience.call_timeout
+        # Таймаут, вызванный дедлайном запроса, не говорит о сбое GigaChat
+        deadline_bound = left is not None and left < timeout
+        timeout = min(timeout, left) if left is not None else timeout
+        
+        hedge_delay = None
+        if idempotent and settings.resilience.hedging_enabled:
+            hedge_delay = latency_tracker.hedge_delay(stage)
+        
+        if hedge_delay is None or hedge_delay >= timeout:
+            return await self._attempt(payload, stage, estimated_tokens, timeout, deadline_bound)
+        return await self._hedged(payload, stage, estimated_tokens, timeout, deadline_bound, hedge_delay)
+    
+    async def _hedged(
+        self,
+        payload: dict,
+        stage: str,
+        estimated_tokens: int,
+        timeout: float,
+        deadline_bound: bool,
+        hedge_delay: float
+    ):
+        """Первый вызов, а если он не ответил за hedge_delay - параллельный второй; побеждает первый ответ"""
+        primary = asyncio.ensure_future(
+            self._attempt(payload, stage, estimated_tokens, timeout, deadline_bound)
+        )
+        tasks = {primary}
         try:
-            client = self._get_client()
-
-            print(system_prompt)
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if done:
+                return primary.result()
             
-            payload = {
+            hedge = asyncio.ensure_future(
+                self._attempt(payload, stage, estimated_tokens, timeout - hedge_delay, deadline_bound)
+            )
+            tasks.add(hedge)
+            errors = []
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGED.labels(stage=stage, winner="primary" if task is primary else "hedge").inc()
+                        return task.result()
+                    errors.append(task.exception())
+            LLM_HEDGED.labels(stage=stage, winner="none").inc()
+            raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _attempt(
+        self,
+        payload: dict,
+        stage: str,
+        estimated_tokens: int,
+        timeout: float,
+        deadline_bound: bool
+    ):
+        """Один вызов API: circuit breaker, слот планировщика и таймаут"""
+        if not circuit_breaker.allow():
+            raise CircuitOpenError("Ошибка GigaChat: circuit breaker открыт")
+        
+        client = self._get_client()
+        started: Optional[float] = None
+        outcome = "neutral"
+        try:
+            async with asyncio.timeout(timeout):
+                # Слот общего планировщика: квоты аккаунта и приоритет интерактивных запросов
+                async with gigachat_scheduler.slot(estimated_tokens) as slot:
+                    started = time.perf_counter()
+                    # Вызов API GigaChat (асинхронный, не блокирует event loop)
+                    response = await client.achat(payload)
+                    
+                    usage = getattr(response, "usage", None)
+                    if usage is not None:
+                        slot.used_tokens = usage.total_tokens
+            
+            outcome = "success"
+            latency_tracker.observe(stage, time.perf_counter() - started)
+            return response
+        
+        except BaseException as e:
+            outcome = self._failure_outcome(e, started is not None, deadline_bound)
+            if isinstance(e, TimeoutError):
+                raise GigaChatError(f"Ошибка GigaChat: таймаут {timeout:.1f} с") from e
+            raise
+        finally:
+            self._record_outcome(outcome)
+    
+    async def stream_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        stage: str = "llm"
+    ) -> AsyncIterator[str]:
+        """
+        Генерация ответа от GigaChat с потоковой выдачей токенов
+        
+        Действуют те же circuit breaker, слот планировщика и таймаут по
+        дедлайну, что и в generate_response; хеджирования нет.
+        
+        Args:
+            system_prompt: Системный промпт
+            user_prompt: Запрос пользователя
+            temperature: Температура генерации
+            max_tokens: Максимальное количество токенов
+            stage: Стадия каскада (для метрик и трассировки)
+        
+        Yields:
+            Фрагменты текста ответа по мере генерации
+        
+        Raises:
+            GigaChatError: ошибка API, превышение квоты или таймаут
+        """
+        payload = {
             "messages": [
                 {"role": "system", "content": system_prompt},
-                                {"role": "user", "content": user_prompt}  
+                {"role": "user", "content": user_prompt}
             ],
             "temperature": temperature,
             "top_p": 0.9,
             "max_tokens": max_tokens
-            }
-            
-            
-            # Вызов API GigaChat
-            response = client.chat(payload)
-            print(response.choices[0].message.content)
-            
-            # Извлекаем текст ответа
-            if response and hasattr(response, 'choices') and len(response.choices) > 0:
-                return response.choices[0].message.content
+        }
+        estimated_tokens = estimate_tokens(system_prompt + user_prompt) + max_tokens
+        
+        left = deadline.remaining()
+        if left is not None and left <= 0:
+            raise GigaChatError("Ошибка GigaChat: дедлайн запроса истек")
+        timeout = settings.resilience.call_timeout
+        deadline_bound = left is not None and left < timeout
+        timeout = min(timeout, left) if left is not None else timeout
+        
+        with timed_stage(stage, prompt_chars=len(system_prompt) + len(user_prompt), stream=True) as span:
+            if not circuit_breaker.allow():
+                span.error = "circuit_open"
+                raise CircuitOpenError("Ошибка GigaChat: circuit breaker открыт")
             
-            logger.error("GigaChat returned empty response")
-            return "Извините, не могу сгенерировать ответ. Попробуйте еще раз."
+            client = self._get_client()
+            loop = asyncio.get_running_loop()
+            finish_at = loop.time() + timeout
+            started: Optional[float] = None
+            outcome = "neutral"
+            completion_chars = 0
+            try:
+                async with AsyncExitStack() as stack:
+                    async with asyncio.timeout(timeout):
+                        slot = await stack.enter_async_context(gigachat_scheduler.slot(estimated_tokens))
+                    
+                    started = time.perf_counter()
+                    chunks = client.astream(payload)
+                    stack.push_async_callback(chunks.aclose)
+                    while True:
+                        # Таймаут на весь ответ, а не на отдельный фрагмент: asyncio.timeout
+                        # вокруг yield отменил бы задачу потребителя вне генератора
+                        try:
+                            chunk = await asyncio.wait_for(anext(chunks), finish_at - loop.time())
+                        except StopAsyncIteration:
+                            break
+                        
+                        usage = getattr(chunk, "usage", None)
+                        if usage is not None:
+                            slot.used_tokens = usage.total_tokens
+                            span.set_attribute("prompt_tokens", usage.prompt_tokens)
+                            span.set_attribute("completion_tokens", usage.completion_tokens)
+                            LLM_TOKENS.labels(stage=stage, kind="prompt").inc(usage.prompt_tokens)
+                            LLM_TOKENS.labels(stage=stage, kind="completion").inc(usage.completion_tokens)
+                        
+                        content = chunk.choices[0].delta.content if chunk.choices else None
+                        if content:
+                            completion_chars += len(content)
+                            yield content
                 
-        except Exception as e:
-            logger.error(f"GigaChat error: {e}")
-            return "Произошла ошибка при генерации ответа. Пожалуйста, попробуйте позже."
+                outcome = "success"
+                latency_tracker.observe(stage, time.perf_counter() - started)
+            
+            except BaseException as e:
+                outcome = self._failure_outcome(e, started is not None, deadline_bound)
+                if isinstance(e, GeneratorExit):
+                    # Клиент перестал читать поток
+                    raise
+                span.error = repr(e)
+                if isinstance(e, TimeoutError):
+                    raise GigaChatError(f"Ошибка GigaChat: таймаут {timeout:.1f} с") from e
+                if isinstance(e, (GigaChatError, asyncio.CancelledError)):
+                    raise
+                status_code = _status_code(e)
+                message = f"HTTP {status_code}" if status_code else str(e) or type(e).__name__
+                raise GigaChatError(f"Ошибка GigaChat: {message}", status_code, _response_body(e)) from e
+            finally:
+                span.set_attribute("completion_chars", completion_chars)
+                self._record_outcome(outcome)
+    
+    @staticmethod
+    def _failure_outcome(error: BaseException, started: bool, deadline_bound: bool) -> str:
+        """Исход неудачного вызова для circuit breaker: failure или neutral"""
+        if isinstance(error, TimeoutError):
+            # Ожидание в очереди планировщика и дедлайн запроса - не сбой GigaChat
+            return "failure" if started and not deadline_bound else "neutral"
+        if isinstance(error, ResponseError):
+            status_code = _status_code(error)
+            if status_code == 429:
+                gigachat_scheduler.rate_limited(_retry_after(error))
+                return "neutral"
+            if status_code is None or status_code >= 500 or status_code in (401, 403):
+                return "failure"
+            return "neutral"
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit, GigaChatError)):
+            return "neutral"
+        # Сетевые ошибки и сбои SDK
+        return "failure"
+    
+    @staticmethod
+    def _record_outcome(outcome: str):
+        if outcome == "success":
+            circuit_breaker.record_success()
+        elif outcome == "failure":
+            circuit_breaker.record_failure()
+        else:
+            circuit_breaker.record_neutral()
     
     def close(self):
         if self._client:
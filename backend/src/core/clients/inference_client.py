@@ -0,0 +1,179 @@
+"""
+Клиент сервера инференса RuBERT (см. src/inference_server.py)
+
+В режиме remote API воркеры не держат RuBERT в памяти: эмбеддинги считает
+один процесс на узел, который собирает заявки всех воркеров в общие пакеты.
+Голова классификатора, пороги и обратная связь остаются в воркерах.
+
+Формат обмена - двоичный, без JSON и base64:
+- запрос: число текстов (uint32), затем для каждого длина (uint32) и UTF-8 байты;
+- ответ: число строк и размерность (uint32, uint32), затем float32 row-major.
+Все числа little-endian. Версия RuBERT передается заголовком X-Encoder в
+обе стороны: эмбеддинги другой версии несовместимы с головой воркера, и
+сервер отвечает 409.
+"""
+import asyncio
+import logging
+import struct
+import time
+from typing import List, Optional
+
+import httpx
+import numpy as np
+
+from src.core.config import InferenceConfig, settings
+from src.core.metrics import INFERENCE_REQUESTS, timed_stage
+
+logger = logging.getLogger(__name__)
+
+ENCODER_HEADER = "X-Encoder"
+EMBED_PATH = "/embed"
+
+_COUNT = struct.Struct("<I")
+_SHAPE = struct.Struct("<II")
+
+
+def encode_texts(texts: List[str]) -> bytes:
+    """Тексты заявок в тело запроса"""
+    parts = [_COUNT.pack(len(texts))]
+    for text in texts:
+        data = text.encode("utf-8")
+        parts.append(_COUNT.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def decode_texts(body: bytes) -> List[str]:
+    """
+    Тексты заявок из тела запроса
+    
+    Raises:
+        ValueError: тело не соответствует формату
+    """
+    try:
+        (count,), offset = _COUNT.unpack_from(body, 0), _COUNT.size
+        texts = []
+        for _ in range(count):
+            (length,) = _COUNT.unpack_from(body, offset)
+            offset += _COUNT.size
+            if offset + length > len(body):
+                raise ValueError("текст выходит за границы тела")
+            texts.append(body[offset:offset + length].decode("utf-8"))
+            offset += length
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Некорректное тело запроса: {e}") from e
+    if offset != len(body):
+        raise ValueError("Лишние байты в теле запроса")
+    return texts
+
+
+def encode_embeddings(embeddings: np.ndarray) -> bytes:
+    """Эмбеддинги в тело ответа"""
+    embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+    return _SHAPE.pack(*embeddings.shape) + embeddings.tobytes()
+
+
+def decode_embeddings(body: bytes) -> np.ndarray:
+    """
+    Эмбеддинги из тела ответа: матрица [n, hidden_size] float32
+    
+    Raises:
+        ValueError: тело не соответствует формату
+    """
+    try:
+        rows, dim = _SHAPE.unpack_from(body, 0)
+    except struct.error as e:
+        raise ValueError(f"Некорректное тело ответа: {e}") from e
+    if len(body) != _SHAPE.size + rows * dim * 4:
+        raise ValueError(f"Тело ответа ({len(body)} байт) не соответствует матрице {rows}x{dim}")
+    return np.frombuffer(body, dtype="<f4", count=rows * dim, offset=_SHAPE.size).reshape(rows, dim)
+
+
+class InferenceClient:
+    """Пул соединений к серверу инференса с переходом на локальный расчет"""
+    
+    def __init__(self, config: Optional[InferenceConfig] = None):
+        self.config = config or settings.inference
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # До этого момента (monotonic) сервер не опрашивается после ошибки
+        self._unavailable_until = 0.0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.config.mode == "remote"
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        # Соединения пула привязаны к event loop'у, в котором созданы
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            limits = httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_connections
+            )
+            if self.config.socket_path:
+                transport = httpx.AsyncHTTPTransport(uds=self.config.socket_path, limits=limits)
+                self._client = httpx.AsyncClient(
+                    transport=transport, base_url="http://inference", timeout=self.config.timeout
+                )
+            else:
+                self._client = httpx.AsyncClient(
+                    base_url=self.config.url, limits=limits, timeout=self.config.timeout
+                )
+            self._loop = loop
+        return self._client
+    
+    async def embed(self, texts: List[str], encoder: str) -> Optional[np.ndarray]:
+        """
+        Эмбеддинги заявок от сервера инференса
+        
+        Args:
+            texts: Тексты заявок
+            encoder: Версия RuBERT, которую ожидает голова воркера
+        
+        Returns:
+            Матрица [len(texts), hidden_size] или None, если нужно считать
+            локально (сервер недоступен или держит другую версию)
+        
+        Raises:
+            RuntimeError: сервер недоступен, а локальный расчет отключен (fallback=false)
+        """
+        if time.monotonic() < self._unavailable_until:
+            INFERENCE_REQUESTS.labels(result="skipped").inc()
+            return self._fallback("сервер инференса недавно не ответил")
+        
+        try:
+            with timed_stage("inference_remote", batch_size=len(texts)):
+                response = await self._get_client().post(
+                    EMBED_PATH,
+                    content=encode_texts(texts),
+                    headers={ENCODER_HEADER: encoder, "Content-Type": "application/octet-stream"}
+                )
+            if response.status_code == 409:
+                served = response.headers.get(ENCODER_HEADER)
+                raise RuntimeError(f"сервер держит версию RuBERT {served}, нужна {encoder}")
+            response.raise_for_status()
+            embeddings = decode_embeddings(response.content)
+            if len(embeddings) != len(texts):
+                raise RuntimeError(f"получено {len(embeddings)} эмбеддингов вместо {len(texts)}")
+        except (httpx.HTTPError, RuntimeError, ValueError) as e:
+            INFERENCE_REQUESTS.labels(result="fallback").inc()
+            self._unavailable_until = time.monotonic() + self.config.retry_interval
+            logger.warning(f"Ошибка сервера инференса: {e}")
+            return self._fallback(str(e))
+        
+        INFERENCE_REQUESTS.labels(result="ok").inc()
+        return embeddings
+    
+    def _fallback(self, reason: str) -> None:
+        if not self.config.fallback:
+            raise RuntimeError(f"Сервер инференса недоступен: {reason}")
+        return None
+    
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+inference_client = InferenceClient()
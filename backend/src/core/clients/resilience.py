@@ -0,0 +1,138 @@
+"""
+Устойчивость вызовов GigaChat: circuit breaker и задержки для хеджирования
+
+Состояние общее для всех агентов процесса: если GigaChat деградировал,
+это видно сразу всем стадиям каскада.
+"""
+import logging
+import math
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, List, Optional, Tuple
+
+from src.core.config import ResilienceConfig, settings
+from src.core.metrics import LLM_CIRCUIT_REJECTED, LLM_CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+
+CIRCUIT_STATE_VALUES = {CircuitState.CLOSED: 0, CircuitState.HALF_OPEN: 1, CircuitState.OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker по сбоям подряд.
+    После failure_threshold сбоев вызовы отклоняются recovery_timeout секунд,
+    затем пропускается один пробный вызов: успех закрывает цепь, сбой снова
+    открывает ее.
+    """
+    
+    def __init__(self, config: Optional[ResilienceConfig] = None):
+        self.config = config or settings.resilience
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+    
+    @property
+    def is_open(self) -> bool:
+        """Вызовы сейчас отклоняются (без учета пробного вызова)"""
+        if self.state == CircuitState.CLOSED:
+            return False
+        if self.state == CircuitState.HALF_OPEN:
+            return self._probe_in_flight
+        return time.monotonic() - self.opened_at < self.config.breaker_recovery_timeout
+    
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов; в half-open пропускается один пробный"""
+        if self.state == CircuitState.OPEN and not self.is_open:
+            self._set_state(CircuitState.HALF_OPEN)
+        
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        
+        LLM_CIRCUIT_REJECTED.inc()
+        return False
+    
+    def record_success(self):
+        self._probe_in_flight = False
+        self.failures = 0
+        if self.state != CircuitState.CLOSED:
+            logger.info("GigaChat снова отвечает, circuit breaker закрыт")
+            self._set_state(CircuitState.CLOSED)
+    
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == CircuitState.HALF_OPEN or self.failures >= self.config.breaker_failure_threshold:
+            if self.state != CircuitState.OPEN:
+                logger.warning(
+                    f"Circuit breaker GigaChat открыт после {self.failures} сбоев "
+                    f"на {self.config.breaker_recovery_timeout:.0f} с"
+                )
+            self.opened_at = time.monotonic()
+            self._set_state(CircuitState.OPEN)
+    
+    def record_neutral(self):
+        """Вызов завершился без признаков здоровья или сбоя (отмена, 429, 4xx)"""
+        self._probe_in_flight = False
+    
+    def _set_state(self, state: CircuitState):
+        self.state = state
+        LLM_CIRCUIT_STATE.set(CIRCUIT_STATE_VALUES[state])
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных вызовов по стадиям"""
+    
+    def __init__(self, window: int = 200, config: Optional[ResilienceConfig] = None):
+        self.config = config or settings.resilience
+        self.window = window
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}
+    
+    @property
+    def stages(self) -> List[str]:
+        return list(self._samples)
+    
+    def observe(self, stage: str, seconds: float):
+        self._samples.setdefault(stage, deque(maxlen=self.window)).append((time.monotonic(), seconds))
+    
+    def quantile(self, stage: str, q: float, max_age: Optional[float] = None) -> Optional[float]:
+        """
+        Квантиль задержки стадии
+        
+        Args:
+            stage: Стадия каскада
+            q: Квантиль (0-1)
+            max_age: Учитывать только вызовы за последние max_age секунд
+        
+        Returns:
+            Задержка в секундах или None, если вызовов меньше hedge_min_samples
+        """
+        samples = self._samples.get(stage) or ()
+        if max_age is not None:
+            since = time.monotonic() - max_age
+            samples = [sample for sample in samples if sample[0] >= since]
+        if len(samples) < self.config.hedge_min_samples:
+            return None
+        ordered = sorted(seconds for _, seconds in samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+    
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        """Задержка перед хеджирующим вызовом или None, если статистики мало"""
+        value = self.quantile(stage, self.config.hedge_quantile)
+        return None if value is None else max(value, self.config.hedge_min_delay)
+
+
+circuit_breaker = CircuitBreaker()
+latency_tracker = LatencyTracker()
@@ -0,0 +1,235 @@
+"""
+Общий планировщик вызовов GigaChat
+
+Все агенты получают слот у одного планировщика: token bucket на число
+запросов и на токены, ограничение одновременных вызовов и две полосы
+приоритета. Интерактивные вызовы (/classify) всегда обслуживаются раньше
+пакетных, а пакетные не занимают больше bulk_max_in_flight слотов.
+Полоса берется из контекста (llm_priority), поэтому агентам не нужно
+передавать ее явно.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional
+
+from src.core import tracing
+from src.core.config import LLMSchedulerConfig, settings
+from src.core.metrics import LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT, LLM_RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(str, Enum):
+    """Полосы приоритета вызовов LLM (в порядке обслуживания)"""
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+
+
+_current_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    """Полоса приоритета для всех вызовов LLM внутри блока (и созданных в нем задач)"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+class TokenBucket:
+    """Token bucket: rate единиц в секунду, не больше capacity в запасе"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+    
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+    
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount: float, now: float) -> float:
+        """Через сколько секунд в ведре наберется amount (не больше capacity)"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+    
+    def consume(self, amount: float) -> float:
+        """Списание; возвращает фактически списанное количество"""
+        if self.unlimited:
+            return 0.0
+        amount = min(amount, self.capacity)
+        self.level -= amount
+        return amount
+    
+    def adjust(self, delta: float):
+        """Коррекция после вызова: возврат неиспользованного или доплата (delta < 0)"""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + delta)
+
+
+class Slot:
+    """Разрешение на один вызов GigaChat"""
+    
+    def __init__(self, lane: Priority, reserved_tokens: float):
+        self.lane = lane
+        self.reserved_tokens = reserved_tokens
+        # Заполняется вызывающим кодом по usage ответа
+        self.used_tokens: Optional[int] = None
+
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "lane")
+    
+    def __init__(self, future: asyncio.Future, tokens: int, lane: Priority):
+        self.future = future
+        self.tokens = tokens
+        self.lane = lane
+
+
+class GigaChatScheduler:
+    """Планировщик слотов GigaChat с приоритетами и ограничением скорости"""
+    
+    def __init__(self, config: Optional[LLMSchedulerConfig] = None):
+        self.config = config or settings.llm
+        self.requests = TokenBucket(self.config.requests_per_second, self.config.request_burst)
+        self.tokens = TokenBucket(self.config.tokens_per_minute / 60, self.config.token_burst)
+        self.lane_limits = {
+            Priority.INTERACTIVE: self.config.max_in_flight,
+            Priority.BULK: min(self.config.bulk_max_in_flight, self.config.max_in_flight),
+        }
+        self._queues: Dict[Priority, Deque[_Waiter]] = {lane: deque() for lane in Priority}
+        self._in_flight: Dict[Priority, int] = {lane: 0 for lane in Priority}
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    @property
+    def in_flight(self) -> int:
+        return sum(self._in_flight.values())
+    
+    def queue_depth(self, lane: Priority) -> int:
+        return len(self._queues[lane])
+    
+    @property
+    def paused(self) -> bool:
+        """Выдача слотов приостановлена после 429 (исчерпана квота)"""
+        return time.monotonic() < self._paused_until
+    
+    @asynccontextmanager
+    async def slot(self, tokens: int, priority: Optional[Priority] = None) -> AsyncIterator[Slot]:
+        """
+        Ожидание слота для вызова GigaChat
+        
+        Args:
+            tokens: Оценка токенов вызова (промпт + max_tokens)
+            priority: Полоса; по умолчанию берется из контекста
+        
+        Yields:
+            Slot; в slot.used_tokens записывается фактический расход токенов
+        """
+        lane = priority or current_priority()
+        if not self.config.enabled:
+            yield Slot(lane, 0)
+            return
+        
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens, lane)
+        self._queues[lane].append(waiter)
+        LLM_QUEUE_DEPTH.labels(lane=lane.value).inc()
+        start = time.perf_counter()
+        self._dispatch()
+        
+        try:
+            with tracing.span("llm_queue", lane=lane.value):
+                slot = await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Слот выдан одновременно с отменой ожидающей задачи
+                self._release(waiter.future.result())
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            raise
+        LLM_QUEUE_WAIT.labels(lane=lane.value).observe(time.perf_counter() - start)
+        
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+    
+    def rate_limited(self, retry_after: Optional[float] = None):
+        """Ответ 429: приостановка выдачи слотов"""
+        pause = retry_after if retry_after is not None else self.config.rate_limit_cooldown
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        LLM_RATE_LIMITED.inc()
+        logger.warning(f"GigaChat ответил 429, выдача слотов приостановлена на {pause:.1f} с")
+    
+    def _remove(self, waiter: _Waiter):
+        try:
+            self._queues[waiter.lane].remove(waiter)
+        except ValueError:
+            return
+        LLM_QUEUE_DEPTH.labels(lane=waiter.lane.value).dec()
+    
+    def _release(self, slot: Slot):
+        self._in_flight[slot.lane] -= 1
+        LLM_IN_FLIGHT.labels(lane=slot.lane.value).dec()
+        if slot.used_tokens is not None:
+            self.tokens.adjust(slot.reserved_tokens - slot.used_tokens)
+        self._dispatch()
+    
+    def _dispatch(self):
+        """Выдача слотов ожидающим: сначала интерактивная полоса, затем bulk"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        now = time.monotonic()
+        for lane in Priority:
+            queue = self._queues[lane]
+            while queue:
+                waiter = queue[0]
+                if waiter.future.done():
+                    queue.popleft()
+                    LLM_QUEUE_DEPTH.labels(lane=lane.value).dec()
+                    continue
+                if self.in_flight >= self.config.max_in_flight or self._in_flight[lane] >= self.lane_limits[lane]:
+                    break
+                
+                wait = max(
+                    self._paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(waiter.tokens, now)
+                )
+                if wait > 0:
+                    # Бюджет скорости не отдается следующей полосе, пока ждет более приоритетная
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                    return
+                
+                queue.popleft()
+                LLM_QUEUE_DEPTH.labels(lane=lane.value).dec()
+                self.requests.consume(1)
+                slot = Slot(lane, self.tokens.consume(waiter.tokens))
+                self._in_flight[lane] += 1
+                LLM_IN_FLIGHT.labels(lane=lane.value).inc()
+                waiter.future.set_result(slot)
+
+
+gigachat_scheduler = GigaChatScheduler()
@@ -24,7 +24,7 @@ class LoggingConfig(BaseModel):
     ] = "info"
     log_format: str = LOG_DEFAULT_FORMAT
     date_format: str = "%Y-%m-%d %H:%M:%S"
-
+    
     @property
     def log_level_value(self) -> int:
         return logging.getLevelNamesMapping()[self.log_level.upper()]
@@ -35,6 +35,281 @@ class AIConfig(BaseModel):
     ai_provider: str = "gigachat"
 
 
+class MLConfig(BaseModel):
+    # Режим длинных заявок: текст режется на перекрывающиеся окна токенов,
+    # эмбеддинги окон усредняются в один вектор
+    long_text_enabled: bool = True
+    max_windows: int = 4
+    window_stride: int = 64
+    # Грубая верхняя оценка символов на токен для предварительной обрезки текста
+    chars_per_token: int = 8
+    # Финальная стадия: сначала ML модель на тексте заявки с ответами
+    # пользователя, GigaChat - только если уверенность ниже порога
+    answer_reclassify_enabled: bool = True
+
+
+class InferenceConfig(BaseModel):
+    # local - RuBERT в каждом API воркере; remote - эмбеддинги считает отдельный
+    # сервер инференса (python -m src.inference_server), один на узел, с
+    # батчингом заявок всех воркеров. Голова классификатора остается в воркерах
+    mode: Literal["local", "remote"] = "local"
+    # Адрес сервера: Unix socket, если задан, иначе HTTP на localhost
+    socket_path: Optional[str] = None
+    url: str = "http://127.0.0.1:8100"
+    timeout: float = 2.0
+    max_connections: int = 16
+    # При ошибке сервера воркер считает эмбеддинги сам (RuBERT загружается
+    # при первой такой ошибке) и не обращается к серверу retry_interval секунд
+    fallback: bool = True
+    retry_interval: float = 5.0
+    # Сервер: пакет до max_batch_size заявок или до max_wait_ms после первой
+    max_batch_size: int = 64
+    max_wait_ms: float = 5.0
+    # Сервер: как часто проверять активную версию модели (секунд)
+    reload_interval: float = 5.0
+
+
+class CascadeConfig(BaseModel):
+    # Пороги уверенности, при которых каскад останавливается на стадии ML или
+    # глубокого анализа; пороги по классам - в файле thresholds_path
+    # (результат python -m benchmarks.cascade tune), если он есть
+    ml_threshold: float = 0.90
+    deep_threshold: float = 0.90
+    thresholds_path: Optional[str] = "data/thresholds.json"
+    # Как часто (секунд) проверять mtime файла порогов
+    reload_interval: float = 5.0
+
+
+class TypeAheadConfig(BaseModel):
+    # Подсказка класса при наборе заявки (/classify/fast): только RuBERT и
+    # голова классификатора, без GigaChat и остальных стадий каскада
+    top_k: int = 5
+    # Более короткий текст подсказку не получает
+    min_chars: int = 3
+    # Для подсказки достаточно начала текста, короткий вход держит задержку
+    max_chars: int = 512
+    # Эмбеддинг считается по тексту до последнего законченного слова: пока
+    # слово набирается, эмбеддинг берется из кеша
+    complete_words_only: bool = True
+    # Эмбеддингов префиксов в LRU кеше воркера
+    cache_size: int = 10000
+
+
+class RelevanceConfig(BaseModel):
+    # Первая стадия каскада: бинарная логистическая модель по эмбеддингу
+    # RuBERT отсекает заявки не по теме IT до вызовов GigaChat. Обучается на
+    # заявках, которые финальная классификация уверенно отнесла к «нет классов»
+    enabled: bool = True
+    # Нижняя граница порога вероятности «не по теме»; фактический порог
+    # выбирается выше всех отложенных заявок по теме (см. max_false_reject)
+    min_probability: float = 0.95
+    # Допустимая доля отложенных заявок по теме выше порога
+    max_false_reject: float = 0.0
+    # Минимум примеров каждого вида для обучения
+    min_out_of_scope: int = 30
+    min_in_scope: int = 100
+    regularization: float = 1.0
+    max_iter: int = 500
+    # Как часто проверять, не обучил ли модель другой воркер (секунд)
+    reload_interval: float = 5.0
+
+
+class ZeroShotConfig(BaseModel):
+    # Локальная стадия между ML и глубоким анализом: эмбеддинг заявки
+    # сравнивается с эмбеддингами названий классов из prompt.txt, и заявка
+    # принимается, если top-1 по косинусной близости совпадает с top-1
+    # логистической головы. Выключена, пока пороги не подобраны на
+    # размеченных заявках (ZERO_SHOT__ENABLED=true python -m benchmarks.cascade tune)
+    enabled: bool = False
+    # Минимальная вероятность класса у логистической головы
+    min_probability: float = 0.5
+    # Минимальный отрыв косинусной близости top-1 описания от top-2
+    min_margin: float = 0.05
+    # Доля принятых заявок, которые в фоне перепроверяются глубоким анализом
+    # (оценка точности стадии), и предел одновременных перепроверок
+    audit_sample_rate: float = 0.05
+    audit_max_pending: int = 2
+
+
+class PromptConfig(BaseModel):
+    # Компактный промпт классификации: только классы из top-k ML модели
+    compact_enabled: bool = True
+    top_k: int = 10
+    # Если суммарная вероятность top-k классов ниже порога (распределение
+    # «плоское»), используется полный промпт
+    min_coverage: float = 0.6
+    # Как часто (секунд) проверять mtime файлов в data/prompts
+    reload_interval: float = 5.0
+
+
+class TracingConfig(BaseModel):
+    # Трассы дольше порога попадают в кольцевой буфер /api/v1/debug/traces
+    slow_threshold_ms: float = 2000.0
+    ring_size: int = 100
+    # Файл для выгрузки всех трасс в формате OTLP JSON (по строке на трассу)
+    export_path: Optional[str] = None
+
+
+class LLMSchedulerConfig(BaseModel):
+    # Общий планировщик вызовов GigaChat (квоты аккаунта на RPS и токены)
+    enabled: bool = True
+    requests_per_second: float = 5.0
+    request_burst: int = 10
+    # 0 - без ограничения по токенам
+    tokens_per_minute: float = 120000.0
+    token_burst: int = 20000
+    max_in_flight: int = 8
+    # Фоновые (bulk) вызовы не занимают больше этого числа слотов,
+    # чтобы интерактивные запросы /classify не ждали пакетную обработку
+    bulk_max_in_flight: int = 4
+    # Пауза после 429, если GigaChat не прислал Retry-After (секунд)
+    rate_limit_cooldown: float = 5.0
+
+
+class StructuredOutputConfig(BaseModel):
+    # Ответы классификации и вопросов запрашиваются через function calling
+    # GigaChat: аргументы функции приходят готовым JSON по схеме. Если API
+    # отклонит функции (400/422 с упоминанием функций в теле ответа), воркер
+    # запрашивает текстовый JSON в течение function_calling_cooldown секунд
+    function_calling: bool = True
+    function_calling_cooldown: float = 600.0
+
+
+class ResilienceConfig(BaseModel):
+    # Бюджет времени на обработку заявки каскадом (секунд)
+    request_deadline: float = 30.0
+    # Таймаут одного вызова GigaChat (ограничивается остатком дедлайна)
+    call_timeout: float = 15.0
+    # Стадия LLM не запускается, если до дедлайна осталось меньше (секунд)
+    min_llm_budget: float = 1.0
+    # Circuit breaker: после стольких сбоев подряд вызовы GigaChat не выполняются
+    # recovery_timeout секунд, затем пропускается один пробный вызов
+    breaker_failure_threshold: int = 5
+    breaker_recovery_timeout: float = 30.0
+    # Хеджирование: повторный вызов, если первый не ответил за p95 задержки стадии
+    hedging_enabled: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    hedge_min_delay: float = 0.5
+
+
+class AdmissionConfig(BaseModel):
+    # Деградированный режим: без сокращений и GigaChat, ответ ML top-k
+    # с флагом низкой уверенности и отложенной перепроверкой
+    enabled: bool = True
+    # Принудительный режим (normal/degraded); None - по сигналам перегрузки
+    force_mode: Optional[Literal["normal", "degraded"]] = None
+    # Сигналы перегрузки: очередь интерактивных вызовов GigaChat, p95 задержки
+    # стадий LLM за latency_window секунд и отставание event loop
+    max_llm_queue: int = 20
+    max_llm_p95: float = 10.0
+    latency_window: float = 60.0
+    max_loop_lag_ms: float = 200.0
+    loop_probe_interval_ms: float = 100.0
+    # Возврат в normal только после стольких секунд без сигналов перегрузки
+    recovery_seconds: float = 30.0
+    # Фоновая перепроверка деградированных ответов глубоким анализом
+    recheck_enabled: bool = True
+    recheck_queue_size: int = 1000
+    recheck_workers: int = 2
+    recheck_result_ttl: float = 3600.0
+    recheck_max_results: int = 10000
+
+
+class SessionConfig(BaseModel):
+    # Сессии уточняющих вопросов: memory - в памяти процесса,
+    # sqlite - общий файл для нескольких воркеров
+    backend: Literal["memory", "sqlite"] = "memory"
+    sqlite_path: str = "data/sessions.db"
+    # Время жизни сессии (секунд) и максимальное число хранимых сессий
+    ttl: float = 3600.0
+    max_sessions: int = 10000
+
+
+class FeedbackConfig(BaseModel):
+    # Обратная связь: заявки, решенные GigaChat с высокой уверенностью, и
+    # исправления операторов копятся вместе с эмбеддингами для дообучения
+    # логистической головы ML модели
+    enabled: bool = True
+    path: str = "data/feedback.db"
+    max_examples: int = 100000
+    # Ответ GigaChat попадает в выборку, только если уверенность не ниже порога
+    min_confidence: float = 0.9
+    # Период дообучения (секунд); 0 - только через /api/v1/admin/feedback/refit
+    refit_interval: float = 3600.0
+    min_examples: int = 50
+    # Каждый holdout_every-й пример отложен для проверки новой головы; голова
+    # заменяется, только если точность на отложенных примерах не упала
+    holdout_every: int = 5
+    min_holdout: int = 20
+    # Притяжение весов к текущей голове: классы без обратной связи не забываются
+    regularization: float = 0.01
+    correction_weight: float = 3.0
+    max_iter: int = 200
+
+
+class ClassificationLogConfig(BaseModel):
+    # Журнал классификаций для аналитики и воспроизведения трафика: записи
+    # копятся в очереди в памяти и пачками дописываются в сжатые сегменты
+    # фоновой задачей, вне пути запроса
+    enabled: bool = True
+    directory: str = "data/classification_log"
+    # Без текста запись содержит только хеш заявки и не воспроизводится
+    store_text: bool = True
+    # При заполненной очереди записи отбрасываются, а не задерживают ответ
+    queue_size: int = 10000
+    batch_size: int = 500
+    # Пачка дописывается не реже, чем раз в flush_interval секунд
+    flush_interval: float = 1.0
+    # Сегмент закрывается после стольких сжатых байт; хранятся последние max_segments (0 - все)
+    segment_max_bytes: int = 64 * 1024 * 1024
+    max_segments: int = 100
+
+
+class BulkConfig(BaseModel):
+    # Массовая обработка (/analyze-excel): одинаковые и почти одинаковые
+    # заявки группируются, каскад проходит один представитель группы, а его
+    # результат копируется остальным
+    dedup_enabled: bool = True
+    # Косинусная близость эмбеддингов RuBERT к представителю, начиная с
+    # которой заявка с тем же top-1 классом ML модели попадает в его группу
+    similarity_threshold: float = 0.97
+    # Заявок в одном прогоне ML модели при группировке
+    embed_batch_size: int = 64
+    # Представителей групп, проходящих каскад одновременно
+    concurrency: int = 16
+    # Глубокий анализ с пакетным приоритетом (X-Priority: bulk): несколько
+    # заявок в одном запросе GigaChat с общим системным промптом. Заявки
+    # собираются не дольше pack_max_wait_ms после первой; в пакет попадает
+    # столько заявок, сколько помещается в pack_max_request_tokens (и в
+    # token_burst планировщика), но не больше pack_max_tickets
+    packing_enabled: bool = True
+    pack_max_tickets: int = 8
+    pack_max_wait_ms: float = 200.0
+    pack_max_request_tokens: int = 12000
+    # Оценка токенов ответа на одну заявку пакета
+    pack_output_tokens: int = 96
+
+
+class ModelRegistryConfig(BaseModel):
+    # Прогрев загруженной версии модели перед теневой проверкой или заменой
+    warmup_rounds: int = 3
+    # Теневая проверка: доля живых запросов, которые дополнительно проходят
+    # через версию-кандидата, и предел одновременных теневых прогонов
+    shadow_sample_rate: float = 0.1
+    shadow_max_pending: int = 2
+    # Через сколько секунд после замены проверять, что память старой версии освобождена
+    release_check_delay: float = 30.0
+
+
+class ProfilingConfig(BaseModel):
+    # Логировать стек, если event loop не отвечает дольше порога (0 - отключено)
+    loop_block_threshold_ms: float = 100.0
+    # Ограничения admin endpoint'а семплирующего профилировщика
+    max_seconds: float = 60.0
+    min_interval_ms: float = 1.0
+
+
 class CORSConfig(BaseModel):
     origins: str = "http://localhost:3000,http://localhost:8000"
     
@@ -51,11 +326,35 @@ class Settings(BaseSettings):
     )
     
     gigachat_api_key: Optional[str] = None
+    # Адреса API GigaChat (по умолчанию - адреса SDK); для бенчмарков
+    # указывают на локальный mock-сервер benchmarks/mock_gigachat.py
+    gigachat_base_url: Optional[str] = None
+    gigachat_auth_url: Optional[str] = None
     ai_provider: str = "gigachat"
+    # Токен для /api/v1/admin (заголовок X-Admin-Token); без токена endpoints отключены
+    admin_token: Optional[str] = None
     
     debug: bool = False
     cors_origins: str = "http://localhost:3000,http://localhost:8000"
     logging: LoggingConfig = LoggingConfig()
+    ml: MLConfig = MLConfig()
+    inference: InferenceConfig = InferenceConfig()
+    cascade: CascadeConfig = CascadeConfig()
+    type_ahead: TypeAheadConfig = TypeAheadConfig()
+    relevance: RelevanceConfig = RelevanceConfig()
+    zero_shot: ZeroShotConfig = ZeroShotConfig()
+    prompts: PromptConfig = PromptConfig()
+    tracing: TracingConfig = TracingConfig()
+    profiling: ProfilingConfig = ProfilingConfig()
+    llm: LLMSchedulerConfig = LLMSchedulerConfig()
+    structured_output: StructuredOutputConfig = StructuredOutputConfig()
+    resilience: ResilienceConfig = ResilienceConfig()
+    admission: AdmissionConfig = AdmissionConfig()
+    sessions: SessionConfig = SessionConfig()
+    feedback: FeedbackConfig = FeedbackConfig()
+    classification_log: ClassificationLogConfig = ClassificationLogConfig()
+    bulk: BulkConfig = BulkConfig()
+    models: ModelRegistryConfig = ModelRegistryConfig()
     
     @property
     def cors_origins_list(self) -> list[str]:
@@ -0,0 +1,40 @@
+"""
+Дедлайн обработки запроса
+
+Дедлайн хранится в contextvars и виден всем стадиям каскада и клиенту
+GigaChat, включая задачи, созданные внутри запроса. Вложенные области
+могут только сократить оставшееся время.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Область с дедлайном через seconds секунд
+    
+    Args:
+        seconds: Бюджет времени; None - без ограничения (действует внешний дедлайн)
+    """
+    if seconds is None:
+        yield
+        return
+    
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(min(deadline, current) if current is not None else deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Оставшееся время в секундах или None, если дедлайна нет"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
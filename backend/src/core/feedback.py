@@ -0,0 +1,197 @@
+"""
+Хранилище обратной связи для дообучения ML модели
+
+Каждая заявка, которую GigaChat классифицировал с высокой уверенностью, -
+размеченный пример: эмбеддинг RuBERT уже посчитан каскадом, остается
+сохранить его вместе с итоговым классом. Исправления операторов заменяют
+класс примера или добавляют новый. Дообучение логистической головы идет
+по сохраненным эмбеддингам без повторного прогона RuBERT.
+
+Эмбеддинги разных весов RuBERT несовместимы, поэтому у каждого примера
+записан encoder - версия модели, которая его посчитала.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+from src.core.config import FeedbackConfig, settings
+
+
+class FeedbackSource(str, Enum):
+    """Откуда получен класс примера"""
+    DEEP_ANALYSIS = "deep_analysis"
+    FINAL_ANALYSIS = "final_analysis"
+    CORRECTION = "correction"
+
+
+class FeedbackDataset:
+    """Выборка для дообучения"""
+    
+    def __init__(
+        self,
+        ids: np.ndarray,
+        embeddings: np.ndarray,
+        labels: np.ndarray,
+        sources: np.ndarray,
+        updated_at: float
+    ):
+        self.ids = ids
+        self.embeddings = embeddings
+        self.labels = labels
+        self.sources = sources
+        # Время последнего изменения выборки: без изменений дообучать нечего
+        self.updated_at = updated_at
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class FeedbackStore:
+    """Примеры обратной связи в SQLite: общие для воркеров и переживают перезапуск"""
+    
+    def __init__(self, path: Union[str, Path], max_examples: int):
+        self.path = Path(path)
+        self.max_examples = max_examples
+        self._lock = threading.Lock()
+        # База открывается при первом обращении: импорт модуля не трогает диск
+        self._conn: Optional[sqlite3.Connection] = None
+    
+    async def add(
+        self,
+        embedding: np.ndarray,
+        ticket_class: str,
+        source: FeedbackSource,
+        encoder: str,
+        confidence: Optional[float] = None,
+        text: Optional[str] = None
+    ) -> int:
+        """
+        Сохранение примера
+        
+        Args:
+            embedding: Эмбеддинг текста заявки
+            ticket_class: Класс заявки
+            source: Откуда получен класс
+            encoder: Версия модели, посчитавшая эмбеддинг
+            confidence: Уверенность класса
+            text: Текст заявки
+        
+        Returns:
+            Идентификатор примера (для исправления оператором)
+        """
+        return await asyncio.to_thread(self._add, embedding, ticket_class, source, encoder, confidence, text)
+    
+    async def correct(self, example_id: int, ticket_class: str) -> bool:
+        """
+        Исправление класса примера оператором
+        
+        Returns:
+            False, если примера нет (вытеснен или не существовал)
+        """
+        return await asyncio.to_thread(self._correct, example_id, ticket_class)
+    
+    async def dataset(self, encoder: str) -> FeedbackDataset:
+        """Примеры с эмбеддингами версии encoder"""
+        return await asyncio.to_thread(self._dataset, encoder)
+    
+    async def stats(self) -> Dict[str, int]:
+        """Число примеров по источникам"""
+        return await asyncio.to_thread(self._stats)
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение с базой (вызывается под self._lock)"""
+        if self._conn is not None:
+            return self._conn
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT, ticket_class TEXT NOT NULL, "
+                "source TEXT NOT NULL, confidence REAL, embedding BLOB NOT NULL, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, encoder TEXT NOT NULL DEFAULT 'base')"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(feedback)")}
+            if "encoder" not in columns:
+                conn.execute("ALTER TABLE feedback ADD COLUMN encoder TEXT NOT NULL DEFAULT 'base'")
+        self._conn = conn
+        return conn
+    
+    def _add(
+        self,
+        embedding: np.ndarray,
+        ticket_class: str,
+        source: FeedbackSource,
+        encoder: str,
+        confidence: Optional[float],
+        text: Optional[str]
+    ) -> int:
+        now = time.time()
+        embedding = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock, self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO feedback (text, ticket_class, source, confidence, embedding, created_at, updated_at, encoder) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (text, ticket_class, source.value, confidence, embedding, now, now, encoder)
+            )
+            # Исправления операторов ценнее автоматической разметки и не вытесняются
+            conn.execute(
+                "DELETE FROM feedback WHERE id IN ("
+                "SELECT id FROM feedback WHERE source != ? ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                (FeedbackSource.CORRECTION.value, self.max_examples)
+            )
+            return cursor.lastrowid
+    
+    def _correct(self, example_id: int, ticket_class: str) -> bool:
+        with self._lock, self._connection() as conn:
+            cursor = conn.execute(
+                "UPDATE feedback SET ticket_class = ?, source = ?, confidence = 1.0, updated_at = ? WHERE id = ?",
+                (ticket_class, FeedbackSource.CORRECTION.value, time.time(), example_id)
+            )
+            return cursor.rowcount > 0
+    
+    def _dataset(self, encoder: str) -> FeedbackDataset:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, ticket_class, source, embedding, updated_at FROM feedback WHERE encoder = ? ORDER BY id",
+                (encoder,)
+            ).fetchall()
+        if not rows:
+            empty = np.empty(0, dtype=object)
+            return FeedbackDataset(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), empty, empty, 0.0)
+        return FeedbackDataset(
+            ids=np.array([row[0] for row in rows], dtype=np.int64),
+            embeddings=np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows]),
+            labels=np.array([row[1] for row in rows], dtype=object),
+            sources=np.array([row[2] for row in rows], dtype=object),
+            updated_at=max(row[4] for row in rows)
+        )
+    
+    def _stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection().execute("SELECT source, COUNT(*) FROM feedback GROUP BY source").fetchall()
+        return {source: count for source, count in rows}
+
+
+def create_feedback_store(config: Optional[FeedbackConfig] = None) -> Optional[FeedbackStore]:
+    """Хранилище обратной связи по настройкам (None, если сбор отключен)"""
+    config = config or settings.feedback
+    if not config.enabled:
+        return None
+    return FeedbackStore(config.path, config.max_examples)
+
+
+feedback_store = create_feedback_store()
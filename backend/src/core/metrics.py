@@ -0,0 +1,287 @@
+"""Метрики Prometheus для каскада агентов"""
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.core import tracing
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_DURATION = Histogram(
+    "ticket_stage_duration_seconds",
+    "Длительность стадий обработки заявки",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+CASCADE_TERMINAL_STAGE = Counter(
+    "ticket_cascade_terminal_stage_total",
+    "Стадия, на которой завершился каскад",
+    ["stage"],
+)
+
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Токены GigaChat",
+    ["stage", "kind"],
+)
+
+CACHE_EVENTS = Counter(
+    "cache_events_total",
+    "Попадания и промахи кешей",
+    ["cache", "result"],
+)
+
+ERRORS = Counter(
+    "ticket_errors_total",
+    "Ошибки по стадиям обработки",
+    ["stage"],
+)
+
+LLM_QUEUE_DEPTH = Gauge(
+    "llm_queue_depth",
+    "Вызовы GigaChat, ожидающие в очереди планировщика",
+    ["lane"],
+)
+
+LLM_IN_FLIGHT = Gauge(
+    "llm_in_flight",
+    "Выполняющиеся вызовы GigaChat",
+    ["lane"],
+)
+
+LLM_QUEUE_WAIT = Histogram(
+    "llm_queue_wait_seconds",
+    "Ожидание слота GigaChat в очереди планировщика",
+    ["lane"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_RATE_LIMITED = Counter(
+    "llm_rate_limited_total",
+    "Ответы GigaChat 429 (превышение квоты)",
+)
+
+LLM_CIRCUIT_STATE = Gauge(
+    "llm_circuit_state",
+    "Состояние circuit breaker GigaChat (0 - closed, 1 - half-open, 2 - open)",
+)
+
+LLM_CIRCUIT_REJECTED = Counter(
+    "llm_circuit_rejected_total",
+    "Вызовы GigaChat, отклоненные открытым circuit breaker",
+)
+
+LLM_OUTPUT_PARSE = Counter(
+    "llm_output_parse_total",
+    "Разбор структурированных ответов GigaChat: clean - чистый JSON, extracted - JSON внутри текста, "
+    "repaired - после исправления синтаксиса, fallback - без JSON, failed - ответ потерян",
+    ["agent", "result"],
+)
+
+LLM_HEDGED = Counter(
+    "llm_hedged_requests_total",
+    "Хеджированные вызовы GigaChat и чей ответ использован",
+    ["stage", "winner"],
+)
+
+CASCADE_FALLBACKS = Counter(
+    "ticket_cascade_fallback_total",
+    "Заявки, завершенные ответом ML модели из-за недоступности GigaChat",
+    ["reason"],
+)
+
+ANSWER_RECLASSIFICATIONS = Counter(
+    "answer_reclassification_total",
+    "Финальные классификации ML моделью с учетом ответов: resolved - без GigaChat, llm - ниже порога",
+    ["result"],
+)
+
+LLM_CALLS_SAVED = Counter(
+    "llm_calls_saved_total",
+    "Вызовы GigaChat, которые не понадобились",
+    ["stage"],
+)
+
+LLM_SECONDS_SAVED = Counter(
+    "llm_seconds_saved_total",
+    "Оценка сэкономленного времени по медиане задержки стадии",
+    ["stage"],
+)
+
+EVENT_LOOP_BLOCKS = Counter(
+    "event_loop_blocks_total",
+    "Блокировки event loop дольше порога",
+)
+
+SERVICE_MODE = Gauge(
+    "service_degraded",
+    "Режим обслуживания: 1 - деградированный (только ML), 0 - обычный",
+)
+
+SERVICE_MODE_CHANGES = Counter(
+    "service_mode_changes_total",
+    "Переключения режима обслуживания по новому режиму и причине",
+    ["mode", "reason"],
+)
+
+EVENT_LOOP_LAG = Gauge(
+    "event_loop_lag_seconds",
+    "Сглаженное отставание event loop от расписания",
+)
+
+RECHECK_QUEUE_DEPTH = Gauge(
+    "recheck_queue_depth",
+    "Деградированные ответы в очереди фоновой перепроверки",
+)
+
+RECHECK_JOBS = Counter(
+    "recheck_jobs_total",
+    "Задания фоновой перепроверки по исходу",
+    ["status"],
+)
+
+
+FEEDBACK_EXAMPLES = Counter(
+    "feedback_examples_total",
+    "Примеры обратной связи для дообучения ML модели по источнику класса",
+    ["source"],
+)
+
+CLASSIFIER_REFITS = Counter(
+    "classifier_refits_total",
+    "Дообучения головы ML модели: promoted - голова заменена, rejected - точность упала",
+    ["result"],
+)
+
+CLASSIFIER_HOLDOUT_SCORE = Gauge(
+    "classifier_holdout_score",
+    "Метрики текущей и новой головы на отложенных примерах обратной связи при последнем дообучении",
+    ["head", "metric"],
+)
+
+
+ML_MODEL_ACTIVE = Gauge(
+    "ml_model_active",
+    "Активная версия ML модели (1 - обслуживает запросы)",
+    ["version"],
+)
+
+ML_SHADOW_COMPARISONS = Counter(
+    "ml_shadow_comparisons_total",
+    "Теневые прогоны версии-кандидата: agree/disagree - совпал ли top-1 класс, dropped - пропущен из-за очереди",
+    ["result"],
+)
+
+ML_SHADOW_LATENCY = Histogram(
+    "ml_shadow_latency_seconds",
+    "Задержка предсказания активной версии (live) и кандидата (candidate) на одних запросах",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+INFERENCE_REQUESTS = Counter(
+    "inference_remote_requests_total",
+    "Запросы эмбеддингов к серверу инференса: ok, fallback - ошибка и локальный расчет, "
+    "skipped - сервер недавно не ответил, расчет сразу локальный",
+    ["result"],
+)
+
+INFERENCE_BATCH_SIZE = Histogram(
+    "inference_batch_size",
+    "Заявок в пакете сервера инференса (от всех API воркеров)",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+
+ZERO_SHOT_DECISIONS = Counter(
+    "zero_shot_decisions_total",
+    "Решения zero-shot стадии: accepted - заявка классифицирована без GigaChat, иначе причина отказа",
+    ["result"],
+)
+
+ZERO_SHOT_AUDITS = Counter(
+    "zero_shot_audits_total",
+    "Выборочная проверка принятых zero-shot ответов глубоким анализом: agree/disagree/unresolved",
+    ["result"],
+)
+
+
+RELEVANCE_DECISIONS = Counter(
+    "relevance_decisions_total",
+    "Проверка тематики заявки: rejected - отклонена как не относящаяся к IT без вызовов GigaChat",
+    ["result"],
+)
+
+RELEVANCE_HOLDOUT_SCORE = Gauge(
+    "relevance_holdout_score",
+    "Порог и качество модели тематики на отложенных примерах при последнем обучении",
+    ["metric"],
+)
+
+
+CLASSIFICATION_LOG_RECORDS = Counter(
+    "classification_log_records_total",
+    "Записи журнала классификаций: written - записаны, dropped - очередь заполнена, failed - ошибка записи",
+    ["result"],
+)
+
+CLASSIFICATION_LOG_QUEUE = Gauge(
+    "classification_log_queue_depth",
+    "Записи журнала классификаций, ожидающие записи на диск",
+)
+
+
+BULK_ROWS = Counter(
+    "bulk_rows_total",
+    "Заявки массовой обработки: representative - прошли каскад, exact/near - получили результат представителя группы",
+    ["result"],
+)
+
+DEEP_PACKED_TICKETS = Counter(
+    "deep_packed_tickets_total",
+    "Заявки в общих запросах глубокого анализа: resolved - класс из общего ответа, retried - отдельный запрос",
+    ["result"],
+)
+
+DEEP_PACK_SIZE = Histogram(
+    "deep_pack_size",
+    "Заявок в одном общем запросе глубокого анализа",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+
+
+@contextmanager
+def timed_stage(stage: str, **attributes: Any) -> Iterator[tracing.Span]:
+    """
+    Замер стадии: span в трассе запроса и наблюдение в гистограмме
+    
+    Args:
+        stage: Название стадии (метка stage)
+        **attributes: Атрибуты span'а
+    """
+    start = time.perf_counter()
+    try:
+        with tracing.span(stage, **attributes) as span:
+            yield span
+    except Exception:
+        ERRORS.labels(stage=stage).inc()
+        raise
+    finally:
+        STAGE_DURATION.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def record_error(stage: str):
+    """Учет ошибки, перехваченной внутри агента"""
+    ERRORS.labels(stage=stage).inc()
+    span = tracing.current_span()
+    if span is not None and span.error is None:
+        span.error = "handled"
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_EVENTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
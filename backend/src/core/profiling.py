@@ -0,0 +1,158 @@
+"""
+Профилирование рабочего процесса без перезапуска
+
+SamplingProfiler периодически снимает стеки всех потоков (event loop и
+потоки инференса) через sys._current_frames и отдает результат в формате
+collapsed stacks (для flamegraph.pl / speedscope) или speedscope JSON.
+
+LoopBlockWatchdog следит за event loop из отдельного потока и логирует
+стек loop'а, если тот не отвечает дольше порога.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.metrics import EVENT_LOOP_BLOCKS
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_key(frame) -> Tuple[str, str, int]:
+    code = frame.f_code
+    return code.co_name, code.co_filename, code.co_firstlineno
+
+
+def _frame_name(key: Tuple[str, str, int]) -> str:
+    name, filename, line = key
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class SamplingProfiler:
+    """Семплирующий профилировщик всех потоков процесса"""
+    
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: Dict[str, Counter] = {}
+        self.duration = 0.0
+    
+    def run(self, seconds: float):
+        """Сбор стеков в течение seconds секунд (блокирует вызывающий поток)"""
+        own_id = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        start = time.perf_counter()
+        
+        while time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_key(frame))
+                    frame = frame.f_back
+                thread_name = names.get(thread_id, str(thread_id))
+                self.samples.setdefault(thread_name, Counter())[tuple(reversed(stack))] += 1
+            time.sleep(self.interval)
+        
+        self.duration = time.perf_counter() - start
+    
+    def collapsed(self) -> str:
+        """Формат collapsed stacks: «поток;кадр;кадр N»"""
+        lines = []
+        for thread_name, stacks in self.samples.items():
+            for stack, count in stacks.items():
+                frames = ";".join([thread_name.replace(";", "_")] + [_frame_name(key) for key in stack])
+                lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+    
+    def speedscope(self) -> Dict[str, Any]:
+        """Формат speedscope JSON, по профилю на поток"""
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[Tuple[str, str, int], int] = {}
+        profiles = []
+        
+        for thread_name, stacks in self.samples.items():
+            samples, weights = [], []
+            for stack, count in stacks.items():
+                indices = []
+                for key in stack:
+                    if key not in frame_index:
+                        frame_index[key] = len(frames)
+                        frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                    indices.append(frame_index[key])
+                samples.append(indices)
+                weights.append(count * self.interval)
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            })
+        
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"kfu-ticket-classifier pid {os.getpid()}",
+            "exporter": "src.core.profiling",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+class LoopBlockWatchdog:
+    """
+    Обнаружение блокировок event loop.
+    Корутина в loop'е обновляет метку времени; поток-наблюдатель проверяет ее
+    и при задержке больше порога логирует текущий стек потока loop'а -
+    то есть именно тот синхронный вызов, который держит loop.
+    """
+    
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = loop.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+    
+    async def _beat(self):
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+    
+    def _watch(self):
+        reported = False
+        while not self._stop.wait(self.threshold / 4):
+            lag = time.monotonic() - self._heartbeat
+            if lag < self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            
+            # Один отчет на эпизод блокировки
+            reported = True
+            EVENT_LOOP_BLOCKS.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<стек недоступен>"
+            logger.warning(f"Event loop заблокирован более {lag * 1000:.0f} мс:\n{stack}")
@@ -0,0 +1,20 @@
+"""Промпты для GigaChat"""
+
+from .classification import (
+    OUT_OF_SCOPE_CLASS,
+    ClassificationPrompt,
+    ClassificationPromptBuilder,
+    PromptSelection,
+    estimate_tokens,
+)
+from .registry import PromptRegistry, prompt_registry
+
+__all__ = [
+    "OUT_OF_SCOPE_CLASS",
+    "ClassificationPrompt",
+    "ClassificationPromptBuilder",
+    "PromptSelection",
+    "PromptRegistry",
+    "prompt_registry",
+    "estimate_tokens",
+]
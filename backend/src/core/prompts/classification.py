@@ -0,0 +1,183 @@
+"""Разбор промпта классификации и сборка компактного промпта по top-k классам ML модели"""
+import logging
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FENCE = "```"
+
+# Средняя длина токена GigaChat для русского текста (символов)
+CHARS_PER_TOKEN = 3.0
+
+# Строки блока классов, которые не являются классами: подписи полей ввода/вывода
+NON_CLASS_LINES = {"текст заявки", "класс"}
+
+# Класс заявок не по теме IT: не входит в голову ML модели, но по таким
+# примерам обучается модель тематики (см. RelevanceGate)
+OUT_OF_SCOPE_CLASS = "нет классов"
+
+# Названия классов ML модели обучены на тексте после расшифровки аббревиатур
+CLASS_NAME_ALIASES = {
+    "информационная автоматизированная система": "иас",
+    "даннных": "данных",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов промпта"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def normalize_class_name(name: str) -> str:
+    """Нормализация названия класса для сопоставления ML классов и классов промпта"""
+    name = name.lower().replace("ё", "е")
+    for alias, replacement in CLASS_NAME_ALIASES.items():
+        name = name.replace(alias, replacement)
+    return re.sub(r"\s+", " ", name).strip(" *")
+
+
+class ClassificationPrompt:
+    """
+    Структурированный промпт классификации (data/prompts/prompt.txt):
+    правила, список классов в блоке ``` и описание формата ввода/вывода.
+    """
+    
+    def __init__(self, header: str, classes: List[str], footer: str, raw: str, version: Optional[str] = None):
+        self.header = header
+        self.classes = classes
+        self.footer = footer
+        self.raw = raw
+        self.version = version
+        self._index: Dict[str, str] = {normalize_class_name(c): c for c in classes}
+    
+    @classmethod
+    def parse(cls, text: str, version: Optional[str] = None) -> "ClassificationPrompt":
+        """
+        Разбор текста промпта
+        
+        Args:
+            text: Текст промпта
+            version: Хеш версии промпта
+        
+        Returns:
+            ClassificationPrompt; если блок классов не найден, список классов пуст
+        """
+        parts = text.split(FENCE, 2)
+        if len(parts) < 3:
+            logger.warning("В промпте не найден блок со списком классов")
+            return cls(header=text, classes=[], footer="", raw=text, version=version)
+        
+        header, block, footer = parts
+        classes = [line.strip() for line in block.splitlines() if cls._is_class_line(line)]
+        return cls(header=header, classes=classes, footer=footer, raw=text, version=version)
+    
+    @staticmethod
+    def _is_class_line(line: str) -> bool:
+        """Строка блока - название класса, а не подпись, заголовок или инструкция"""
+        line = line.strip()
+        if not line or line.startswith(("*", "#")) or line.endswith(":"):
+            return False
+        return normalize_class_name(line).rstrip(".") not in NON_CLASS_LINES
+    
+    def find_class(self, name: str) -> Optional[str]:
+        """Поиск класса промпта по названию класса ML модели"""
+        return self._index.get(normalize_class_name(name))
+    
+    def render(self, classes: Optional[List[str]] = None) -> str:
+        """
+        Сборка текста промпта
+        
+        Args:
+            classes: Подмножество классов; None - полный промпт
+        
+        Returns:
+            Текст системного промпта
+        """
+        if classes is None or not self.classes:
+            return self.raw
+        block = "\n".join(classes)
+        return f"{self.header}{FENCE}\n{block}\n{FENCE}{self.footer}"
+
+
+class PromptSelection:
+    """Результат сборки промпта"""
+    
+    def __init__(self, text: str, classes: Optional[List[str]], full_tokens: int):
+        self.text = text
+        self.classes = classes
+        self.full_tokens = full_tokens
+        self.tokens = estimate_tokens(text)
+    
+    @property
+    def compact(self) -> bool:
+        return self.classes is not None
+
+
+class ClassificationPromptBuilder:
+    """
+    Сборка системного промпта классификации.
+    В промпт попадают только классы из top-k предсказаний ML модели;
+    при «плоском» распределении вероятностей используется полный промпт.
+    """
+    
+    def __init__(self, top_k: Optional[int] = None, min_coverage: Optional[float] = None):
+        self.top_k = top_k or settings.prompts.top_k
+        self.min_coverage = min_coverage if min_coverage is not None else settings.prompts.min_coverage
+    
+    def build(
+        self,
+        prompt: ClassificationPrompt,
+        candidates: Optional[List[Tuple[str, float]]] = None
+    ) -> PromptSelection:
+        """
+        Сборка промпта
+        
+        Args:
+            prompt: Разобранный промпт классификации
+            candidates: Классы ML модели с вероятностями, по убыванию
+        
+        Returns:
+            PromptSelection с текстом промпта и оценкой токенов
+        """
+        full_tokens = estimate_tokens(prompt.raw)
+        classes = self._select_classes(prompt, candidates)
+        
+        selection = PromptSelection(
+            text=prompt.render(classes),
+            classes=classes,
+            full_tokens=full_tokens
+        )
+        if selection.compact:
+            logger.info(
+                f"Компактный промпт: {len(classes)} классов, "
+                f"~{selection.tokens} токенов вместо ~{full_tokens}"
+            )
+        else:
+            logger.info(f"Полный промпт: ~{full_tokens} токенов")
+        return selection
+    
+    def _select_classes(
+        self,
+        prompt: ClassificationPrompt,
+        candidates: Optional[List[Tuple[str, float]]]
+    ) -> Optional[List[str]]:
+        """Классы промпта для top-k кандидатов или None, если нужен полный промпт"""
+        if not settings.prompts.compact_enabled or not candidates or not prompt.classes:
+            return None
+        
+        selected: List[str] = []
+        coverage = 0.0
+        for name, probability in candidates[:self.top_k]:
+            prompt_class = prompt.find_class(name)
+            if prompt_class and prompt_class not in selected:
+                selected.append(prompt_class)
+                coverage += probability
+        
+        if coverage < self.min_coverage:
+            logger.info(f"Уверенность top-{self.top_k} низкая ({coverage:.2%}), используется полный промпт")
+            return None
+        return selected
@@ -0,0 +1,126 @@
+"""Общий реестр промптов с кешированием в памяти и горячей перезагрузкой по mtime"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.core.config import settings
+from src.core.metrics import record_cache
+
+from .classification import ClassificationPrompt
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = Path(__file__).parent.parent.parent.parent / "data" / "prompts"
+CLASSIFICATION_PROMPT = "prompt.txt"
+
+
+class PromptEntry:
+    """Загруженная версия промпта"""
+    
+    def __init__(self, text: str, mtime_ns: int, size: int):
+        self.text = text
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        self.checked_at = time.monotonic()
+        self._classification: Optional[ClassificationPrompt] = None
+    
+    @property
+    def classification(self) -> ClassificationPrompt:
+        """Промпт, разобранный как промпт классификации (кешируется вместе с версией)"""
+        if self._classification is None:
+            self._classification = ClassificationPrompt.parse(self.text, version=self.version)
+        return self._classification
+
+
+class PromptRegistry:
+    """
+    Реестр промптов из data/prompts.
+    Промпты кешируются в памяти; не чаще раза в reload_interval секунд
+    проверяется mtime файла, и при изменении промпт перечитывается.
+    Новая версия подменяет старую целиком, поэтому читатели всегда видят
+    согласованный текст и его хеш.
+    """
+    
+    def __init__(self, prompts_dir: Path = PROMPTS_DIR, reload_interval: Optional[float] = None):
+        self.prompts_dir = prompts_dir
+        self.reload_interval = (
+            reload_interval if reload_interval is not None else settings.prompts.reload_interval
+        )
+        self._entries: Dict[str, PromptEntry] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, name: str) -> PromptEntry:
+        """
+        Получение актуальной версии промпта
+        
+        Args:
+            name: Имя файла промпта в data/prompts
+        
+        Returns:
+            PromptEntry
+        
+        Raises:
+            OSError: если промпт ни разу не удалось прочитать
+        """
+        entry = self._entries.get(name)
+        if entry is None or time.monotonic() - entry.checked_at >= self.reload_interval:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is None or time.monotonic() - entry.checked_at >= self.reload_interval:
+                    new_entry = self._refresh(name, entry)
+                    record_cache("prompt", hit=new_entry is entry)
+                    return new_entry
+        
+        record_cache("prompt", hit=True)
+        return entry
+    
+    def text(self, name: str, default: Optional[str] = None) -> str:
+        """Текст промпта или default, если файл недоступен"""
+        try:
+            return self.get(name).text
+        except OSError as e:
+            if default is None:
+                raise
+            logger.error(f"Ошибка при загрузке промпта {name}: {e}")
+            return default
+    
+    def classification(self, name: str = CLASSIFICATION_PROMPT) -> ClassificationPrompt:
+        """Разобранный промпт классификации"""
+        return self.get(name).classification
+    
+    def version(self, name: str = CLASSIFICATION_PROMPT) -> str:
+        """Хеш текущей версии промпта (для ключей кешей)"""
+        return self.get(name).version
+    
+    def _refresh(self, name: str, entry: Optional[PromptEntry]) -> PromptEntry:
+        """Проверка mtime и перечитывание промпта (под блокировкой)"""
+        path = self.prompts_dir / name
+        try:
+            stat = os.stat(path)
+            if entry is not None and (stat.st_mtime_ns, stat.st_size) == (entry.mtime_ns, entry.size):
+                entry.checked_at = time.monotonic()
+                return entry
+            
+            text = path.read_text(encoding="utf-8")
+        except OSError:
+            if entry is None:
+                raise
+            logger.error(f"Не удалось перечитать промпт {path}, используется версия {entry.version}")
+            entry.checked_at = time.monotonic()
+            return entry
+        
+        new_entry = PromptEntry(text, stat.st_mtime_ns, stat.st_size)
+        self._entries[name] = new_entry
+        if entry is None:
+            logger.info(f"Промпт загружен из {path} (версия {new_entry.version})")
+        elif new_entry.version != entry.version:
+            logger.info(f"Промпт {path} обновлен: {entry.version} -> {new_entry.version}")
+        return new_entry
+
+
+prompt_registry = PromptRegistry()
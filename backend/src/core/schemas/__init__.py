@@ -1,12 +1,29 @@
 """Schemas для приложения"""
 
-from .ticket import TicketRequest, TicketWithAnswersRequest
-from .analysis import AnalysisResult, WorkTypeMatch, AgentClassificationResult
+from .ticket import TicketRequest, TicketWithAnswersRequest, FeedbackCorrection
+from .analysis import (
+    AnalysisResult,
+    WorkTypeMatch,
+    AgentClassificationResult,
+    ClassProbability,
+    FastClassificationResult,
+    RecheckResult,
+    BulkTicketResult,
+    BulkReport,
+    BulkAnalysisResult,
+)
 
 __all__ = [
     "TicketRequest",
     "TicketWithAnswersRequest",
+    "FeedbackCorrection",
     "AnalysisResult",
     "WorkTypeMatch",
     "AgentClassificationResult",
+    "ClassProbability",
+    "FastClassificationResult",
+    "RecheckResult",
+    "BulkTicketResult",
+    "BulkReport",
+    "BulkAnalysisResult",
 ]
@@ -17,6 +17,20 @@ class AnalysisResult(BaseModel):
     processing_time_ms: int = Field(..., description="Время обработки в мс")
 
 
+class ClassProbability(BaseModel):
+    """Класс из top-k ML модели"""
+    ticket_class: str = Field(..., description="Класс заявки")
+    probability: float = Field(..., ge=0.0, le=1.0, description="Вероятность (0-1)")
+
+
+class FastClassificationResult(BaseModel):
+    """Подсказка класса по набираемому тексту заявки (только ML модель)"""
+    top_classes: List[ClassProbability] = Field(..., description="Top-k классы ML модели (пусто для слишком короткого текста)")
+    prefix: str = Field(..., description="Текст, по которому посчитана подсказка (до последнего законченного слова)")
+    cached: bool = Field(..., description="Эмбеддинг текста взят из кеша")
+    version: Optional[str] = Field(None, description="Версия ML модели")
+
+
 class AgentClassificationResult(BaseModel):
     """Результат классификации через систему агентов"""
     stage: str = Field(..., description="Стадия обработки")
@@ -25,3 +39,48 @@ class AgentClassificationResult(BaseModel):
     questions: Optional[List[str]] = Field(None, description="Вопросы для уточнения (если требуется)")
     processed_text: Optional[str] = Field(None, description="Обработанный текст заявки")
     reasoning: Optional[str] = Field(None, description="Объяснение результата")
+    low_confidence: bool = Field(False, description="Ответ ML модели ниже порога уверенности без проверки GigaChat")
+    top_classes: Optional[List[ClassProbability]] = Field(None, description="Top-k классы ML модели (при low_confidence)")
+    recheck_id: Optional[str] = Field(None, description="Идентификатор отложенной перепроверки (/recheck/{id})")
+    mode: str = Field("normal", description="Режим обслуживания: normal или degraded")
+    session_token: Optional[str] = Field(None, description="Токен сессии для /classify-with-answers (при вопросах)")
+    feedback_id: Optional[int] = Field(None, description="Идентификатор примера обратной связи (для исправления класса оператором)")
+
+
+class RecheckResult(BaseModel):
+    """Результат отложенной перепроверки заявки"""
+    recheck_id: str = Field(..., description="Идентификатор перепроверки")
+    status: str = Field(..., description="pending, done, unresolved или failed")
+    ticket_class: Optional[str] = Field(None, description="Класс по результату глубокого анализа")
+    confidence: Optional[float] = Field(None, ge=0.0, le=1.0, description="Уверенность (0-1)")
+    ml_class: Optional[str] = Field(None, description="Класс, выданный ML моделью")
+    ml_confidence: Optional[float] = Field(None, ge=0.0, le=1.0, description="Уверенность ML модели")
+
+
+class BulkTicketResult(BaseModel):
+    """Результат заявки из файла массовой обработки"""
+    row: int = Field(..., description="Номер строки Excel (строка 1 - заголовок)")
+    text: str = Field(..., description="Текст заявки")
+    cluster_id: int = Field(..., description="Группа одинаковых и почти одинаковых заявок")
+    representative_row: int = Field(..., description="Строка заявки, прошедшей каскад за всю группу")
+    similarity: float = Field(..., description="Косинусная близость к представителю группы (1 - сам представитель или точный повтор)")
+    result: AgentClassificationResult = Field(..., description="Результат классификации представителя группы")
+
+
+class BulkReport(BaseModel):
+    """Сводка массовой обработки"""
+    rows: int = Field(..., description="Заявок в файле")
+    unique_texts: int = Field(..., description="Заявок после удаления точных повторов")
+    clusters: int = Field(..., description="Групп (заявок, прошедших каскад)")
+    llm_calls: int = Field(..., description="Вызовов GigaChat")
+    llm_calls_without_dedup: int = Field(..., description="Оценка вызовов GigaChat при обработке каждой заявки")
+    dedup_time_ms: float = Field(..., description="Время группировки заявок")
+    wall_time_ms: float = Field(..., description="Общее время обработки файла")
+    cascade_time_ms: float = Field(..., description="Суммарное время каскада по представителям")
+    cascade_time_without_dedup_ms: float = Field(..., description="Оценка суммарного времени каскада при обработке каждой заявки")
+
+
+class BulkAnalysisResult(BaseModel):
+    """Результат массовой обработки файла"""
+    items: List[BulkTicketResult] = Field(..., description="Результаты в порядке строк файла")
+    report: BulkReport = Field(..., description="Сводка: группы и сокращение вызовов GigaChat")
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional
 
 
@@ -9,6 +9,26 @@ class TicketRequest(BaseModel):
 
 class TicketWithAnswersRequest(BaseModel):
     """Заявка с ответами на вопросы"""
-    text: str = Field(..., description="Исходный текст заявки (обработанный)")
-    questions: List[str] = Field(..., description="Вопросы, которые были заданы")
+    session_token: Optional[str] = Field(None, description="Токен сессии из ответа /classify")
+    text: Optional[str] = Field(None, description="Исходный текст заявки (обработанный), если нет session_token")
+    questions: Optional[List[str]] = Field(None, description="Вопросы, которые были заданы, если нет session_token")
     answers: List[str] = Field(..., description="Ответы пользователя на вопросы")
+    
+    @model_validator(mode="after")
+    def check_context(self) -> "TicketWithAnswersRequest":
+        if not self.session_token and (self.text is None or self.questions is None):
+            raise ValueError("Нужен session_token или text и questions")
+        return self
+
+
+class FeedbackCorrection(BaseModel):
+    """Исправление класса заявки оператором"""
+    ticket_class: str = Field(..., description="Верный класс заявки")
+    feedback_id: Optional[int] = Field(None, description="feedback_id из ответа /classify")
+    text: Optional[str] = Field(None, description="Текст заявки (обработанный), если нет feedback_id")
+    
+    @model_validator(mode="after")
+    def check_example(self) -> "FeedbackCorrection":
+        if self.feedback_id is None and not self.text:
+            raise ValueError("Нужен feedback_id или text")
+        return self
@@ -0,0 +1,197 @@
+"""
+Серверное состояние диалога уточняющих вопросов
+
+После генерации вопросов каскад сохраняет все, что уже вычислено по
+заявке: обработанный текст, вопросы, эмбеддинг и вероятности ML модели,
+результат глубокого анализа. Клиент получает токен сессии и во втором
+запросе присылает только ответы.
+
+Хранилище ограничено по размеру и времени жизни записей. По умолчанию
+сессии живут в памяти процесса; бэкенд sqlite нужен, когда воркеров
+несколько или сессии должны пережить перезапуск.
+"""
+import asyncio
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.core.config import SessionConfig, settings
+from src.core.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+class TicketSession:
+    """Состояние заявки между генерацией вопросов и ответами пользователя"""
+    
+    def __init__(
+        self,
+        processed_text: str,
+        questions: List[str],
+        ml_class: Optional[str] = None,
+        ml_confidence: Optional[float] = None,
+        top_classes: Optional[List[Tuple[str, float]]] = None,
+        embedding: Optional[np.ndarray] = None,
+        deep_class: Optional[str] = None,
+        deep_confidence: Optional[float] = None,
+        token: Optional[str] = None
+    ):
+        self.token = token or secrets.token_urlsafe(24)
+        self.processed_text = processed_text
+        self.questions = questions
+        self.ml_class = ml_class
+        self.ml_confidence = ml_confidence
+        self.top_classes = top_classes
+        self.embedding = embedding
+        self.deep_class = deep_class
+        self.deep_confidence = deep_confidence
+    
+    def to_dict(self) -> Dict:
+        """Сериализуемые поля (без эмбеддинга)"""
+        return {
+            "processed_text": self.processed_text,
+            "questions": self.questions,
+            "ml_class": self.ml_class,
+            "ml_confidence": self.ml_confidence,
+            "top_classes": self.top_classes,
+            "deep_class": self.deep_class,
+            "deep_confidence": self.deep_confidence
+        }
+    
+    @classmethod
+    def from_dict(cls, token: str, data: Dict, embedding: Optional[np.ndarray] = None) -> "TicketSession":
+        top_classes = data.get("top_classes")
+        return cls(
+            token=token,
+            processed_text=data["processed_text"],
+            questions=data["questions"],
+            ml_class=data.get("ml_class"),
+            ml_confidence=data.get("ml_confidence"),
+            top_classes=[(name, probability) for name, probability in top_classes] if top_classes else None,
+            embedding=embedding,
+            deep_class=data.get("deep_class"),
+            deep_confidence=data.get("deep_confidence")
+        )
+
+
+class InMemorySessionStore:
+    """Сессии в памяти процесса: LRU с ограничением по числу и TTL"""
+    
+    def __init__(self, ttl: float, max_sessions: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Tuple[float, TicketSession]]" = OrderedDict()
+    
+    async def put(self, session: TicketSession):
+        self._sessions[session.token] = (time.monotonic() + self.ttl, session)
+        self._sessions.move_to_end(session.token)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+    
+    async def get(self, token: str) -> Optional[TicketSession]:
+        entry = self._sessions.get(token)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._sessions[token]
+            entry = None
+        elif entry is not None:
+            self._sessions.move_to_end(token)
+        record_cache("session", entry is not None)
+        return entry[1] if entry else None
+    
+    async def delete(self, token: str):
+        self._sessions.pop(token, None)
+    
+    def close(self):
+        self._sessions.clear()
+
+
+class SQLiteSessionStore:
+    """Сессии в SQLite: общие для воркеров и переживают перезапуск"""
+    
+    def __init__(self, path: Union[str, Path], ttl: float, max_sessions: int):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "token TEXT PRIMARY KEY, data TEXT NOT NULL, embedding BLOB, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_created ON sessions (created_at)")
+    
+    async def put(self, session: TicketSession):
+        await asyncio.to_thread(self._put, session)
+    
+    async def get(self, token: str) -> Optional[TicketSession]:
+        session = await asyncio.to_thread(self._get, token)
+        record_cache("session", session is not None)
+        return session
+    
+    async def delete(self, token: str):
+        await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE token = ?", (token,))
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+    
+    def _execute(self, query: str, params: tuple):
+        with self._lock, self._conn:
+            self._conn.execute(query, params)
+    
+    def _put(self, session: TicketSession):
+        now = time.time()
+        embedding = session.embedding.astype(np.float32).tobytes() if session.embedding is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (session.token, json.dumps(session.to_dict(), ensure_ascii=False), embedding, now, now + self.ttl)
+            )
+            self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "DELETE FROM sessions WHERE token IN ("
+                "SELECT token FROM sessions ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            )
+    
+    def _get(self, token: str) -> Optional[TicketSession]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, embedding FROM sessions WHERE token = ? AND expires_at >= ?",
+                (token, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        data, embedding = row
+        return TicketSession.from_dict(
+            token,
+            json.loads(data),
+            np.frombuffer(embedding, dtype=np.float32) if embedding is not None else None
+        )
+
+
+SessionStore = Union[InMemorySessionStore, SQLiteSessionStore]
+
+
+def create_session_store(config: Optional[SessionConfig] = None) -> SessionStore:
+    """Хранилище сессий по настройкам"""
+    config = config or settings.sessions
+    if config.backend == "sqlite":
+        logger.info(f"Сессии уточняющих вопросов хранятся в SQLite: {config.sqlite_path}")
+        return SQLiteSessionStore(config.sqlite_path, config.ttl, config.max_sessions)
+    return InMemorySessionStore(config.ttl, config.max_sessions)
+
+
+session_store = create_session_store()
@@ -0,0 +1,434 @@
+"""
+Структурированные ответы GigaChat
+
+Схема ответа описывается pydantic моделью. По ней строится функция для
+function calling: GigaChat возвращает аргументы функции готовым JSON, и
+разбирать прозу не нужно. Если function calling недоступен или ответ пришел
+текстом, JSON ищется в ответе:
+- clean - ответ целиком JSON (в том числе в блоке ```json);
+- extracted - первый объект, подходящий под схему, внутри текста с прозой;
+- repaired - объект после исправления синтаксиса: висячие запятые,
+  типографские кавычки, ответ, оборванный по max_tokens;
+- fallback - JSON нет, но схема умеет разобрать текст (вопросы построчно);
+- failed - ответ потерян.
+
+Каждый исход учитывается в llm_output_parse_total по агенту: ответ, который
+удалось разобрать локально, не отправляет заявку на следующую стадию
+GigaChat.
+"""
+import json
+import logging
+import re
+import time
+from typing import Any, ClassVar, Dict, Iterable, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+from src.core.clients import GigaChatClient, GigaChatError
+from src.core.config import StructuredOutputConfig, settings
+from src.core.metrics import LLM_OUTPUT_PARSE, timed_stage
+from src.core.prompts.classification import OUT_OF_SCOPE_CLASS
+
+logger = logging.getLogger(__name__)
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+# Ключ без значения в конце оборванного ответа: , "confidence":
+_DANGLING_KEY = re.compile(r',?\s*"(?:[^"\\]|\\.)*"\s*:\s*$')
+# «» не заменяются: ими оформлены названия внутри строк на русском
+_QUOTES = str.maketrans({"“": '"', "”": '"', "„": '"'})
+# Тело ошибки API, которая относится к функциям запроса (function calling)
+_FUNCTIONS_ERROR = re.compile(r"function|функци", re.IGNORECASE)
+
+
+class StructuredOutput(BaseModel):
+    """Ответ GigaChat заданной схемы"""
+    
+    model_config = ConfigDict(populate_by_name=True)
+    
+    FUNCTION_NAME: ClassVar[str]
+    FUNCTION_DESCRIPTION: ClassVar[str]
+    # JSON Schema аргументов функции (подмножество, которое принимает GigaChat)
+    PARAMETERS: ClassVar[Dict[str, Any]]
+    
+    @classmethod
+    def function(cls) -> Dict[str, Any]:
+        """Описание функции для function calling"""
+        return {"name": cls.FUNCTION_NAME, "description": cls.FUNCTION_DESCRIPTION, "parameters": cls.PARAMETERS}
+    
+    @classmethod
+    def fallback(cls, text: str) -> Optional["StructuredOutput"]:
+        """Разбор ответа без JSON (по умолчанию невозможен)"""
+        return None
+
+
+class ClassificationOutput(StructuredOutput):
+    """Класс заявки от глубокого анализа или финальной классификации"""
+    
+    FUNCTION_NAME: ClassVar[str] = "classify_ticket"
+    FUNCTION_DESCRIPTION: ClassVar[str] = "Сохранить класс заявки"
+    PARAMETERS: ClassVar[Dict[str, Any]] = {
+        "type": "object",
+        "properties": {
+            "class": {"type": "string", "description": f"Название класса из списка или '{OUT_OF_SCOPE_CLASS}'"},
+            "confidence": {"type": "number", "description": "Уверенность от 0 до 1"},
+            "reasoning": {"type": "string", "description": "Краткое объяснение выбора"}
+        },
+        "required": ["class", "confidence"]
+    }
+    
+    ticket_class: Optional[str] = Field(..., alias="class")
+    confidence: float = 0.0
+    reasoning: str = ""
+    
+    @field_validator("ticket_class", mode="before")
+    @classmethod
+    def _strip_class(cls, value):
+        if isinstance(value, str):
+            return value.strip() or None
+        return value
+    
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _confidence(cls, value) -> float:
+        # GigaChat иногда пишет "95%" или 95 вместо 0.95
+        if isinstance(value, str):
+            value = value.strip().rstrip("%").replace(",", ".")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return 0.0
+        if value > 1.0:
+            value /= 100.0
+        return min(max(value, 0.0), 1.0)
+    
+    @field_validator("reasoning", mode="before")
+    @classmethod
+    def _reasoning(cls, value) -> str:
+        return value if isinstance(value, str) else ""
+    
+    @classmethod
+    def fallback(cls, text: str) -> Optional["ClassificationOutput"]:
+        if OUT_OF_SCOPE_CLASS in text.lower():
+            return cls(ticket_class=OUT_OF_SCOPE_CLASS, confidence=0.0, reasoning="Класс не определен")
+        return None
+
+
+class PackedClassificationOutput(StructuredOutput):
+    """Классы нескольких заявок из одного запроса (пакетная обработка)"""
+    
+    FUNCTION_NAME: ClassVar[str] = "classify_tickets"
+    FUNCTION_DESCRIPTION: ClassVar[str] = "Сохранить классы заявок"
+    PARAMETERS: ClassVar[Dict[str, Any]] = {
+        "type": "object",
+        "properties": {
+            "results": {
+                "type": "array",
+                "description": "Класс каждой заявки",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "integer", "description": "Номер заявки из запроса"},
+                        **ClassificationOutput.PARAMETERS["properties"]
+                    },
+                    "required": ["id", "class", "confidence"]
+                }
+            }
+        },
+        "required": ["results"]
+    }
+    
+    # Записи проверяются по одной в by_id: испорченная запись не теряет остальные
+    results: List[Dict[str, Any]]
+    
+    @field_validator("results", mode="before")
+    @classmethod
+    def _results(cls, value):
+        if not isinstance(value, list):
+            return value
+        return [item for item in value if isinstance(item, dict)]
+    
+    def by_id(self, ids: Iterable[int]) -> Dict[int, ClassificationOutput]:
+        """
+        Ответы по номерам заявок пакета
+        
+        Записи с чужим или повторным номером, без класса или уверенности и с
+        неразборчивыми полями пропускаются: такие заявки переспрашиваются
+        отдельно.
+        """
+        expected = set(ids)
+        outputs: Dict[int, ClassificationOutput] = {}
+        for item in self.results:
+            try:
+                ticket_id = int(str(item.get("id")).strip("[]# "))
+            except ValueError:
+                continue
+            # Без уверенности запись оборвана (max_tokens)
+            if ticket_id not in expected or ticket_id in outputs or "confidence" not in item:
+                continue
+            try:
+                output = ClassificationOutput.model_validate(item)
+            except ValidationError:
+                continue
+            if output.ticket_class is not None:
+                outputs[ticket_id] = output
+        return outputs
+    
+    @classmethod
+    def fallback(cls, text: str) -> Optional["PackedClassificationOutput"]:
+        # JSON массив или записи подряд без обертки {"results": [...]}
+        items = []
+        for candidate in JsonObjectExtractor().feed(text):
+            for variant in (candidate, _fix_syntax(candidate)):
+                try:
+                    data = json.loads(variant)
+                except ValueError:
+                    continue
+                if isinstance(data, dict) and "id" in data:
+                    items.append(data)
+                break
+        return cls(results=items) if items else None
+
+
+class QuestionsOutput(StructuredOutput):
+    """Уточняющие вопросы к заявке"""
+    
+    FUNCTION_NAME: ClassVar[str] = "ask_questions"
+    FUNCTION_DESCRIPTION: ClassVar[str] = "Задать пользователю уточняющие вопросы по заявке"
+    PARAMETERS: ClassVar[Dict[str, Any]] = {
+        "type": "object",
+        "properties": {
+            "questions": {"type": "array", "items": {"type": "string"}, "description": "Уточняющие вопросы"}
+        },
+        "required": ["questions"]
+    }
+    
+    questions: List[str]
+    
+    @field_validator("questions", mode="before")
+    @classmethod
+    def _questions(cls, value):
+        if not isinstance(value, list):
+            return value
+        return [item.strip() for item in value if isinstance(item, str) and item.strip()]
+    
+    @classmethod
+    def fallback(cls, text: str) -> Optional["QuestionsOutput"]:
+        # Вопросы списком без JSON
+        questions = []
+        for line in text.split("\n"):
+            line = line.strip()
+            if line and "?" in line:
+                # Убираем нумерацию
+                line = line.lstrip("0123456789.-) ")
+                if line:
+                    questions.append(line)
+        return cls(questions=questions) if questions else None
+
+
+T = TypeVar("T", bound=StructuredOutput)
+
+
+class JsonObjectExtractor:
+    """
+    Инкрементальный поиск JSON объектов верхнего уровня в тексте
+    
+    Фрагменты ответа подаются по мере поступления; скобки внутри строк не
+    учитываются. Проза вокруг объектов пропускается.
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self._position = 0
+        # Начало текущего объекта и ожидаемые закрывающие скобки
+        self._start: Optional[int] = None
+        self._closers: List[str] = []
+        self._in_string = False
+        self._string_start = 0
+        self._escape = False
+    
+    def feed(self, text: str) -> List[str]:
+        """Добавление фрагмента; возвращает завершенные объекты (текстом)"""
+        self.buffer += text
+        buffer = self.buffer
+        objects = []
+        for position in range(self._position, len(buffer)):
+            char = buffer[position]
+            if self._start is None:
+                if char == "{":
+                    self._start, self._closers = position, ["}"]
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string, self._string_start = True, position
+            elif char == "{":
+                self._closers.append("}")
+            elif char == "[":
+                self._closers.append("]")
+            elif char in "}]" and char == self._closers[-1]:
+                self._closers.pop()
+                if not self._closers:
+                    objects.append(buffer[self._start:position + 1])
+                    self._start = None
+        self._position = len(buffer)
+        return objects
+    
+    def pending(self) -> Optional[str]:
+        """Незавершенный объект (ответ оборван по max_tokens), достроенный до закрытого"""
+        if self._start is None:
+            return None
+        # Оборванная строка отбрасывается целиком: половина вопроса или
+        # названия класса хуже, чем их отсутствие
+        end = self._string_start if self._in_string else len(self.buffer)
+        text = _DANGLING_KEY.sub("", self.buffer[self._start:end]).rstrip().rstrip(",")
+        return text + "".join(reversed(self._closers))
+
+
+def _fix_syntax(text: str) -> str:
+    """Типографские кавычки и висячие запятые"""
+    return _TRAILING_COMMA.sub(r"\1", text.translate(_QUOTES))
+
+
+def _validate(text: str, schema: Type[T]) -> Optional[T]:
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    try:
+        return schema.model_validate(data)
+    except ValidationError:
+        return None
+
+
+def extract_output(text: str, schema: Type[T]) -> Tuple[Optional[T], str]:
+    """
+    Разбор ответа по схеме без учета в метриках
+    
+    Returns:
+        Tuple[ответ или None, исход: clean, extracted, repaired, fallback или failed]
+    """
+    output = _validate(_FENCE.sub("", text.strip()), schema)
+    if output is not None:
+        return output, "clean"
+    
+    extractor = JsonObjectExtractor()
+    candidates = extractor.feed(text)
+    for candidate in candidates:
+        output = _validate(candidate, schema)
+        if output is not None:
+            return output, "extracted"
+    for candidate in candidates:
+        output = _validate(_fix_syntax(candidate), schema)
+        if output is not None:
+            return output, "repaired"
+    
+    pending = extractor.pending()
+    if pending is not None:
+        output = _validate(_fix_syntax(pending), schema)
+        if output is not None:
+            return output, "repaired"
+    
+    output = schema.fallback(text)
+    if output is not None:
+        return output, "fallback"
+    return None, "failed"
+
+
+def parse_output(text: str, schema: Type[T], agent: str) -> Optional[T]:
+    """
+    Разбор ответа GigaChat по схеме с учетом исхода в метриках
+    
+    Args:
+        text: Ответ GigaChat
+        schema: Схема ответа
+        agent: Агент (метка метрики)
+    
+    Returns:
+        Ответ по схеме или None, если разобрать не удалось
+    """
+    with timed_stage("json_parse", agent=agent):
+        output, result = extract_output(text, schema)
+    LLM_OUTPUT_PARSE.labels(agent=agent, result=result).inc()
+    if output is None:
+        logger.error(f"Не удалось разобрать ответ GigaChat ({agent}): {text[:500]}")
+    elif result != "clean":
+        logger.info(f"Ответ GigaChat ({agent}) разобран не сразу: {result}")
+    return output
+
+
+class FunctionCalling:
+    """Доступность function calling в текущем воркере"""
+    
+    def __init__(self, config: Optional[StructuredOutputConfig] = None):
+        self.config = config or settings.structured_output
+        # До этого момента (monotonic) функции не передаются
+        self._rejected_until = 0.0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.config.function_calling and time.monotonic() >= self._rejected_until
+    
+    @staticmethod
+    def rejects_functions(error: GigaChatError) -> bool:
+        """
+        Ошибка относится к функциям запроса
+        
+        Остальные 400 (например, промпт длиннее лимита токенов) не должны
+        отключать function calling.
+        """
+        return error.status_code in (400, 422) and bool(error.body) and _FUNCTIONS_ERROR.search(error.body) is not None
+    
+    def reject(self, error: GigaChatError):
+        self._rejected_until = time.monotonic() + self.config.function_calling_cooldown
+        logger.warning(
+            f"GigaChat отклонил function calling ({error}: {error.body}), ответы запрашиваются "
+            f"текстом {self.config.function_calling_cooldown:.0f} с"
+        )
+
+
+function_calling = FunctionCalling()
+
+
+async def generate_structured(
+    client: GigaChatClient,
+    schema: Type[T],
+    agent: str,
+    system_prompt: str,
+    user_prompt: str,
+    **kwargs
+) -> Optional[T]:
+    """
+    Запрос к GigaChat с ответом по схеме
+    
+    Args:
+        client: Клиент GigaChat
+        schema: Схема ответа
+        agent: Агент (метка метрики разбора)
+        system_prompt: Системный промпт
+        user_prompt: Запрос пользователя
+        **kwargs: Параметры GigaChatClient.generate_response
+    
+    Returns:
+        Ответ по схеме или None, если разобрать не удалось
+    
+    Raises:
+        GigaChatError: ошибка вызова GigaChat
+    """
+    functions = [schema.function()] if function_calling.enabled else None
+    try:
+        response = await client.generate_response(system_prompt, user_prompt, functions=functions, **kwargs)
+    except GigaChatError as e:
+        if functions is None or not function_calling.rejects_functions(e):
+            raise
+        function_calling.reject(e)
+        response = await client.generate_response(system_prompt, user_prompt, **kwargs)
+    return parse_output(response, schema, agent)
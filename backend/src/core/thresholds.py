@@ -0,0 +1,141 @@
+"""
+Пороги уверенности каскада по классам
+
+Каскад останавливается на стадии ML, если уверенность модели не ниже порога
+предсказанного класса, и на стадии глубокого анализа - если не ниже порога
+класса, который вернул GigaChat. Общие пороги задаются в настройках
+(CASCADE__ML_THRESHOLD, CASCADE__DEEP_THRESHOLD), пороги отдельных классов -
+в JSON файле, который строит python -m benchmarks.cascade tune:
+
+    {"ml": {"default": 0.9, "classes": {"<класс>": 0.8}},
+     "deep": {"default": 0.9, "classes": {}}}
+
+Файл перечитывается при изменении, как промпты в data/prompts.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from src.core.config import CascadeConfig, settings
+
+logger = logging.getLogger(__name__)
+
+
+class CascadeThresholds:
+    """Пороги стадий ML и глубокого анализа: общий и по классам"""
+    
+    def __init__(
+        self,
+        ml_default: float,
+        deep_default: float,
+        ml_classes: Optional[Dict[str, float]] = None,
+        deep_classes: Optional[Dict[str, float]] = None
+    ):
+        self.ml_default = ml_default
+        self.deep_default = deep_default
+        self.ml_classes = ml_classes or {}
+        self.deep_classes = deep_classes or {}
+    
+    def ml(self, ticket_class: Optional[str]) -> float:
+        """Порог стадии ML для предсказанного класса"""
+        return self.ml_classes.get(ticket_class, self.ml_default)
+    
+    def deep(self, ticket_class: Optional[str]) -> float:
+        """Порог стадии глубокого анализа для класса из ответа GigaChat"""
+        return self.deep_classes.get(ticket_class, self.deep_default)
+    
+    def to_dict(self) -> Dict:
+        return {
+            "ml": {"default": self.ml_default, "classes": dict(self.ml_classes)},
+            "deep": {"default": self.deep_default, "classes": dict(self.deep_classes)}
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict, defaults: Optional["CascadeThresholds"] = None) -> "CascadeThresholds":
+        """
+        Пороги из словаря формата to_dict
+        
+        Args:
+            data: Словарь (отсутствующие разделы берутся из defaults)
+            defaults: Пороги по умолчанию (из настроек)
+        """
+        defaults = defaults or cls.from_config()
+        ml, deep = data.get("ml") or {}, data.get("deep") or {}
+        return cls(
+            ml_default=float(ml.get("default", defaults.ml_default)),
+            deep_default=float(deep.get("default", defaults.deep_default)),
+            ml_classes={name: float(value) for name, value in (ml.get("classes") or {}).items()},
+            deep_classes={name: float(value) for name, value in (deep.get("classes") or {}).items()}
+        )
+    
+    @classmethod
+    def from_config(cls, config: Optional[CascadeConfig] = None) -> "CascadeThresholds":
+        """Общие пороги из настроек"""
+        config = config or settings.cascade
+        return cls(config.ml_threshold, config.deep_threshold)
+
+
+class ThresholdRegistry:
+    """
+    Текущие пороги каскада.
+    Не чаще раза в reload_interval секунд проверяется mtime файла порогов;
+    новые пороги подменяют старые целиком. Если файла нет, действуют общие
+    пороги из настроек; если файл не читается, остаются прежние пороги.
+    """
+    
+    def __init__(self, path: Optional[Union[str, Path]] = None, config: Optional[CascadeConfig] = None):
+        self.config = config or settings.cascade
+        path = path if path is not None else self.config.thresholds_path
+        self.path = Path(path) if path else None
+        self._defaults = CascadeThresholds.from_config(self.config)
+        self._thresholds = self._defaults
+        self._mtime_ns: Optional[int] = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def get(self) -> CascadeThresholds:
+        """Актуальные пороги"""
+        if self.path is None:
+            return self._thresholds
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.config.reload_interval:
+            with self._lock:
+                if self._checked_at is None or time.monotonic() - self._checked_at >= self.config.reload_interval:
+                    self._refresh()
+        return self._thresholds
+    
+    def _refresh(self):
+        """Проверка mtime и перечитывание файла (под блокировкой)"""
+        self._checked_at = time.monotonic()
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            if self._mtime_ns is not None:
+                logger.info(f"Файл порогов {self.path} удален, действуют пороги из настроек")
+            self._thresholds, self._mtime_ns = self._defaults, None
+            return
+        except OSError as e:
+            logger.error(f"Не удалось проверить файл порогов {self.path}: {e}")
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+        
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            thresholds = CascadeThresholds.from_dict(data, self._defaults)
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.error(f"Не удалось прочитать пороги из {self.path}, используются прежние: {e}")
+            return
+        
+        self._thresholds, self._mtime_ns = thresholds, mtime_ns
+        logger.info(
+            f"Пороги каскада загружены из {self.path}: ML {thresholds.ml_default:.2f} "
+            f"({len(thresholds.ml_classes)} классов), глубокий анализ {thresholds.deep_default:.2f} "
+            f"({len(thresholds.deep_classes)} классов)"
+        )
+
+
+threshold_registry = ThresholdRegistry()
@@ -0,0 +1,273 @@
+"""
+Легковесная трассировка запросов внутри процесса
+
+Request ID и текущий span передаются через contextvars, поэтому логи и
+span'ы всех агентов одной заявки связаны между собой. Медленные трассы
+хранятся в кольцевом буфере, все трассы можно выгружать в файл в формате
+OTLP JSON (по одной трассе на строку).
+"""
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "kfu-ticket-classifier"
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """Участок обработки заявки: стадия каскада или вызов LLM"""
+    
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        # Позиция в списке span'ов трассы (нижняя граница при записи из потоков)
+        self.index = 0
+        self.start_unix_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self._end: Optional[float] = None
+    
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+    
+    def finish(self):
+        if self._end is None:
+            self._end = time.perf_counter()
+    
+    @property
+    def duration_ms(self) -> float:
+        end = self._end if self._end is not None else time.perf_counter()
+        return (end - self._start) * 1000
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+    
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_unix_ns),
+            "endTimeUnixNano": str(self.start_unix_ns + int(self.duration_ms * 1_000_000)),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """Дерево span'ов одного запроса"""
+    
+    def __init__(self, name: str, request_id: str):
+        self.request_id = request_id
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self.root = self.add_span(name, None, {"request_id": request_id})
+    
+    def add_span(self, name: str, parent: Optional[Span], attributes: Dict[str, Any]) -> Span:
+        span = Span(name, self.trace_id, parent.span_id if parent else None, attributes)
+        span.index = len(self.spans)
+        self.spans.append(span)
+        return span
+    
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+    
+    def stage_durations(self) -> Dict[str, float]:
+        """Суммарная длительность span'ов по именам (для Server-Timing)"""
+        durations: Dict[str, float] = {}
+        for span in self.spans[1:]:
+            durations[span.name] = durations.get(span.name, 0.0) + span.duration_ms
+        return durations
+    
+    def descendants(self, parent: Span) -> List[Span]:
+        """Span'ы поддерева parent без него самого"""
+        ids = {parent.span_id}
+        subtree = []
+        # Дочерний span всегда добавляется после родителя: просматриваются только
+        # span'ы, начатые позже (в пакетной обработке трасса длинная)
+        for span in self.spans[parent.index + 1:]:
+            if span.parent_id in ids:
+                ids.add(span.span_id)
+                subtree.append(span)
+        return subtree
+    
+    def to_dict(self) -> Dict[str, Any]:
+        children: Dict[Optional[str], List[Span]] = {}
+        for span in self.spans:
+            children.setdefault(span.parent_id, []).append(span)
+        
+        def build(span: Span) -> Dict[str, Any]:
+            node = span.to_dict()
+            node["children"] = [build(child) for child in children.get(span.span_id, [])]
+            return node
+        
+        return {
+            "request_id": self.request_id,
+            "trace_id": self.trace_id,
+            "duration_ms": round(self.duration_ms, 3),
+            "root": build(self.root),
+        }
+    
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [span.to_otlp() for span in self.spans],
+                }],
+            }]
+        }
+
+
+class Tracer:
+    """Хранение медленных трасс и экспорт в OTLP JSON"""
+    
+    def __init__(self):
+        self._slow_traces: deque = deque(maxlen=settings.tracing.ring_size)
+        self._lock = threading.Lock()
+        self._export_executor: Optional[ThreadPoolExecutor] = None
+    
+    def start_trace(self, name: str, request_id: Optional[str] = None) -> Trace:
+        """Начало трассы запроса; трасса становится текущей в контексте"""
+        trace = Trace(name, request_id or secrets.token_hex(8))
+        _current_trace.set(trace)
+        _current_span.set(trace.root)
+        return trace
+    
+    def finish_trace(self, trace: Trace):
+        """Завершение трассы: сохранение медленной трассы и экспорт"""
+        trace.root.finish()
+        if trace.duration_ms >= settings.tracing.slow_threshold_ms:
+            with self._lock:
+                self._slow_traces.append(trace)
+            logger.warning(f"Медленный запрос {trace.request_id}: {trace.duration_ms:.0f} мс")
+        
+        if settings.tracing.export_path:
+            if self._export_executor is None:
+                self._export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+            self._export_executor.submit(self._export, json.dumps(trace.to_otlp(), ensure_ascii=False))
+    
+    def recent_slow(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Последние медленные трассы, новые первыми"""
+        with self._lock:
+            traces = list(self._slow_traces)[-limit:]
+        return [trace.to_dict() for trace in reversed(traces)]
+    
+    def _export(self, line: str):
+        try:
+            with open(settings.tracing.export_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.error(f"Ошибка экспорта трассы: {e}")
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Span внутри текущей трассы
+    
+    Вне трассы (например, в CLI-утилитах) span создается, но никуда не записывается.
+    """
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    if trace is not None:
+        current = trace.add_span(name, parent, attributes)
+    else:
+        current = Span(name, "", None, attributes)
+    
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def subtree_usage(parent: Span) -> Tuple[Dict[str, float], Dict[str, Dict[str, int]]]:
+    """
+    Длительности стадий и вызовы GigaChat в поддереве span'а текущей трассы
+    
+    Returns:
+        Tuple[суммарная длительность по именам span'ов (мс),
+        вызовы и токены GigaChat по стадиям]
+    """
+    trace = _current_trace.get()
+    timings: Dict[str, float] = {}
+    llm: Dict[str, Dict[str, int]] = {}
+    for span in trace.descendants(parent) if trace is not None else []:
+        timings[span.name] = round(timings.get(span.name, 0.0) + span.duration_ms, 3)
+        # Вызовы GigaChat отмечены размером промпта
+        if "prompt_chars" in span.attributes:
+            usage = llm.setdefault(span.name, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            usage["calls"] += 1
+            usage["prompt_tokens"] += span.attributes.get("prompt_tokens", 0)
+            usage["completion_tokens"] += span.attributes.get("completion_tokens", 0)
+    return timings, llm
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+class RequestIdLogFilter(logging.Filter):
+    """Добавляет request_id текущей трассы в записи логов"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id() or "-"
+        return True
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+tracer = Tracer()
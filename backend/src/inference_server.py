@@ -0,0 +1,208 @@
+"""
+Сервер инференса RuBERT - один процесс на узел для всех API воркеров
+
+Каждый воркер с собственным RuBERT умножает память модели на число воркеров
+и считает эмбеддинги маленькими пакетами. Сервер держит одну копию модели и
+собирает заявки всех воркеров в общие пакеты: до max_batch_size заявок или
+max_wait_ms ожидания после первой. Пока один пакет проходит RuBERT, следующий
+токенизируется. Воркеры обращаются к нему через InferenceClient
+(INFERENCE__MODE=remote), формат обмена описан в src/core/clients/inference_client.py.
+
+Сервер следит за активной версией модели (versions/ACTIVE) и загружает ее
+после замены через реестр версий. Пока версия загружается, запросы с новой
+версией RuBERT получают 409, и воркеры считают их локально.
+
+Запуск (из каталога backend):
+    python -m src.inference_server                  # адрес из INFERENCE__SOCKET_PATH или INFERENCE__URL
+    INFERENCE__SOCKET_PATH=/run/kfu/inference.sock python -m src.inference_server
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from src.agents.ticket_analyzer import TicketAnalyzerAgent
+from src.core.clients.inference_client import EMBED_PATH, ENCODER_HEADER, decode_texts, encode_embeddings
+from src.core.config import InferenceConfig, settings
+from src.core.metrics import INFERENCE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """Динамический батчинг запросов эмбеддингов от всех воркеров"""
+    
+    # Пакетов в работе одновременно: один в RuBERT, следующий в токенизаторе
+    MAX_BATCHES_IN_FLIGHT = 2
+    
+    def __init__(self, agent: TicketAnalyzerAgent, config: Optional[InferenceConfig] = None):
+        self.agent = agent
+        self.config = config or settings.inference
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.MAX_BATCHES_IN_FLIGHT)
+        self._task: Optional[asyncio.Task] = None
+        self._batches: set = set()
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+    
+    async def embed(self, texts: List[str]) -> Tuple[np.ndarray, str]:
+        """
+        Эмбеддинги текстов в составе общего пакета
+        
+        Returns:
+            Tuple[матрица эмбеддингов, версия RuBERT, которая их посчитала]
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((texts, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        max_wait = self.config.max_wait_ms / 1000
+        while True:
+            items = [await self._queue.get()]
+            count = len(items[0][0])
+            flush_at = loop.time() + max_wait
+            while count < self.config.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    left = flush_at - loop.time()
+                    if left <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), left)
+                    except TimeoutError:
+                        break
+                items.append(item)
+                count += len(item[0])
+            
+            await self._slots.acquire()
+            batch = asyncio.create_task(self._process(items))
+            # Ссылка на задачу, чтобы ее не собрал сборщик мусора
+            self._batches.add(batch)
+            batch.add_done_callback(self._batches.discard)
+    
+    async def _process(self, items: List[Tuple[List[str], asyncio.Future]]):
+        try:
+            # Версия фиксируется на весь пакет, как в TicketAnalyzerAgent.predict
+            version = self.agent.version
+            texts = [text for item_texts, _ in items for text in item_texts]
+            INFERENCE_BATCH_SIZE.observe(len(texts))
+            embeddings = await self.agent.embed(texts, version)
+            offset = 0
+            for item_texts, future in items:
+                if not future.done():
+                    future.set_result((embeddings[offset:offset + len(item_texts)], version.encoder))
+                offset += len(item_texts)
+        except Exception as e:
+            logger.error(f"Ошибка расчета пакета эмбеддингов: {e}", exc_info=True)
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+
+async def _follow_active_version(agent: TicketAnalyzerAgent, interval: float):
+    """Загрузка версии, ставшей активной через реестр версий"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            name = agent.active_version_name()
+            if agent.version is not None and name != agent.version.name:
+                version = await asyncio.to_thread(agent.load_version, name)
+                if version.ready:
+                    agent.set_version(version)
+        except Exception as e:
+            logger.error(f"Не удалось загрузить активную версию модели: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logging.info("Загрузка RuBERT для сервера инференса...")
+    # Сервер всегда считает сам, даже если в окружении INFERENCE__MODE=remote
+    agent = await asyncio.to_thread(TicketAnalyzerAgent, None, False)
+    batcher = EmbeddingBatcher(agent)
+    batcher.start()
+    follower = asyncio.create_task(_follow_active_version(agent, settings.inference.reload_interval))
+    app.state.agent, app.state.batcher = agent, batcher
+    
+    yield
+    
+    follower.cancel()
+    batcher.stop()
+
+
+app = FastAPI(title="KFU Ticket Classifier - RuBERT inference", lifespan=lifespan, docs_url=None, redoc_url=None)
+
+
+@app.post(EMBED_PATH)
+async def embed(request: Request) -> Response:
+    """Эмбеддинги текстов заявок (двоичный формат, см. inference_client)"""
+    agent: TicketAnalyzerAgent = request.app.state.agent
+    version = agent.version
+    if version is None or not version.ready:
+        return Response(status_code=503)
+    
+    encoder = request.headers.get(ENCODER_HEADER)
+    if encoder and encoder != version.encoder:
+        return Response(status_code=409, headers={ENCODER_HEADER: version.encoder})
+    try:
+        texts = decode_texts(await request.body())
+    except ValueError as e:
+        return Response(content=str(e), status_code=400)
+    if not texts:
+        return Response(status_code=400)
+    
+    embeddings, served = await request.app.state.batcher.embed(texts)
+    # Версия сменилась, пока запрос ждал в пакете
+    if encoder and served != encoder:
+        return Response(status_code=409, headers={ENCODER_HEADER: served})
+    return Response(
+        content=encode_embeddings(embeddings),
+        media_type="application/octet-stream",
+        headers={ENCODER_HEADER: served}
+    )
+
+
+@app.get("/health")
+async def health(request: Request):
+    version = request.app.state.agent.version
+    return {
+        "status": "healthy" if version is not None and version.ready else "unavailable",
+        "version": version.name if version else None,
+        "encoder": version.encoder if version else None
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def main():
+    import uvicorn
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    config = settings.inference
+    if config.socket_path:
+        uvicorn.run(app, uds=config.socket_path)
+    else:
+        url = urlparse(config.url)
+        uvicorn.run(app, host=url.hostname or "127.0.0.1", port=url.port or 8100)
+
+
+if __name__ == "__main__":
+    main()
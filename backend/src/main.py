@@ -2,19 +2,32 @@
 KFU IT Ticket Classifier
 Multi-Agent система для классификации заявок в IT-поддержку КФУ
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from src.core.admission import admission_controller
+from src.core.classification_log import classification_log
+from src.core.clients.inference_client import inference_client
 from src.core.config import settings
+from src.core.feedback import feedback_store
+from src.core.profiling import LoopBlockWatchdog
+from src.core.sessions import session_store
+from src.core.tracing import RequestIdLogFilter
 from src.api import api_v1_router
+from src.api.middleware import TracingMiddleware
 
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - [%(request_id)s] %(name)s - %(levelname)s - %(message)s'
 )
+for handler in logging.getLogger().handlers:
+    handler.addFilter(RequestIdLogFilter())
 
 
 @asynccontextmanager
@@ -22,9 +35,24 @@ async def lifespan(app: FastAPI):
     logging.info("Starting KFU IT Ticket Classifier Multi-Agent System...")
     logging.info("Loading ML models and initializing agents...")
     
+    watchdog = None
+    if settings.profiling.loop_block_threshold_ms > 0:
+        watchdog = LoopBlockWatchdog(settings.profiling.loop_block_threshold_ms)
+        watchdog.start(asyncio.get_running_loop())
+    admission_controller.start(asyncio.get_running_loop())
+    classification_log.start(asyncio.get_running_loop())
+    
     yield
     
     logging.info("Shutting down...")
+    admission_controller.stop()
+    await classification_log.close()
+    await inference_client.close()
+    session_store.close()
+    if feedback_store:
+        feedback_store.close()
+    if watchdog:
+        watchdog.stop()
 
 
 app = FastAPI(
@@ -52,7 +80,14 @@ app = FastAPI(
     ## Endpoints
     
     - `/api/v1/classify` - Классификация заявки через систему агентов
+    - `/api/v1/classify/stream` - То же с выдачей результатов стадий по мере готовности (SSE)
     - `/api/v1/classify-with-answers` - Финальная классификация с ответами
+    - `/api/v1/recheck/{id}` - Результат отложенной перепроверки (деградированный режим)
+    - `/metrics` - Метрики Prometheus
+    - `/api/v1/admin/profile` - Семплирующий профиль воркера (X-Admin-Token)
+    - `/api/v1/admin/feedback` - Исправления операторов и дообучение ML модели (X-Admin-Token)
+    - `/api/v1/admin/relevance/refit` - Обучение модели тематики заявок (X-Admin-Token)
+    - `/api/v1/admin/models` - Версии ML модели: загрузка, теневая проверка и замена (X-Admin-Token)
     - `/api/v1/analyze-text` - Старый endpoint (для совместимости)
     """,
     version="2.0.0",
@@ -68,11 +103,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Request-ID"],
 )
+app.add_middleware(TracingMiddleware)
 
 app.include_router(api_v1_router)
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/")
 async def root():
     """Главная страница с информацией о сервисе"""
@@ -95,6 +138,7 @@ async def root():
             "redoc": "/redoc",
             "classify": "/api/v1/classify",
             "classify_with_answers": "/api/v1/classify-with-answers",
+            "metrics": "/metrics",
             "analyze_text": "/api/v1/analyze-text (deprecated)"
         }
     }
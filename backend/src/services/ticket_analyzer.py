@@ -1,19 +1,41 @@
 import asyncio
+import logging
 import time
-from typing import List, Any
+from typing import Dict, List, Optional, Tuple
 from openai import AsyncOpenAI
+import numpy as np
 import pandas as pd
 from io import BytesIO
 
-from src.core.config import settings
-from src.core.schemas import AnalysisResult, WorkTypeMatch
+from src.agents import SystemControlAgent
+from src.core import tracing
+from src.core.config import BulkConfig, settings
+from src.core.clients import Priority, llm_priority
+from src.core.metrics import BULK_ROWS, timed_stage
+from src.core.schemas import (
+    AnalysisResult,
+    WorkTypeMatch,
+    AgentClassificationResult,
+    BulkAnalysisResult,
+    BulkReport,
+    BulkTicketResult,
+)
+from src.utils.near_duplicates import cluster_embeddings, text_key
+
+logger = logging.getLogger(__name__)
+
+# Колонки с текстом заявки (без учета регистра); иначе берется первая
+TEXT_COLUMNS = ['text', 'текст', 'описание', 'заявка', 'description']
 
 
 class TicketAnalyzerService:
     """Сервис для анализа и классификации заявок"""
     
-    def __init__(self):
+    def __init__(self, agent: Optional[SystemControlAgent] = None, config: Optional[BulkConfig] = None):
         self.client = ''
+        # Каскад агентов для массовой обработки
+        self.agent = agent or SystemControlAgent()
+        self.config = config or settings.bulk
     
     # def _init_llm_client(self):
     #     """Инициализация LLM клиента"""
@@ -37,37 +59,169 @@ class TicketAnalyzerService:
             processing_time_ms=processing_time
         )
     
-    async def analyze_excel(self, file_content: bytes) -> List[AnalysisResult]:
-        """Парсинг и анализ Excel файла с заявками"""
+    async def analyze_excel(self, file_content: bytes) -> BulkAnalysisResult:
+        """
+        Парсинг и анализ Excel файла с заявками
+        
+        Одинаковые и почти одинаковые заявки группируются (см. _group): каскад
+        агентов проходит один представитель группы, остальные получают его
+        результат с близостью к нему. Вызовы GigaChat идут в пакетной полосе.
+        
+        Args:
+            file_content: Содержимое xlsx файла
+        
+        Returns:
+            Результаты в порядке строк и сводка: вызовы GigaChat и время
+            каскада в сравнении с оценкой без группировки
+        
+        Raises:
+            ValueError: файл не удалось прочитать
+        """
+        started = time.perf_counter()
+        rows = self._read_rows(file_content)
+        texts = [text for _, text in rows]
+        
+        with timed_stage("bulk_dedup", rows=len(texts)) as dedup:
+            leaders, similarity, unique = await self._group(texts)
+        
+        semaphore = asyncio.Semaphore(self.config.concurrency)
+        
+        async def classify(index: int) -> Tuple[AgentClassificationResult, int, float]:
+            async with semaphore:
+                with tracing.span("bulk_ticket", row=rows[index][0]) as span:
+                    try:
+                        result = await self.agent.process_ticket(texts[index])
+                        output = AgentClassificationResult(**result.to_dict())
+                    except Exception as e:
+                        logger.error(f"Ошибка классификации строки {rows[index][0]}: {e}")
+                        output = AgentClassificationResult(
+                            stage="error",
+                            reasoning=f"Ошибка при классификации заявки: {str(e)}"
+                        )
+                _, llm = tracing.subtree_usage(span)
+                return output, sum(usage["calls"] for usage in llm.values()), span.duration_ms
+        
+        representatives = sorted(set(leaders))
+        # Параллельный анализ представителей; вызовы LLM идут в пакетной полосе
+        with llm_priority(Priority.BULK):
+            outcomes = await asyncio.gather(*(classify(index) for index in representatives))
+        by_leader = dict(zip(representatives, outcomes))
+        cluster_ids = {leader: cluster for cluster, leader in enumerate(representatives)}
+        sizes: Dict[int, int] = {}
+        for leader in leaders:
+            sizes[leader] = sizes.get(leader, 0) + 1
+        
+        items = []
+        for index, (row, text) in enumerate(rows):
+            leader = leaders[index]
+            if leader == index:
+                BULK_ROWS.labels(result="representative").inc()
+            else:
+                BULK_ROWS.labels(result="exact" if similarity[index] >= 1.0 else "near").inc()
+            items.append(BulkTicketResult(
+                row=row,
+                text=text,
+                cluster_id=cluster_ids[leader],
+                representative_row=rows[leader][0],
+                similarity=round(float(similarity[index]), 4),
+                result=by_leader[leader][0]
+            ))
+        
+        report = BulkReport(
+            rows=len(rows),
+            unique_texts=unique,
+            clusters=len(representatives),
+            llm_calls=sum(calls for _, calls, _ in outcomes),
+            llm_calls_without_dedup=sum(by_leader[leader][1] * size for leader, size in sizes.items()),
+            dedup_time_ms=round(dedup.duration_ms, 3),
+            wall_time_ms=round((time.perf_counter() - started) * 1000, 3),
+            cascade_time_ms=round(sum(duration for _, _, duration in outcomes), 3),
+            cascade_time_without_dedup_ms=round(
+                sum(by_leader[leader][2] * size for leader, size in sizes.items()), 3
+            )
+        )
+        logger.info(
+            f"Массовая обработка: {report.rows} заявок, {report.clusters} групп, вызовов GigaChat "
+            f"{report.llm_calls} (без группировки ~{report.llm_calls_without_dedup}), {report.wall_time_ms:.0f} мс"
+        )
+        return BulkAnalysisResult(items=items, report=report)
+    
+    @staticmethod
+    def _read_rows(file_content: bytes) -> List[Tuple[int, str]]:
+        """Непустые заявки из xlsx: (номер строки Excel, текст)"""
         try:
-            # Читаем Excel файл
             df = pd.read_excel(BytesIO(file_content))
-            
-            # Проверяем наличие колонки с текстом заявки
-            text_column = None
-            for col in ['text', 'текст', 'описание', 'заявка', 'description']:
-                if col in df.columns.str.lower():
-                    text_column = col
-                    break
-            
-            if text_column is None:
-                # Используем первую колонку
-                text_column = df.columns[0]
-            
-            # Анализируем каждую строку
-            tasks = []
-            for _, row in df.iterrows():
-                ticket_text = str(row[text_column])
-                if ticket_text and ticket_text.strip():
-                    tasks.append(self.analyze_ticket(ticket_text))
-            
-            # Параллельный анализ всех заявок
-            results = await asyncio.gather(*tasks)
-            return results
-            
         except Exception as e:
-            print(f"Error parsing Excel: {e}")
+            logger.error(f"Ошибка чтения Excel: {e}")
             raise ValueError(f"Ошибка при обработке Excel файла: {str(e)}")
+        if df.columns.empty:
+            raise ValueError("Ошибка при обработке Excel файла: нет колонок")
+        
+        # Проверяем наличие колонки с текстом заявки
+        columns = {str(col).strip().lower(): col for col in df.columns}
+        text_column = next((columns[name] for name in TEXT_COLUMNS if name in columns), df.columns[0])
+        
+        rows = []
+        for position, value in enumerate(df[text_column].tolist()):
+            if pd.isna(value):
+                continue
+            text = str(value).strip()
+            if text:
+                # Строка 1 - заголовок
+                rows.append((position + 2, text))
+        return rows
+    
+    async def _group(self, texts: List[str]) -> Tuple[List[int], np.ndarray, int]:
+        """
+        Группировка заявок перед каскадом
+        
+        Точные повторы (после нормализации регистра, пунктуации и пробелов)
+        объединяются по хешу.
+        Остальные заявки группируются по близости эмбеддингов RuBERT: в
+        группу попадают только заявки с тем же top-1 классом ML модели, чтобы
+        результат представителя не переносился на заявку, которую модель
+        относит к другому классу.
+        
+        Returns:
+            Tuple[индекс представителя группы для каждой заявки,
+            близость к представителю, число заявок без точных повторов]
+        """
+        if not self.config.dedup_enabled:
+            return list(range(len(texts))), np.ones(len(texts), dtype=np.float32), len(texts)
+        
+        first: Dict[str, int] = {}
+        unique: List[int] = []
+        owners = []
+        for index, text in enumerate(texts):
+            key = text_key(text)
+            if key not in first:
+                first[key] = len(unique)
+                unique.append(index)
+            owners.append(first[key])
+        
+        leaders = np.arange(len(unique))
+        similarity = np.ones(len(unique), dtype=np.float32)
+        try:
+            embeddings, classes = [], []
+            size = self.config.embed_batch_size
+            for start in range(0, len(unique), size):
+                chunk = [texts[index] for index in unique[start:start + size]]
+                for prediction in await self.agent.ml_agent.predict(chunk):
+                    embeddings.append(prediction.embedding)
+                    classes.append(prediction.ticket_class)
+            if embeddings:
+                leaders, similarity = await asyncio.to_thread(
+                    cluster_embeddings, np.stack(embeddings), classes, self.config.similarity_threshold
+                )
+        except Exception as e:
+            # Без ML модели остаются только точные повторы
+            logger.warning(f"Группировка почти одинаковых заявок недоступна: {e}")
+        
+        return (
+            [unique[leaders[owner]] for owner in owners],
+            np.array([similarity[owner] for owner in owners], dtype=np.float32),
+            len(unique)
+        )
     
     async def _analyze_text(self, ticket_text: str) -> tuple[bool, List[WorkTypeMatch]]:
         """Анализ текста заявки через LLM"""
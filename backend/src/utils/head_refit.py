@@ -0,0 +1,128 @@
+"""
+Дообучение логистической головы ML модели по эмбеддингам
+
+Исходная обучающая выборка в репозитории не хранится, поэтому голова не
+переобучается с нуля: веса стартуют с текущих и штрафуются за отклонение
+от них (proximal L2). Классы, по которым обратной связи нет, сохраняют
+прежние веса, а классы из обратной связи подстраиваются под новые примеры.
+
+Функции выполняются в отдельном процессе и не импортируют ничего из
+приложения.
+"""
+import copy
+from typing import Dict
+
+import numpy as np
+from scipy.optimize import minimize
+
+
+def refit_head(
+    classifier,
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    sample_weight: np.ndarray,
+    regularization: float,
+    max_iter: int
+):
+    """
+    Новая голова, дообученная на примерах обратной связи
+    
+    Args:
+        classifier: Текущий LogisticRegression (multinomial)
+        embeddings: Эмбеддинги примеров [n, hidden_size]
+        labels: Классы примеров (только из classifier.classes_)
+        sample_weight: Веса примеров
+        regularization: Сила притяжения весов к текущей голове
+        max_iter: Максимум итераций L-BFGS
+    
+    Returns:
+        Копия classifier с новыми coef_ и intercept_
+    """
+    classes = classifier.classes_
+    if classifier.coef_.shape[0] != len(classes):
+        raise ValueError("Дообучение поддерживается только для multinomial головы")
+    
+    index = {name: position for position, name in enumerate(classes)}
+    targets = np.array([index[label] for label in labels])
+    features = np.hstack([embeddings.astype(np.float64), np.ones((len(embeddings), 1))])
+    weights = sample_weight / sample_weight.sum()
+    rows = np.arange(len(targets))
+    initial = np.hstack([classifier.coef_, classifier.intercept_[:, None]])
+    
+    def loss(flat: np.ndarray):
+        params = flat.reshape(initial.shape)
+        logits = features @ params.T
+        logits -= logits.max(axis=1, keepdims=True)
+        log_probs = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+        shift = params - initial
+        
+        value = -(weights * log_probs[rows, targets]).sum() + 0.5 * regularization * (shift ** 2).sum()
+        residual = np.exp(log_probs)
+        residual[rows, targets] -= 1.0
+        gradient = (residual * weights[:, None]).T @ features + regularization * shift
+        return value, gradient.ravel()
+    
+    result = minimize(loss, initial.ravel(), jac=True, method="L-BFGS-B", options={"maxiter": max_iter})
+    params = result.x.reshape(initial.shape)
+    
+    candidate = copy.deepcopy(classifier)
+    candidate.coef_ = params[:, :-1].copy()
+    candidate.intercept_ = params[:, -1].copy()
+    return candidate
+
+
+def evaluate_head(classifier, embeddings: np.ndarray, labels: np.ndarray, thresholds: np.ndarray) -> Dict[str, float]:
+    """
+    Качество головы на отложенных примерах
+    
+    Args:
+        classifier: Голова для проверки
+        embeddings: Эмбеддинги отложенных примеров
+        labels: Их классы
+        thresholds: Пороги уверенности ML стадии каскада по классам classifier.classes_
+    
+    Returns:
+        accuracy - доля верных ответов; ml_resolved - доля примеров, которые
+        каскад завершил бы на ML стадии; ml_resolved_accuracy - точность среди них
+    """
+    probabilities = classifier.predict_proba(embeddings)
+    best = probabilities.argmax(axis=1)
+    predicted = classifier.classes_[best]
+    correct = predicted == labels
+    resolved = probabilities.max(axis=1) >= thresholds[best]
+    return {
+        "accuracy": float(correct.mean()),
+        "ml_resolved": float(resolved.mean()),
+        "ml_resolved_accuracy": float(correct[resolved].mean()) if resolved.any() else 0.0
+    }
+
+
+def refit_and_evaluate(
+    classifier,
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    sample_weight: np.ndarray,
+    holdout: np.ndarray,
+    regularization: float,
+    max_iter: int,
+    thresholds: np.ndarray
+):
+    """
+    Дообучение на части примеров и сравнение с текущей головой на отложенных
+    
+    Args:
+        holdout: Маска отложенных примеров
+        thresholds: Пороги уверенности ML стадии каскада по классам
+    
+    Returns:
+        Tuple[новая голова, {"current": метрики, "candidate": метрики}]
+    """
+    train = ~holdout
+    candidate = refit_head(
+        classifier, embeddings[train], labels[train], sample_weight[train], regularization, max_iter
+    )
+    report = {
+        "current": evaluate_head(classifier, embeddings[holdout], labels[holdout], thresholds),
+        "candidate": evaluate_head(candidate, embeddings[holdout], labels[holdout], thresholds)
+    }
+    return candidate, report
@@ -8,6 +8,9 @@ from transformers import AutoTokenizer, AutoModel
 logger = logging.getLogger(__name__)
 
 HUGGINGFACE_MODEL = "cointegrated/rubert-tiny2"
+BERT_MODEL_DIR = "rubert-tiny2-local"
+FAST_TOKENIZER_FILE = "tokenizer.json"
+LEGACY_TOKENIZER_FILE = "tokenizer_new_dataset.pkl"
 
 
 def download_models(models_dir: Path) -> bool:
@@ -22,21 +25,23 @@ def download_models(models_dir: Path) -> bool:
     """
     try:
         models_dir.mkdir(parents=True, exist_ok=True)
-        bert_model_path = models_dir / "rubert-tiny2-local"
+        bert_model_path = models_dir / BERT_MODEL_DIR
         
         model_file = bert_model_path / "model.safetensors"
-        if bert_model_path.exists() and model_file.exists():
+        tokenizer_file = bert_model_path / FAST_TOKENIZER_FILE
+        if bert_model_path.exists() and model_file.exists() and tokenizer_file.exists():
             logger.info(f"Модель уже загружена: {bert_model_path}")
             return True
         
         logger.info(f"Загрузка {HUGGINGFACE_MODEL} из Hugging Face (это может занять несколько минут)...")
         print(f"[MODEL] Downloading {HUGGINGFACE_MODEL} from Hugging Face...", flush=True)
         
-        tokenizer = AutoTokenizer.from_pretrained(HUGGINGFACE_MODEL)
+        tokenizer = AutoTokenizer.from_pretrained(HUGGINGFACE_MODEL, use_fast=True)
         tokenizer.save_pretrained(str(bert_model_path))
         
-        model = AutoModel.from_pretrained(HUGGINGFACE_MODEL)
-        model.save_pretrained(str(bert_model_path))
+        if not model_file.exists():
+            model = AutoModel.from_pretrained(HUGGINGFACE_MODEL)
+            model.save_pretrained(str(bert_model_path))
         
         logger.info(f"Модель успешно загружена в {bert_model_path}")
         print(f"[MODEL] Successfully downloaded to {bert_model_path}", flush=True)
@@ -58,21 +63,19 @@ def ensure_models_available(models_dir: Path) -> bool:
     Returns:
         bool: True если модели доступны
     """
-    bert_model_path = models_dir / "rubert-tiny2-local"
+    bert_model_path = models_dir / BERT_MODEL_DIR
     classifier_path = models_dir / "logistic_classifier_new_dataset.pkl"
-    tokenizer_path = models_dir / "tokenizer_new_dataset.pkl"
     model_file = bert_model_path / "model.safetensors"
+    tokenizer_file = bert_model_path / FAST_TOKENIZER_FILE
     
-    if not (bert_model_path.exists() and model_file.exists()):
-        logger.info("BERT модель не найдена, начинается загрузка...")
+    if not (bert_model_path.exists() and model_file.exists() and tokenizer_file.exists()):
+        logger.info("BERT модель или быстрый токенизатор не найдены, начинается загрузка...")
         if not download_models(models_dir):
             return False
     
     missing = []
     if not classifier_path.exists():
         missing.append("logistic_classifier_new_dataset.pkl")
-    if not tokenizer_path.exists():
-        missing.append("tokenizer_new_dataset.pkl")
     
     if missing:
         logger.warning(f"Отсутствуют файлы: {', '.join(missing)}")
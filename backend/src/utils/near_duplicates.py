@@ -0,0 +1,89 @@
+"""
+Группировка одинаковых и почти одинаковых заявок
+
+Выгрузки заявок университета содержат много повторов: одну и ту же аварию
+присылают несколько подразделений, заявки копируются с точностью до номера
+аудитории или подписи. Сначала совпадения ищутся по хешу нормализованного
+текста (числа в нем сохраняются: «ошибка 404» и «ошибка 500» - разные
+заявки), затем оставшиеся тексты жадно группируются по косинусной близости
+эмбеддингов: заявка присоединяется к самому близкому представителю группы
+(лидеру) с тем же ключом, если близость не ниже порога, иначе сама
+становится лидером.
+"""
+import hashlib
+import re
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Текст заявки без различий, не влияющих на класс: регистр, ё, пунктуация
+    и пробелы
+    
+    Числа сохраняются: код ошибки или номер системы может менять класс, поэтому
+    заявки, различающиеся только числами, сравниваются по эмбеддингам с
+    проверкой top-1 класса.
+    """
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def text_key(text: str) -> str:
+    """Хеш нормализованного текста: одинаковый у точных повторов"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def cluster_embeddings(
+    embeddings: np.ndarray,
+    keys: Sequence[Hashable],
+    threshold: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Жадная группировка по косинусной близости
+    
+    Args:
+        embeddings: Эмбеддинги текстов [n, hidden_size] в порядке обработки
+        keys: Ключ каждого текста: в одну группу попадают только тексты с
+            одинаковым ключом (например, top-1 класс ML модели)
+        threshold: Минимальная косинусная близость к лидеру группы
+    
+    Returns:
+        Tuple[индекс лидера группы для каждого текста (у лидера - свой),
+        близость к лидеру (у лидера - 1.0)]
+    """
+    count = len(embeddings)
+    leaders = np.arange(count)
+    similarity = np.ones(count, dtype=np.float32)
+    if count == 0:
+        return leaders, similarity
+    
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit = embeddings / np.maximum(norms, 1e-12)
+    # Лидеры по ключам: индексы и их векторы построчно (с запасом по размеру)
+    groups: Dict[Hashable, Tuple[List[int], np.ndarray]] = {}
+    for index in range(count):
+        vector = unit[index]
+        group = groups.get(keys[index])
+        if group is not None:
+            indices, matrix = group
+            scores = matrix[:len(indices)] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= threshold:
+                leaders[index] = indices[best]
+                similarity[index] = scores[best]
+                continue
+        else:
+            indices, matrix = [], np.empty((16, unit.shape[1]), dtype=unit.dtype)
+        
+        if len(indices) == len(matrix):
+            matrix = np.concatenate([matrix, np.empty_like(matrix)])
+        matrix[len(indices)] = vector
+        indices.append(index)
+        groups[keys[index]] = (indices, matrix)
+    return leaders, similarity
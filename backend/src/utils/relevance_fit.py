@@ -0,0 +1,61 @@
+"""
+Обучение модели тематики заявок по эмбеддингам
+
+Бинарная логистическая регрессия: заявка не по теме IT или по теме. Порог
+выбирается на отложенных примерах так, чтобы заявки по теме почти никогда
+не отклонялись: лишний вызов GigaChat дешевле потерянной заявки.
+
+Функции выполняются в отдельном процессе и не импортируют ничего из
+приложения.
+"""
+from typing import Dict
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+
+def fit_relevance(
+    embeddings: np.ndarray,
+    out_of_scope: np.ndarray,
+    sample_weight: np.ndarray,
+    holdout: np.ndarray,
+    regularization: float,
+    max_iter: int,
+    min_probability: float,
+    max_false_reject: float
+):
+    """
+    Модель тематики и порог отклонения
+    
+    Args:
+        embeddings: Эмбеддинги примеров [n, hidden_size]
+        out_of_scope: Маска примеров не по теме
+        sample_weight: Веса примеров
+        holdout: Маска отложенных примеров (для порога и метрик)
+        regularization: Сила L2 регуляризации
+        max_iter: Максимум итераций
+        min_probability: Нижняя граница порога
+        max_false_reject: Допустимая доля отложенных примеров по теме выше порога
+    
+    Returns:
+        Tuple[LogisticRegression, порог вероятности «не по теме», метрики]
+    """
+    train = ~holdout
+    model = LogisticRegression(C=1.0 / regularization, class_weight="balanced", max_iter=max_iter)
+    model.fit(embeddings[train], out_of_scope[train], sample_weight=sample_weight[train])
+    
+    probabilities = model.predict_proba(embeddings[holdout])[:, 1]
+    in_scope = probabilities[~out_of_scope[holdout]]
+    # Порог строго выше квантиля: при max_false_reject=0 - выше всех заявок по теме
+    quantile = float(np.quantile(in_scope, 1.0 - max_false_reject, method="higher"))
+    threshold = max(min_probability, float(np.nextafter(quantile, np.inf)))
+    
+    rejected = probabilities >= threshold
+    holdout_out_of_scope = out_of_scope[holdout]
+    metrics: Dict[str, float] = {
+        "threshold": threshold,
+        # Доля заявок не по теме, которые отклонила бы модель
+        "recall": float(rejected[holdout_out_of_scope].mean()),
+        "false_reject": float(rejected[~holdout_out_of_scope].mean())
+    }
+    return model, threshold, metrics
@@ -0,0 +1,117 @@
+"""
+Миграция с pickle-токенизатора на быстрый токенизатор из директории модели
+
+Проверяет, что быстрый (Rust) токенизатор из rubert-tiny2-local выдает те же
+token ids, что и устаревший tokenizer_new_dataset.pkl.
+
+Запуск:
+    python -m src.utils.tokenizer_migration [--texts file.txt] [--export]
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+import joblib
+from transformers import AutoTokenizer
+
+from .model_downloader import BERT_MODEL_DIR, FAST_TOKENIZER_FILE, LEGACY_TOKENIZER_FILE
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = Path(__file__).parent.parent.parent / "data" / "models"
+MAX_LENGTH = 256
+
+SAMPLE_TEXTS = [
+    "Не работает интернет в аудитории 1105",
+    "Прошу выдать доступ к ИАС Студент для сотрудника кафедры",
+    "Ошибка при входе в Бюджет-СМАРТ: неверный логин или пароль",
+    "Не печатает принтер HP LaserJet, горит красный индикатор",
+    "Необходимо ввести компьютер в домен, ПК новый",
+    "Восстановите пароль от корпоративной почты @kpfu.ru",
+    "ЭЦП не видит токен, ПП Парус выдает ошибку подписи",
+    "Настройте права доступа в edu.kpfu.ru для преподавателя",
+    "",
+    "a" * 2000,
+]
+
+
+def compare_tokenizers(legacy, fast, texts: List[str]) -> List[int]:
+    """
+    Сравнение token ids двух токенизаторов
+    
+    Args:
+        legacy: Токенизатор из pickle-файла
+        fast: Быстрый токенизатор
+        texts: Тексты для проверки
+    
+    Returns:
+        Индексы текстов, для которых token ids различаются
+    """
+    mismatches = []
+    for i, text in enumerate(texts):
+        expected = legacy(text, truncation=True, max_length=MAX_LENGTH)["input_ids"]
+        actual = fast(text, truncation=True, max_length=MAX_LENGTH)["input_ids"]
+        if list(expected) != list(actual):
+            mismatches.append(i)
+    return mismatches
+
+
+def migrate(models_dir: Path, texts: List[str], export: bool = False) -> bool:
+    """
+    Проверка совместимости токенизаторов
+    
+    Args:
+        models_dir: Директория с моделями
+        texts: Тексты для проверки
+        export: Сохранить pickle-токенизатор в директорию модели,
+            если быстрого токенизатора там еще нет
+    
+    Returns:
+        bool: True если токенизаторы совпадают
+    """
+    bert_model_path = models_dir / BERT_MODEL_DIR
+    legacy_path = models_dir / LEGACY_TOKENIZER_FILE
+    
+    try:
+        legacy = joblib.load(str(legacy_path))
+    except Exception as e:
+        logger.error(f"Не удалось загрузить {legacy_path}: {e}")
+        return False
+    
+    if export and not (bert_model_path / FAST_TOKENIZER_FILE).exists():
+        logger.info(f"Экспорт pickle-токенизатора в {bert_model_path}")
+        legacy.save_pretrained(str(bert_model_path))
+    
+    fast = AutoTokenizer.from_pretrained(str(bert_model_path), use_fast=True)
+    if not fast.is_fast:
+        logger.error(f"В {bert_model_path} нет {FAST_TOKENIZER_FILE}, загружен медленный токенизатор")
+        return False
+    
+    mismatches = compare_tokenizers(legacy, fast, texts)
+    for i in mismatches:
+        logger.error(f"Расхождение token ids для текста #{i}: {texts[i][:80]!r}")
+    
+    logger.info(f"Проверено текстов: {len(texts)}, расхождений: {len(mismatches)}")
+    return not mismatches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Проверка миграции на быстрый токенизатор")
+    parser.add_argument("--models-dir", type=Path, default=MODELS_DIR)
+    parser.add_argument("--texts", type=Path, help="Файл с текстами заявок, по одному на строку")
+    parser.add_argument("--export", action="store_true", help="Сохранить pickle-токенизатор в директорию модели")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    
+    texts = list(SAMPLE_TEXTS)
+    if args.texts:
+        texts.extend(args.texts.read_text(encoding="utf-8").splitlines())
+    
+    return 0 if migrate(args.models_dir, texts, export=args.export) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
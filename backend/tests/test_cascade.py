@@ -0,0 +1,61 @@
+import numpy as np
+
+from benchmarks.cascade import CascadeCache, collect_record, collect_zero_shot_agent
+from src.agents.ticket_analyzer import MLPrediction
+from src.agents.zero_shot import ZeroShotAgent
+from src.core.config import ZeroShotConfig, settings
+
+CLASSES = ["Ремонт оргтехники", "Доступ к сети"]
+
+
+class _Version:
+    ready = True
+    name = "v1"
+    encoder = "v1"
+    
+    class classifier:
+        classes_ = np.array(CLASSES, dtype=object)
+
+
+class _MLAgent:
+    remote = False
+    
+    def __init__(self):
+        self.version = _Version()
+    
+    async def predict(self, texts):
+        embedding = np.array([1.0, 0.1], dtype=np.float32)
+        return [MLPrediction(CLASSES[0], 0.9, [(CLASSES[0], 0.9), (CLASSES[1], 0.1)], embedding, "v1")]
+    
+    def embed_sync(self, texts, version):
+        return np.eye(len(texts), 2, dtype=np.float32)
+    
+    async def embed(self, texts, version):
+        return self.embed_sync(texts, version)
+
+
+class _AbbreviationAgent:
+    async def process(self, text):
+        return text
+
+
+class _DeepAgent:
+    async def analyze(self, text, candidates):
+        return None, CLASSES[0], 0.6
+
+
+async def test_default_collect_record_is_accepted_by_tune(monkeypatch):
+    """Кеш, собранный с выключенной zero-shot стадией, годится для ее подбора в tune"""
+    monkeypatch.setattr(
+        ZeroShotAgent, "_class_descriptions", staticmethod(lambda version: (CLASSES, ["принтер", "сеть"]))
+    )
+    monkeypatch.setattr(settings, "zero_shot", ZeroShotConfig())
+    ml_agent = _MLAgent()
+    agents = (_AbbreviationAgent(), ml_agent, collect_zero_shot_agent(ml_agent), _DeepAgent(), None)
+    
+    record = await collect_record(agents, "Не печатает принтер", CLASSES[0], questions=False)
+    assert record["zero_shot"]["ticket_class"] == CLASSES[0]
+    assert record["zero_shot"]["margin"] > 0.5
+    
+    assert CascadeCache([record], zero_shot=ZeroShotConfig(enabled=True)).zero_shot.tolist() == [True]
+    assert CascadeCache([record], zero_shot=ZeroShotConfig(enabled=False)).zero_shot.tolist() == [False]
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from src.core.prompts.classification import ClassificationPrompt
+
+PROMPT = """Правила классификации.
+**Список возможных классов:**
+```
+Ремонт оргтехники  
+Не функционирует
+**Дополнительно:**
+Текст заявки.  
+Класс  
+Закупка ПО (П)
+```
+**Входные данные:**
+Текст заявки: [ТЕКСТ]
+Класс: [КЛАСС]
+"""
+
+
+def test_parse_skips_non_class_lines():
+    """Подписи полей и заголовки в блоке классов не считаются классами"""
+    prompt = ClassificationPrompt.parse(PROMPT)
+    assert prompt.classes == ["Ремонт оргтехники", "Не функционирует", "Закупка ПО (П)"]
+    assert prompt.find_class("класс") is None
+    assert prompt.find_class("закупка по (п)") == "Закупка ПО (П)"
+
+
+def test_parse_shipped_prompt():
+    """В классы промпта из data/prompts не попадают строки формата ввода/вывода"""
+    text = (Path(__file__).parent.parent / "data" / "prompts" / "prompt.txt").read_text(encoding="utf-8")
+    classes = ClassificationPrompt.parse(text).classes
+    assert classes
+    assert "Текст заявки." not in classes
+    assert "Класс" not in classes
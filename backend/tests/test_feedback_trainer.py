@@ -0,0 +1,37 @@
+import asyncio
+
+from src.agents.feedback_trainer import FeedbackTrainer
+from src.core import deadline, tracing
+from src.core.clients.scheduler import Priority, current_priority, llm_priority
+from src.core.config import FeedbackConfig
+
+
+class _NoModel:
+    version = None
+    
+    def __init__(self, models_dir):
+        self.models_dir = models_dir
+
+
+async def test_refit_loop_does_not_inherit_request_context(monkeypatch, tmp_path):
+    """Цикл дообучения, запущенный запросом, не получает его дедлайн, трассу и приоритет"""
+    trainer = FeedbackTrainer(_NoModel(tmp_path), config=FeedbackConfig(refit_interval=0.05))
+    seen = asyncio.get_running_loop().create_future()
+    
+    async def refit(force: bool = False):
+        if not seen.done():
+            seen.set_result((deadline.remaining(), tracing.current_request_id(), current_priority()))
+        return {"status": "skipped"}
+    
+    monkeypatch.setattr(trainer, "refit", refit)
+    tracing.tracer.start_trace("feedback")
+    with deadline.deadline_scope(0.01), llm_priority(Priority.BULK):
+        trainer._ensure_task()
+    
+    try:
+        remaining, trace, priority = await asyncio.wait_for(seen, 2.0)
+    finally:
+        trainer._task.cancel()
+    assert remaining is None
+    assert trace is None
+    assert priority == Priority.INTERACTIVE
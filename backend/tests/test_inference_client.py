@@ -0,0 +1,59 @@
+import struct
+
+import numpy as np
+import pytest
+
+from src.core.clients.inference_client import decode_embeddings, decode_texts, encode_embeddings, encode_texts
+
+
+def test_texts_round_trip():
+    texts = ["Не работает принтер в 305 аудитории", "", "VPN: ошибка 809 — «нет соединения» 🙁"]
+    assert decode_texts(encode_texts(texts)) == texts
+    assert decode_texts(encode_texts([])) == []
+
+
+@pytest.mark.parametrize("body", [
+    b"",
+    b"\x01\x00",
+    encode_texts(["принтер"])[:-1],
+    # Заголовок обещает два текста, в теле один
+    struct.pack("<I", 2) + encode_texts(["принтер"])[4:],
+])
+def test_decode_texts_rejects_truncated_body(body):
+    with pytest.raises(ValueError):
+        decode_texts(body)
+
+
+def test_decode_texts_rejects_trailing_bytes():
+    with pytest.raises(ValueError, match="Лишние байты"):
+        decode_texts(encode_texts(["принтер"]) + b"\x00")
+
+
+def test_decode_texts_rejects_length_overrun():
+    body = struct.pack("<II", 1, 100) + "принтер".encode()
+    with pytest.raises(ValueError, match="за границы"):
+        decode_texts(body)
+
+
+def test_decode_texts_rejects_invalid_utf8():
+    with pytest.raises(ValueError):
+        decode_texts(struct.pack("<II", 1, 2) + b"\xff\xfe")
+
+
+def test_embeddings_round_trip():
+    embeddings = np.arange(12, dtype=np.float32).reshape(3, 4) / 7
+    decoded = decode_embeddings(encode_embeddings(embeddings))
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, embeddings)
+    assert decode_embeddings(encode_embeddings(np.empty((0, 768), dtype=np.float32))).shape == (0, 768)
+
+
+@pytest.mark.parametrize("body", [
+    b"",
+    b"\x02\x00\x00\x00",
+    encode_embeddings(np.ones((2, 4), dtype=np.float32))[:-1],
+    encode_embeddings(np.ones((2, 4), dtype=np.float32)) + b"\x00\x00\x00\x00",
+])
+def test_decode_embeddings_rejects_malformed_body(body):
+    with pytest.raises(ValueError):
+        decode_embeddings(body)
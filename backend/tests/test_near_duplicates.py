@@ -0,0 +1,56 @@
+import numpy as np
+
+from src.agents.ticket_analyzer import MLPrediction
+from src.core.config import BulkConfig
+from src.services.ticket_analyzer import TicketAnalyzerService
+from src.utils.near_duplicates import cluster_embeddings, text_key
+
+
+def test_text_key_ignores_case_and_punctuation_but_not_numbers():
+    assert text_key("Ошибка 404!") == text_key("  ошибка   404")
+    assert text_key("Не работает ёлка") == text_key("не работает елка.")
+    assert text_key("Ошибка 404") != text_key("Ошибка 500")
+
+
+def test_cluster_embeddings_groups_within_key_only():
+    embeddings = np.array([[1.0, 0.0], [0.99, 0.01], [1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+    leaders, similarity = cluster_embeddings(embeddings, ["А", "А", "Б", "А"], threshold=0.97)
+    # Вторая заявка близка к первой, третья - такая же, но с другим ключом
+    assert leaders.tolist() == [0, 0, 2, 3]
+    assert similarity[1] > 0.97
+    assert similarity[2] == 1.0
+
+
+class _MLAgent:
+    def __init__(self, predictions):
+        self.predictions = predictions
+    
+    async def predict(self, texts):
+        return [self.predictions[text] for text in texts]
+
+
+class _Agent:
+    def __init__(self, predictions):
+        self.ml_agent = _MLAgent(predictions)
+
+
+def _prediction(ticket_class: str, embedding) -> MLPrediction:
+    return MLPrediction(ticket_class, 0.5, [(ticket_class, 0.5)], np.array(embedding, dtype=np.float32))
+
+
+async def test_group_does_not_merge_across_top1_classes():
+    """Заявки, которые различаются только числами, объединяются, только если класс ML модели один"""
+    predictions = {
+        "Ошибка 404 на сайте": _prediction("Сайт", [1.0, 0.0]),
+        "Ошибка 500 на сайте": _prediction("Сайт", [1.0, 0.01]),
+        "Ошибка 1С 500 на сайте": _prediction("1С", [1.0, 0.0]),
+    }
+    service = TicketAnalyzerService(_Agent(predictions), BulkConfig(similarity_threshold=0.97))
+    texts = ["Ошибка 404 на сайте", "ошибка 404 на сайте!", "Ошибка 500 на сайте", "Ошибка 1С 500 на сайте"]
+    
+    representatives, similarity, unique = await service._group(texts)
+    assert unique == 3
+    # Точный повтор и близкая заявка того же класса - в группе первой, заявка другого класса - отдельно
+    assert representatives == [0, 0, 0, 3]
+    assert similarity[1] == 1.0
+    assert 0.97 <= similarity[2] < 1.0
@@ -0,0 +1,44 @@
+import asyncio
+
+from src.agents.recheck import RecheckQueue, RecheckStatus
+from src.core import deadline, tracing
+from src.core.admission import admission_controller
+from src.core.config import AdmissionConfig
+
+
+async def _wait_done(queue: RecheckQueue, job_id: str, timeout: float = 2.0):
+    async with asyncio.timeout(timeout):
+        while queue.get(job_id).status == RecheckStatus.PENDING:
+            await asyncio.sleep(0.01)
+    return queue.get(job_id)
+
+
+async def test_recheck_worker_does_not_inherit_request_context(monkeypatch):
+    """Воркер, запущенный первым запросом, не получает его дедлайн и трассу"""
+    monkeypatch.setattr(admission_controller.config, "force_mode", "normal")
+    seen = []
+    
+    async def handler(job):
+        # Перепроверка дольше дедлайна запроса, который поставил ее в очередь
+        await asyncio.sleep(0.1)
+        with deadline.deadline_scope(5.0):
+            seen.append((deadline.remaining(), tracing.current_request_id()))
+            if deadline.remaining() <= 0:
+                return None, None
+        return "Класс", 0.9
+    
+    queue = RecheckQueue(handler, AdmissionConfig(recheck_workers=1))
+    tracing.tracer.start_trace("classify")
+    with deadline.deadline_scope(0.05):
+        job_id = queue.submit("Не работает принтер", "Класс", 0.4)
+    
+    job = await _wait_done(queue, job_id)
+    assert job.status == RecheckStatus.DONE
+    assert job.ticket_class == "Класс"
+    remaining, worker_trace = seen[0]
+    assert remaining > 4.0
+    assert worker_trace is None
+    
+    # Следующие задания тот же воркер тоже обрабатывает с полным дедлайном
+    job = await _wait_done(queue, queue.submit("Нет интернета", None, None))
+    assert job.status == RecheckStatus.DONE
@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from src.core.clients import scheduler as scheduler_module
+from src.core.clients.scheduler import GigaChatScheduler, Priority
+from src.core.config import LLMSchedulerConfig
+
+
+class _Clock:
+    """Подмена модуля time в планировщике: время двигает тест"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self) -> float:
+        return self.now
+    
+    def perf_counter(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(scheduler_module, "time", clock)
+    return clock
+
+
+def _scheduler(**overrides) -> GigaChatScheduler:
+    # Без ограничений скорости, если тест не задал их явно
+    config = {"requests_per_second": 0, "tokens_per_minute": 0, "max_in_flight": 1, "bulk_max_in_flight": 1}
+    config.update(overrides)
+    return GigaChatScheduler(LLMSchedulerConfig(**config))
+
+
+async def _hold(scheduler: GigaChatScheduler, lane: Priority, name: str, granted: list, release: asyncio.Event):
+    async with scheduler.slot(100, lane):
+        granted.append(name)
+        await release.wait()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_interactive_served_before_bulk(clock):
+    scheduler = _scheduler()
+    granted, release = [], asyncio.Event()
+    tasks = [asyncio.create_task(_hold(scheduler, Priority.BULK, "bulk-1", granted, release))]
+    await _settle()
+    tasks.append(asyncio.create_task(_hold(scheduler, Priority.BULK, "bulk-2", granted, release)))
+    await _settle()
+    tasks.append(asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, "interactive", granted, release)))
+    await _settle()
+    assert granted == ["bulk-1"]
+    
+    release.set()
+    await asyncio.gather(*tasks)
+    # Интерактивный вызов пришел позже, но получил слот раньше ждущего bulk
+    assert granted == ["bulk-1", "interactive", "bulk-2"]
+
+
+async def test_bulk_max_in_flight(clock):
+    scheduler = _scheduler(max_in_flight=4, bulk_max_in_flight=2)
+    granted, release = [], asyncio.Event()
+    tasks = [
+        asyncio.create_task(_hold(scheduler, Priority.BULK, f"bulk-{i}", granted, release))
+        for i in range(3)
+    ]
+    await _settle()
+    assert granted == ["bulk-0", "bulk-1"]
+    assert scheduler.queue_depth(Priority.BULK) == 1
+    
+    # Свободные слоты сверх предела bulk остаются интерактивным вызовам
+    tasks.append(asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, "interactive", granted, release)))
+    await _settle()
+    assert granted == ["bulk-0", "bulk-1", "interactive"]
+    assert scheduler.in_flight == 3
+    
+    release.set()
+    await asyncio.gather(*tasks)
+    assert granted[-1] == "bulk-2"
+    assert scheduler.in_flight == 0
+
+
+async def test_rate_limit_pause_holds_dispatch(clock):
+    scheduler = _scheduler()
+    scheduler.rate_limited(retry_after=30.0)
+    assert scheduler.paused
+    granted, release = [], asyncio.Event()
+    release.set()
+    task = asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, "call", granted, release))
+    await _settle()
+    assert granted == []
+    
+    clock.now += 29.0
+    scheduler._dispatch()
+    await _settle()
+    assert granted == []
+    
+    clock.now += 2.0
+    assert not scheduler.paused
+    scheduler._dispatch()
+    await task
+    assert granted == ["call"]
+
+
+async def test_request_rate_bucket_delays_dispatch(clock):
+    scheduler = _scheduler(requests_per_second=1.0, request_burst=1, max_in_flight=4, bulk_max_in_flight=4)
+    granted, release = [], asyncio.Event()
+    release.set()
+    tasks = [asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, f"call-{i}", granted, release)) for i in range(2)]
+    await _settle()
+    assert granted == ["call-0"]
+    
+    clock.now += 1.0
+    scheduler._dispatch()
+    await asyncio.gather(*tasks)
+    assert granted == ["call-0", "call-1"]
+
+
+async def test_cancelled_waiter_releases_granted_slot(clock):
+    scheduler = _scheduler()
+    granted, release = [], asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, "holder", granted, release))
+    await _settle()
+    waiter = asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, "waiter", granted, asyncio.Event()))
+    await _settle()
+    assert scheduler.queue_depth(Priority.INTERACTIVE) == 1
+    
+    release.set()
+    # Держатель освобождает слот, и он сразу выдается ожидающему, который еще не проснулся
+    while scheduler.queue_depth(Priority.INTERACTIVE):
+        await asyncio.sleep(0)
+    assert scheduler.in_flight == 1
+    assert "waiter" not in granted
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await holder
+    
+    assert granted == ["holder"]
+    assert scheduler.in_flight == 0
+    # Слот вернулся: следующий вызов получает его сразу
+    next_release = asyncio.Event()
+    next_release.set()
+    await asyncio.wait_for(_hold(scheduler, Priority.INTERACTIVE, "next", granted, next_release), 1.0)
+    assert granted == ["holder", "next"]
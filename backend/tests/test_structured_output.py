@@ -0,0 +1,114 @@
+import pytest
+
+from src.core import structured_output
+from src.core.clients import GigaChatError
+from src.core.config import StructuredOutputConfig
+from src.core.structured_output import (
+    ClassificationOutput,
+    FunctionCalling,
+    JsonObjectExtractor,
+    PackedClassificationOutput,
+    QuestionsOutput,
+    extract_output,
+    generate_structured,
+)
+
+
+def test_pending_closes_truncated_object():
+    """Ответ, оборванный по max_tokens, достраивается до закрытого объекта"""
+    extractor = JsonObjectExtractor()
+    assert extractor.feed('Ответ: {"class": "Ремонт оргтехники", "confidence": 0.9, "reasoning": "Принтер не печ') == []
+    assert extractor.pending() == '{"class": "Ремонт оргтехники", "confidence": 0.9}'
+
+
+def test_pending_drops_dangling_key_and_closes_arrays():
+    extractor = JsonObjectExtractor()
+    extractor.feed('{"questions": ["Какой принтер?", "В какой аудитории?"], "extra": ')
+    assert extractor.pending() == '{"questions": ["Какой принтер?", "В какой аудитории?"]}'
+    
+    extractor = JsonObjectExtractor()
+    extractor.feed('{"questions": ["Какой принтер?", "Где он')
+    assert extractor.pending() == '{"questions": ["Какой принтер?"]}'
+
+
+def test_pending_without_open_object():
+    extractor = JsonObjectExtractor()
+    assert extractor.feed('текст {"class": "А", "confidence": 1} текст') == ['{"class": "А", "confidence": 1}']
+    assert extractor.pending() is None
+
+
+def test_extract_truncated_output_is_repaired():
+    output, result = extract_output('{"questions": ["Какой принтер?", "Где он', QuestionsOutput)
+    assert result == "repaired"
+    assert output.questions == ["Какой принтер?"]
+
+
+class _Client:
+    """Клиент GigaChat, отклоняющий запросы с функциями заданной ошибкой"""
+    
+    def __init__(self, error: GigaChatError):
+        self.error = error
+        self.calls = []
+    
+    async def generate_response(self, system_prompt, user_prompt, functions=None, **kwargs):
+        self.calls.append(functions)
+        if functions is not None:
+            raise self.error
+        return '{"class": "Ремонт оргтехники", "confidence": 0.9}'
+
+
+@pytest.fixture
+def calling(monkeypatch):
+    calling = FunctionCalling(StructuredOutputConfig(function_calling_cooldown=600.0))
+    monkeypatch.setattr(structured_output, "function_calling", calling)
+    return calling
+
+
+async def test_functions_error_disables_function_calling(calling):
+    client = _Client(GigaChatError("Ошибка GigaChat: HTTP 422", 422, '{"message": "Invalid functions schema"}'))
+    output = await generate_structured(client, ClassificationOutput, "deep", "system", "user")
+    assert output.ticket_class == "Ремонт оргтехники"
+    assert client.calls[1] is None
+    assert not calling.enabled
+
+
+async def test_unrelated_bad_request_keeps_function_calling(calling):
+    """400 не про функции (например, длинный промпт) пробрасывается, функции остаются"""
+    client = _Client(GigaChatError("Ошибка GigaChat: HTTP 400", 400, '{"message": "Prompt is too long"}'))
+    with pytest.raises(GigaChatError):
+        await generate_structured(client, ClassificationOutput, "deep", "system", "user")
+    assert len(client.calls) == 1
+    assert calling.enabled
+
+
+async def test_function_calling_reenabled_after_cooldown(calling, monkeypatch):
+    calling.reject(GigaChatError("Ошибка GigaChat: HTTP 422", 422, "functions are not supported"))
+    assert not calling.enabled
+    now = structured_output.time.monotonic()
+    monkeypatch.setattr(structured_output.time, "monotonic", lambda: now + 601.0)
+    assert calling.enabled
+
+
+def test_packed_by_id_skips_foreign_duplicate_and_broken_entries():
+    """Записи с чужим, повторным или испорченным номером не принимаются"""
+    output = PackedClassificationOutput.model_validate({"results": [
+        {"id": 1, "class": "Ремонт оргтехники", "confidence": 0.9},
+        {"id": 1, "class": "Закупка ПО (П)", "confidence": 0.8},
+        {"id": 7, "class": "Формирование отчетов", "confidence": 0.9},
+        {"id": "[2]", "class": "Оформление ЭЦП", "confidence": "85%"},
+        {"id": 3, "class": "Ошибка подключения"},
+        {"id": "три", "class": "Не функционирует", "confidence": 0.9},
+        {"id": 4, "class": " ", "confidence": 0.9},
+        "не объект",
+    ]})
+    outputs = output.by_id([1, 2, 3, 4])
+    assert sorted(outputs) == [1, 2]
+    assert outputs[1].ticket_class == "Ремонт оргтехники"
+    assert outputs[2].confidence == 0.85
+
+
+def test_packed_fallback_collects_bare_array():
+    text = 'Результат: [{"id": 1, "class": "Ремонт оргтехники", "confidence": 0.9}, {"id": 2, "class": "Закупка ПО (П)",'
+    output, result = extract_output(text, PackedClassificationOutput)
+    assert result == "fallback"
+    assert sorted(output.by_id([1, 2])) == [1]
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from src.agents.ticket_analyzer import MLPrediction
+from src.agents.type_ahead import TypeAheadAgent
+from src.core import deadline, tracing
+from src.core.config import TypeAheadConfig
+
+
+class _Version:
+    ready = True
+    name = "v1"
+    encoder = "v1"
+
+
+class _MLAgent:
+    """ML модель, которая считает эмбеддинг, пока тест не разрешит закончить"""
+    
+    remote = False
+    
+    def __init__(self):
+        self.version = _Version()
+        self.calls = []
+        self.release = threading.Event()
+    
+    def embed_sync(self, texts, version):
+        self.calls.append((texts, deadline.remaining(), tracing.current_trace()))
+        self.release.wait(2.0)
+        return np.ones((len(texts), 4), dtype=np.float32)
+    
+    def classify_embeddings(self, embeddings, version):
+        return [MLPrediction("Ремонт оргтехники", 0.9, [("Ремонт оргтехники", 0.9)], row) for row in embeddings]
+
+
+async def _request(agent: TypeAheadAgent, text: str):
+    # Трасса и дедлайн только у первого запроса
+    tracing.tracer.start_trace("classify_fast")
+    with deadline.deadline_scope(5.0):
+        return await agent.suggest(text)
+
+
+def test_prefix_drops_incomplete_word():
+    agent = TypeAheadAgent(_MLAgent(), TypeAheadConfig())
+    assert agent.prefix("Не работает прин") == "Не работает"
+    assert agent.prefix("Не работает  принтер ") == "Не работает принтер"
+    assert agent.prefix("Принт") == "Принт"
+
+
+async def test_shared_embedding_runs_outside_request_context():
+    """Общий расчет эмбеддинга не наследует трассу и дедлайн запроса, который его начал"""
+    ml_agent = _MLAgent()
+    agent = TypeAheadAgent(ml_agent, TypeAheadConfig())
+    first = asyncio.create_task(_request(agent, "Не работает прин"))
+    await asyncio.sleep(0.05)
+    second = asyncio.create_task(agent.suggest("Не работает принт"))
+    await asyncio.sleep(0.05)
+    ml_agent.release.set()
+    
+    results = await asyncio.gather(first, second)
+    assert [result.prefix for result in results] == ["Не работает", "Не работает"]
+    assert [texts for texts, _, _ in ml_agent.calls] == [["Не работает"]]
+    _, remaining, trace = ml_agent.calls[0]
+    assert remaining is None
+    assert trace is None
+    
+    result = await agent.suggest("Не работает принте")
+    assert result.cached
+    assert result.top_classes == [("Ремонт оргтехники", 0.9)]
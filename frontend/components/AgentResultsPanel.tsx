@@ -33,8 +33,10 @@ export default function AgentResultsPanel({
 
   const getStageLabel = (stage: string) => {
     const labels: Record<string, string> = {
+      'relevance': 'Проверка тематики',
       'abbreviation_convert': 'Обработка аббревиатур',
       'ml_classification': 'ML классификация',
+      'zero_shot': 'Сравнение с описаниями классов',
       'deep_analysis': 'Глубокий анализ',
       'question_generation': 'Требуется уточнение',
       'final_analysis': 'Финальный анализ',